@@ -0,0 +1,5 @@
+"""
+load and latency benchmarks for the rest api
+
+run with `python manage.py benchmark_api --help`
+"""
@@ -0,0 +1,143 @@
+"""
+clients the benchmark scenarios send requests through
+"""
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+class Result:
+    """outcome of one request"""
+    __slots__ = ('status', 'body', 'elapsed', 'queries')
+
+    def __init__(self, status, body, elapsed, queries):
+        self.status = status
+        self.body = body
+        self.elapsed = elapsed
+        self.queries = queries
+
+    def json(self):
+        return json.loads(self.body)
+
+
+# safe to send twice - a repeated write would skew the write scenarios
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+# transaction bookkeeping from atomic() blocks, not work the view asked for
+_SAVEPOINT_SQL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def _count_queries(captured):
+    return sum(
+        1 for query in captured
+        if not query['sql'].startswith(_SAVEPOINT_SQL)
+    )
+
+
+def _encode(data, content_type):
+    if content_type == 'application/json':
+        return json.dumps(data).encode()
+    return data
+
+
+class LocalClient:
+    """in-process django test client - also counts sql queries"""
+    mode = 'local'
+    concurrent = False
+
+    def __init__(self):
+        self._client = Client()
+
+    def request(self, method, path, data=None, content_type='application/json',
+                token=None, params=None):
+        extra = {}
+        if token:
+            extra['HTTP_AUTHORIZATION'] = f'Token {token}'
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        handler = getattr(self._client, method.lower())
+        kwargs = {}
+        if data is not None:
+            kwargs = {
+                'data': _encode(data, content_type),
+                'content_type': content_type,
+            }
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = handler(path, **kwargs, **extra)
+            if response.streaming:
+                body = b''.join(response)
+            else:
+                body = response.content
+            elapsed = time.perf_counter() - start
+        return Result(
+            response.status_code, body, elapsed,
+            _count_queries(queries.captured_queries),
+        )
+
+
+class HttpClient:
+    """
+    plain http against a running server - one keep-alive connection per
+    thread
+    """
+    mode = 'http'
+    concurrent = True
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self._https = parts.scheme == 'https'
+        self._netloc = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._https:
+                cls = http.client.HTTPSConnection
+            else:
+                cls = http.client.HTTPConnection
+            conn = self._local.conn = cls(self._netloc, timeout=30)
+        return conn
+
+    def _send(self, method, url, body, headers):
+        conn = self._connection()
+        conn.request(method, url, body=body, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def request(self, method, path, data=None, content_type='application/json',
+                token=None, params=None):
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        body = None
+        if data is not None:
+            body = _encode(data, content_type)
+            headers['Content-Type'] = content_type
+        url = self._prefix + path
+        if params:
+            url = f'{url}?{urlencode(params)}'
+
+        start = time.perf_counter()
+        try:
+            response, content = self._send(method, url, body, headers)
+        except (http.client.HTTPException, OSError):
+            # server closed the keep-alive connection - retry once on a new
+            # one, unless the request may have reached it and can't repeat
+            self._local.conn = None
+            if method.upper() not in IDEMPOTENT_METHODS:
+                raise
+            response, content = self._send(method, url, body, headers)
+        elapsed = time.perf_counter() - start
+        # query counts are only visible in process
+        return Result(response.status, content, elapsed, None)
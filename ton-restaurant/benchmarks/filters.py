@@ -0,0 +1,105 @@
+"""
+compare tag filter strategies as the number of requested ids grows
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
+
+from core.models import Recipe, Tag
+from recipe.filters import MATCH_ALL, MATCH_ANY, filter_recipes
+from benchmarks.runner import percentile
+
+PAGE = 51
+
+
+def seed_tagged(recipes, tags, tags_per_recipe, rng):
+    """one user with recipes each linked to a random sample of tags"""
+    user = get_user_model().objects.create_user(
+        email=f'bench-filters-{rng.random()}@example.com', password=None,
+    )
+    tag_objs = Tag.objects.bulk_create(
+        [Tag(user=user, name=f'Tag {i}') for i in range(tags)]
+    )
+    if not tag_objs[0].pk:
+        tag_objs = list(Tag.objects.filter(user=user).order_by('id'))
+    Recipe.objects.bulk_create([
+        Recipe(
+            user=user, title=f'Recipe {i}', time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        for i in range(recipes)
+    ])
+    recipe_ids = list(
+        Recipe.objects.filter(user=user).values_list('id', flat=True)
+    )
+    through = Recipe.tags.through
+    through.objects.bulk_create([
+        through(recipe_id=recipe_id, tag_id=tag.pk)
+        for recipe_id in recipe_ids
+        for tag in rng.sample(tag_objs, tags_per_recipe)
+    ], batch_size=5000)
+    return user, [tag.pk for tag in tag_objs]
+
+
+def _filtered(user, ids, match):
+    """what the api runs - join+DISTINCT for any, HAVING COUNT for all"""
+    params = {'tags': ','.join(map(str, ids)), 'match': match}
+    queryset = filter_recipes(Recipe.objects.filter(user=user), params)
+    return queryset.order_by('-id')
+
+
+def _exists(user, ids, match):
+    """any as EXISTS on the through table, no DISTINCT"""
+    return Recipe.objects.filter(
+        Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=ids,
+        )),
+        user=user,
+    ).order_by('-id')
+
+
+def _in_subquery(user, ids, match):
+    """any as id IN (linked recipe ids), no DISTINCT"""
+    linked = Recipe.tags.through.objects.filter(
+        tag_id__in=ids,
+    ).values('recipe_id')
+    return Recipe.objects.filter(user=user, id__in=linked).order_by('-id')
+
+
+STRATEGIES = [
+    ('join_distinct', MATCH_ANY, _filtered),
+    ('exists', MATCH_ANY, _exists),
+    ('in_subquery', MATCH_ANY, _in_subquery),
+    ('having_count', MATCH_ALL, _filtered),
+]
+
+
+def time_query(build, repeats):
+    """latencies in ms of fetching the first page of whole rows"""
+    # whole rows as the list endpoint loads them - DISTINCT compares every
+    # selected column, ids alone would flatter it
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        list(build()[:PAGE])
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+def run(user, tag_ids, id_counts, repeats, rng):
+    """p50/p95 per strategy per number of ids"""
+    results = []
+    for count in id_counts:
+        ids = rng.sample(tag_ids, min(count, len(tag_ids)))
+        for name, match, strategy in STRATEGIES:
+            timings = time_query(lambda: strategy(user, ids, match), repeats)
+            results.append({
+                'strategy': name,
+                'match': match,
+                'ids': len(ids),
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+            })
+    return results
@@ -0,0 +1,83 @@
+"""
+run scenarios and summarise latency, throughput and queries
+"""
+import math
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.scenarios import SCENARIOS, make_rng
+
+
+def percentile(sorted_values, pct):
+    """nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarise(results, wall_time):
+    """latency percentiles in ms, requests/sec and queries per request"""
+    latencies = sorted(r.elapsed * 1000 for r in results)
+    queries = [r.queries for r in results if r.queries is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for r in results if r.status >= 400),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'requests_per_sec': (
+            round(len(results) / wall_time, 2) if wall_time else None
+        ),
+        'queries_per_request': (
+            round(sum(queries) / len(queries), 2) if queries else None
+        ),
+    }
+
+
+def run_scenario(client, name, users, requests, warmup, concurrency,
+                 seed_value):
+    """Warm up, then time `requests` calls spread round robin over users"""
+    scenario = SCENARIOS[name]
+    rng = make_rng(seed_value)
+    for i in range(warmup):
+        scenario(client, users[i % len(users)], rng)
+
+    calls = [users[i % len(users)] for i in range(requests)]
+    start = time.perf_counter()
+    if concurrency > 1 and client.concurrent:
+        def work(user):
+            # own rng per call keeps threads from sharing state
+            return scenario(client, user, make_rng(rng.random()))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(work, calls))
+    else:
+        results = [scenario(client, user, rng) for user in calls]
+    wall_time = time.perf_counter() - start
+    return summarise(results, wall_time)
+
+
+def run(client, users, scenarios, requests, warmup, concurrency, seed_value,
+        meta):
+    """Run every scenario and return the json-ready report"""
+    report = {
+        'meta': dict(
+            meta,
+            mode=client.mode,
+            concurrency=concurrency if client.concurrent else 1,
+            requests_per_scenario=requests,
+            warmup=warmup,
+            seed=seed_value,
+            python=platform.python_version(),
+            started_at=datetime.now(timezone.utc).isoformat(),
+        ),
+        'scenarios': {},
+    }
+    for name in scenarios:
+        report['scenarios'][name] = run_scenario(
+            client, name, users, requests, warmup, concurrency, seed_value,
+        )
+    return report
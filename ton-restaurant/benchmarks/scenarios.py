@@ -0,0 +1,176 @@
+"""
+seed data and the request scenarios measured by the benchmark
+"""
+import io
+import random
+import uuid
+
+from PIL import Image
+
+from django.test.client import encode_multipart
+
+RECIPES_PATH = '/api/recipe/recipes/'
+TAGS_PATH = '/api/recipe/tags/'
+BULK_PATH = '/api/recipe/recipes/bulk/'
+CREATE_USER_PATH = '/api/user/create/'
+TOKEN_PATH = '/api/user/token/'
+PASSWORD = 'bench-pass-123'
+SEED_BATCH = 500
+
+# seed() and token_login log in far faster than the login throttles let
+# through - servers under benchmark run with them off, as settings or env
+THROTTLES_OFF = {'LOGIN_THROTTLE_RATE_IP': '', 'LOGIN_THROTTLE_RATE_EMAIL': ''}
+
+BOUNDARY = 'BenchmarkBoundary'
+MULTIPART = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+class SeedError(Exception):
+    """the api refused a seeding request"""
+
+
+class BenchUser:
+    """a seeded user and what the scenarios need to address their data"""
+    def __init__(self, email, token):
+        self.email = email
+        self.token = token
+        self.recipe_ids = []
+        self.tag_ids = []
+
+
+def _check(result, expected, what):
+    if result.status != expected:
+        raise SeedError(
+            f'{what} returned {result.status}: {result.body[:200]!r}'
+        )
+    return result.json()
+
+
+def seed(client, users, recipes, tags, ingredients, rng):
+    """Create users with recipes, tags and ingredients through the api"""
+    run = uuid.uuid4().hex[:8]
+    tag_names = [f'Tag {i}' for i in range(tags)]
+    ingredient_names = [f'Ingredient {i}' for i in range(ingredients)]
+    seeded = []
+    for u in range(users):
+        email = f'bench-{run}-{u}@example.com'
+        _check(client.request('POST', CREATE_USER_PATH, {
+            'email': email, 'password': PASSWORD, 'name': f'Bench {u}',
+        }), 201, 'create user')
+        token = _check(client.request('POST', TOKEN_PATH, {
+            'email': email, 'password': PASSWORD,
+        }), 200, 'token')['token']
+        user = BenchUser(email, token)
+
+        for start in range(0, recipes, SEED_BATCH):
+            batch = [{
+                'title': f'Recipe {i}',
+                'time_minutes': rng.randint(5, 120),
+                'price': f'{rng.uniform(1, 50):.2f}',
+                'description': 'Benchmark recipe. ' * rng.randint(1, 20),
+                'tags': [
+                    {'name': n} for n in rng.sample(tag_names, min(3, tags))
+                ],
+                'ingredients': [
+                    {'name': n}
+                    for n in rng.sample(ingredient_names, min(5, ingredients))
+                ],
+            } for i in range(start, min(start + SEED_BATCH, recipes))]
+            data = _check(client.request(
+                'POST', BULK_PATH, {'create': batch}, token=token,
+            ), 200, 'bulk create')
+            user.recipe_ids += data['created']
+
+        data = _check(client.request(
+            'GET', TAGS_PATH, token=token, params={'page_size': 500},
+        ), 200, 'list tags')
+        user.tag_ids = [tag['id'] for tag in data['results']]
+        seeded.append(user)
+    return seeded
+
+
+def _jpeg_upload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), (200, 120, 40)).save(buffer, format='JPEG')
+    buffer.seek(0)
+    buffer.name = 'bench.jpg'
+    return encode_multipart(BOUNDARY, {'image': buffer})
+
+
+def scenario_list(client, user, rng):
+    return client.request('GET', RECIPES_PATH, token=user.token)
+
+
+def scenario_filter(client, user, rng):
+    tag_ids = rng.sample(user.tag_ids, min(2, len(user.tag_ids)))
+    return client.request('GET', RECIPES_PATH, token=user.token, params={
+        'tags': ','.join(map(str, tag_ids)),
+    })
+
+
+def scenario_filter_all(client, user, rng):
+    tag_ids = rng.sample(user.tag_ids, min(2, len(user.tag_ids)))
+    return client.request('GET', RECIPES_PATH, token=user.token, params={
+        'tags': ','.join(map(str, tag_ids)), 'match': 'all',
+    })
+
+
+def scenario_detail(client, user, rng):
+    recipe_id = rng.choice(user.recipe_ids)
+    return client.request(
+        'GET', f'{RECIPES_PATH}{recipe_id}/', token=user.token,
+    )
+
+
+def scenario_create(client, user, rng):
+    return client.request('POST', RECIPES_PATH, {
+        'title': 'Benchmark create',
+        'time_minutes': 10,
+        'price': '4.50',
+        'tags': [{'name': 'Tag 0'}, {'name': 'Bench new'}],
+        'ingredients': [{'name': 'Ingredient 0'}],
+    }, token=user.token)
+
+
+def scenario_update(client, user, rng):
+    recipe_id = rng.choice(user.recipe_ids)
+    return client.request('PATCH', f'{RECIPES_PATH}{recipe_id}/', {
+        'title': f'Updated {rng.randint(0, 1000)}',
+        'tags': [{'name': 'Tag 1'}],
+    }, token=user.token)
+
+
+_UPLOAD_BODY = None
+
+
+def scenario_upload_image(client, user, rng):
+    global _UPLOAD_BODY
+    if _UPLOAD_BODY is None:
+        _UPLOAD_BODY = _jpeg_upload()
+    recipe_id = rng.choice(user.recipe_ids)
+    return client.request(
+        'POST', f'{RECIPES_PATH}{recipe_id}/upload_image/',
+        _UPLOAD_BODY, content_type=MULTIPART, token=user.token,
+    )
+
+
+def scenario_token_login(client, user, rng):
+    return client.request('POST', TOKEN_PATH, {
+        'email': user.email, 'password': PASSWORD,
+    })
+
+
+SCENARIOS = {
+    'list': scenario_list,
+    'filter': scenario_filter,
+    'filter_all': scenario_filter_all,
+    'detail': scenario_detail,
+    'create': scenario_create,
+    'update': scenario_update,
+    'upload_image': scenario_upload_image,
+    'token_login': scenario_token_login,
+}
+
+
+def make_rng(seed_value):
+    return random.Random(seed_value)
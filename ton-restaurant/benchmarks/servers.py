@@ -0,0 +1,118 @@
+"""
+real servers started in a subprocess, so the benchmark scenarios can be run
+against the dev server and the production gunicorn profile alike
+"""
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+
+from benchmarks.scenarios import THROTTLES_OFF
+
+# command (after the python executable) and env for each server, the bind
+# address is filled in per run
+SERVERS = {
+    'runserver': (['manage.py', 'runserver', '--noreload', '{bind}'], {}),
+    'gunicorn': (
+        ['-m', 'gunicorn', '-c', 'python:ton_restaurant.gunicorn_conf'],
+        {'WEB_WORKER_CLASS': 'gthread'},
+    ),
+    'gunicorn-sync': (
+        ['-m', 'gunicorn', '-c', 'python:ton_restaurant.gunicorn_conf'],
+        {'WEB_WORKER_CLASS': 'sync'},
+    ),
+    'uvicorn': (
+        ['-m', 'gunicorn', '-c', 'python:ton_restaurant.gunicorn_conf'],
+        {'WEB_WORKER_CLASS': 'uvicorn'},
+    ),
+}
+
+
+class ServerError(Exception):
+    """the server exited or never answered"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """context manager running one of SERVERS on a free local port"""
+
+    def __init__(self, name, env=None, startup_timeout=30):
+        self.name = name
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self._env = env or {}
+        self._startup_timeout = startup_timeout
+        self._process = None
+        self._log = None
+
+    def _command(self):
+        args, env = SERVERS[self.name]
+        bind = f'127.0.0.1:{self.port}'
+        env = dict(
+            os.environ, WEB_BIND=bind, **THROTTLES_OFF, **env, **self._env,
+        )
+        return [sys.executable] + [a.format(bind=bind) for a in args], env
+
+    def output(self):
+        """what the server has logged so far"""
+        self._log.seek(0)
+        return self._log.read().decode(errors='replace')
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self._startup_timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise ServerError(
+                    f'{self.name} exited with {self._process.returncode}:\n'
+                    f'{self.output()[-2000:]}'
+                )
+            conn = http.client.HTTPConnection(
+                '127.0.0.1', self.port, timeout=2,
+            )
+            try:
+                conn.request('GET', settings.HEALTH_READY_PATH)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    return
+            except OSError:
+                pass
+            finally:
+                conn.close()
+            time.sleep(0.2)
+        raise ServerError(
+            f'{self.name} not answering after {self._startup_timeout}s'
+        )
+
+    def __enter__(self):
+        command, env = self._command()
+        self._log = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env,
+            stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        try:
+            self._wait_ready()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._log.close()
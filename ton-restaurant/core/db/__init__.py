@@ -0,0 +1,4 @@
+"""
+database helpers - connection metrics and the postgres backend with
+health checked persistent connections
+"""
@@ -0,0 +1,51 @@
+"""
+postgres backend with health checked persistent connections
+
+django 3.2 only pings a persistent connection after an error, so one the
+server or a proxy dropped while idle fails the next request. like
+CONN_HEALTH_CHECKS in django 4.1 the connection is pinged once per request,
+when the request first needs a cursor, and replaced if it is dead
+"""
+from django.db.backends.postgresql import base
+
+from core.db import metrics
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # False until the current request has used (and checked) the connection
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return bool(self.settings_dict.get('CONN_HEALTH_CHECKS'))
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+        metrics.record('opened')
+
+    def close(self):
+        had_connection = self.connection is not None
+        super().close()
+        if had_connection and self.connection is None:
+            metrics.record('discarded')
+
+    def close_if_unusable_or_obsolete(self):
+        # called at the start and end of every request
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        """Replace a connection kept from an earlier request if it is dead"""
+        if self.connection is None or self.health_check_done:
+            return
+        self.health_check_done = True
+        if self.health_check_enabled and not self.is_usable():
+            metrics.record('health_check_failed')
+            self.close()
+        else:
+            metrics.record('reused')
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
@@ -0,0 +1,124 @@
+"""
+opt-in detector for requests repeating one sql shape (N+1) or running a
+slow query - see QueryDetectorMiddleware
+"""
+import re
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+_VALUES_ROWS = re.compile(r'(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+')
+_SPACE = re.compile(r'\s+')
+# transaction bookkeeping repeats by design
+_IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+# the instrumentation itself sits in every stack
+_OWN_FILES = ('core/db/detector.py', 'core/middleware.py', 'core/metrics.py')
+
+_allowed = threading.local()
+
+
+def fingerprint(sql):
+    """sql with literals, placeholders and list lengths normalised away"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _VALUES_ROWS.sub(r'\1, ...', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+@contextmanager
+def allow_repeats():
+    """Mark a loop whose repeated queries are deliberate, eg batching"""
+    depth = getattr(_allowed, 'depth', 0)
+    _allowed.depth = depth + 1
+    try:
+        yield
+    finally:
+        _allowed.depth = depth
+
+
+def stack_excerpt(limit=6):
+    """the innermost project frames, skipping django and this module"""
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(base)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.endswith(_OWN_FILES)
+    ]
+    return [
+        f'{frame.filename[len(base) + 1:]}:{frame.lineno} in {frame.name}'
+        for frame in frames[-limit:]
+    ]
+
+
+class Finding:
+    """one problem found in a request"""
+    __slots__ = ('kind', 'fingerprint', 'count', 'duration_ms', 'stack')
+
+    def __init__(self, kind, fingerprint, count, duration_ms, stack):
+        self.kind = kind
+        self.fingerprint = fingerprint
+        self.count = count
+        self.duration_ms = duration_ms
+        self.stack = stack
+
+    def __str__(self):
+        if self.kind == 'repeated':
+            head = f'{self.count} x {self.fingerprint}'
+        else:
+            head = f'{self.duration_ms:.1f}ms {self.fingerprint}'
+        return '\n    '.join([f'{self.kind}: {head}'] + self.stack)
+
+
+class QueryDetector:
+    """execute_wrapper flagging repeated sql shapes and slow queries"""
+
+    def __init__(self, repeat_threshold, slow_ms):
+        # more than repeat_threshold runs of one shape is flagged, slow_ms
+        # of 0 turns the latency check off
+        self.repeat_threshold = repeat_threshold
+        self.slow_ms = slow_ms
+        self._counts = {}
+        self._stacks = {}
+        self._slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._record(sql, elapsed_ms)
+
+    def _record(self, sql, elapsed_ms):
+        if sql.lstrip().upper().startswith(_IGNORED):
+            return
+        shape = fingerprint(sql)
+        if not getattr(_allowed, 'depth', 0):
+            count = self._counts[shape] = self._counts.get(shape, 0) + 1
+            # the stack is only walked once a shape crosses the threshold
+            if count == self.repeat_threshold + 1:
+                self._stacks[shape] = stack_excerpt()
+        if self.slow_ms and elapsed_ms > self.slow_ms:
+            self._slow.append(
+                Finding('slow', shape, 1, elapsed_ms, stack_excerpt())
+            )
+
+    def findings(self):
+        """repeated shapes then slow queries"""
+        repeated = [
+            Finding('repeated', shape, count, None, self._stacks[shape])
+            for shape, count in self._counts.items()
+            if count > self.repeat_threshold
+        ]
+        return repeated + self._slow
@@ -0,0 +1,13 @@
+"""
+lightweight database probe for wait_for_db and the readiness endpoint
+"""
+from django.db import connections
+
+
+def probe(alias='default'):
+    """Run SELECT 1, raising the driver's error if the database is down"""
+    # a bare round trip - the system check framework imports and inspects
+    # every model, far more than is needed to know the server is up
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
@@ -0,0 +1,26 @@
+"""
+per process counters of database connections opened, reused and discarded
+"""
+import threading
+from collections import Counter
+
+EVENTS = ('opened', 'reused', 'discarded', 'health_check_failed')
+
+_lock = threading.Lock()
+_counts = Counter()
+
+
+def record(event):
+    with _lock:
+        _counts[event] += 1
+
+
+def snapshot():
+    """Current count of every event"""
+    with _lock:
+        return {event: _counts[event] for event in EVENTS}
+
+
+def reset():
+    with _lock:
+        _counts.clear()
@@ -0,0 +1,141 @@
+"""
+Django command to benchmark the rest api
+"""
+import json
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from benchmarks.clients import HttpClient, LocalClient
+from benchmarks.runner import run
+from benchmarks.scenarios import (
+    SCENARIOS, THROTTLES_OFF, SeedError, make_rng, seed,
+)
+
+
+class Rollback(Exception):
+    """raised to throw away the seeded rows in local mode"""
+
+
+class Command(BaseCommand):
+    """Seed data, run api scenarios and report latency/throughput"""
+    help = (
+        'Benchmark the api in process (default, rolled back afterwards) or '
+        'against a running server with --url'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Base url of a running server eg http://localhost:8000, '
+                 'started with LOGIN_THROTTLE_RATE_IP= and '
+                 'LOGIN_THROTTLE_RATE_EMAIL= so logins are not throttled',
+        )
+        parser.add_argument('--users', type=int, default=2)
+        parser.add_argument(
+            '--recipes', type=int, default=200, help='Recipes per user',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=20, help='Tag names per user',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=50,
+            help='Ingredient names per user',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Timed requests per scenario',
+        )
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Threads (--url only)',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Random seed for data and scenarios',
+        )
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f'Comma separated subset of {",".join(SCENARIOS)}',
+        )
+        parser.add_argument(
+            '--output', help='Write the json report to this file',
+        )
+
+    def _print_report(self, report):
+        header = (
+            f'{"scenario":<14}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"req/s":>10}{"queries":>9}{"errors":>8}'
+        )
+        self.stdout.write(header)
+        for name, stats in report['scenarios'].items():
+            queries = stats['queries_per_request']
+            self.stdout.write(
+                f'{name:<14}{stats["p50_ms"]:>9}{stats["p95_ms"]:>9}'
+                f'{stats["p99_ms"]:>9}{stats["requests_per_sec"]:>10}'
+                f'{"-" if queries is None else queries:>9}{stats["errors"]:>8}'
+            )
+
+    def _run(self, client, options, scenarios):
+        rng = make_rng(options['seed'])
+        users = seed(
+            client, options['users'], options['recipes'],
+            options['tags'], options['ingredients'], rng,
+        )
+        meta = {
+            'target': options['url'] or 'django test client',
+            'users': options['users'],
+            'recipes_per_user': options['recipes'],
+        }
+        return run(
+            client, users, scenarios, options['requests'], options['warmup'],
+            options['concurrency'], options['seed'], meta,
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [
+            s.strip() for s in options['scenarios'].split(',') if s.strip()
+        ]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Unknown scenarios: {", ".join(sorted(unknown))}'
+            )
+
+        try:
+            if options['url']:
+                client = HttpClient(options['url'])
+                report = self._run(client, options, scenarios)
+            else:
+                # in process - everything seeded or written is rolled back,
+                # uploaded images go to a scratch MEDIA_ROOT removed after.
+                # test client requests come from the 'testserver' host
+                media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+                overrides = override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                    MEDIA_ROOT=media_root,
+                    **THROTTLES_OFF,
+                )
+                try:
+                    with overrides, transaction.atomic():
+                        report = self._run(LocalClient(), options, scenarios)
+                        raise Rollback
+                except Rollback:
+                    pass
+                finally:
+                    shutil.rmtree(media_root, ignore_errors=True)
+        except SeedError as exc:
+            raise CommandError(str(exc))
+
+        self._print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Report written to {options["output"]}'
+            ))
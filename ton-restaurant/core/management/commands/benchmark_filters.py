@@ -0,0 +1,77 @@
+"""
+Django command to benchmark recipe tag filter strategies
+"""
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from benchmarks import filters
+
+
+class Rollback(Exception):
+    """raised to throw away the seeded rows"""
+
+
+class Command(BaseCommand):
+    """Time join+DISTINCT against EXISTS / HAVING COUNT as ids grow"""
+    help = (
+        'Seed a throwaway user and time tag filter strategies by number of ids'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--tags-per-recipe', type=int, default=5)
+        parser.add_argument(
+            '--ids', default='1,2,5,10,25,50',
+            help='Comma separated id counts',
+        )
+        parser.add_argument('--repeats', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--output', help='Write the json report to this file',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        id_counts = [int(n) for n in options['ids'].split(',')]
+        try:
+            with transaction.atomic():
+                user, tag_ids = filters.seed_tagged(
+                    options['recipes'], options['tags'],
+                    options['tags_per_recipe'], rng,
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                results = filters.run(
+                    user, tag_ids, id_counts, options['repeats'], rng,
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(
+            f'{"strategy":<15}{"match":<7}{"ids":>5}'
+            f'{"p50 ms":>10}{"p95 ms":>10}'
+        )
+        for row in results:
+            self.stdout.write(
+                f'{row["strategy"]:<15}{row["match"]:<7}{row["ids"]:>5}'
+                f'{row["p50_ms"]:>10}{row["p95_ms"]:>10}'
+            )
+        if options['output']:
+            report = {
+                'meta': {
+                    key: options[key]
+                    for key in (
+                        'recipes', 'tags', 'tags_per_recipe', 'repeats',
+                        'seed',
+                    )
+                },
+                'results': results,
+            }
+            report['meta']['vendor'] = connection.vendor
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
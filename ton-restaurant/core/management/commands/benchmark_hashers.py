@@ -0,0 +1,111 @@
+"""
+Django command to compare what a login costs under each password hasher
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    check_password,
+    get_hasher,
+    make_password,
+)
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+PASSWORD = 'bench-pass-123'
+
+
+class Command(BaseCommand):
+    """Time password verifies, the cpu bound part of a token login"""
+    help = (
+        'Time check_password for each hasher with the configured costs, '
+        'reporting logins/sec per core'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hashers', default='pbkdf2_sha256,scrypt,argon2',
+            help='Comma separated algorithms from PASSWORD_HASHERS',
+        )
+        parser.add_argument(
+            '--verifies', type=int, default=50,
+            help='Timed verifies per hasher',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=os.cpu_count() or 1,
+            help='Verifying threads, the hashers release the gil',
+        )
+        parser.add_argument(
+            '--output', help='Write the json report to this file',
+        )
+
+    def _bench(self, hasher, verifies, threads):
+        encoded = make_password(PASSWORD, hasher=hasher)
+        # one untimed verify loads the library and warms the caches
+        if not check_password(PASSWORD, encoded):
+            raise CommandError(
+                f'{hasher.algorithm} failed to verify its own hash'
+            )
+
+        def verify(_):
+            start = time.perf_counter()
+            check_password(PASSWORD, encoded)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            timings = sorted(pool.map(verify, range(verifies)))
+        elapsed = time.perf_counter() - start
+        cpus = os.cpu_count() or 1
+        per_sec = verifies / elapsed
+        return {
+            'p50_ms': round(timings[len(timings) // 2] * 1000, 2),
+            'logins_per_sec': round(per_sec, 2),
+            'logins_per_sec_per_core': round(per_sec / min(threads, cpus), 2),
+        }
+
+    def handle(self, *args, **options):
+        names = [h.strip() for h in options['hashers'].split(',') if h.strip()]
+        algorithms = {
+            import_string(path).algorithm for path in settings.PASSWORD_HASHERS
+        }
+        unknown = set(names) - algorithms
+        if unknown:
+            raise CommandError(
+                f'Unknown hashers: {", ".join(sorted(unknown))}'
+            )
+        if options['verifies'] < 1 or options['threads'] < 1:
+            raise CommandError('--verifies and --threads must be at least 1')
+
+        report = {}
+        for name in names:
+            hasher = get_hasher(name)
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError as exc:
+                self.stdout.write(
+                    self.style.WARNING(f'{name}: skipped, {exc}')
+                )
+                continue
+            report[name] = self._bench(
+                hasher, options['verifies'], options['threads'],
+            )
+
+        self.stdout.write(
+            f'{"hasher":<15}{"p50 ms":>9}{"logins/s":>11}{"logins/s/core":>15}'
+        )
+        for name, stats in report.items():
+            self.stdout.write(
+                f'{name:<15}{stats["p50_ms"]:>9}{stats["logins_per_sec"]:>11}'
+                f'{stats["logins_per_sec_per_core"]:>15}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Report written to {options["output"]}'
+            ))
@@ -0,0 +1,122 @@
+"""
+Django command to compare the cost of the json and messagepack renderers
+"""
+import io
+import json
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import MessagePackParser, ORJSONParser
+from core.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+
+MEDIA_URL = 'http://testserver/static/media/uploads/recipe/'
+
+
+def recipe_page(count):
+    """a list response shaped like RecipeDetailSerializer data"""
+    def nested(prefix, start, size):
+        return [
+            OrderedDict([
+                ('id', i), ('name', f'{prefix} {i}'), ('recipe_count', i * 3),
+            ])
+            for i in range(start, start + size)
+        ]
+
+    return OrderedDict([
+        ('next', 'http://testserver/api/recipe/recipes/?cursor=cD0xMjM0'),
+        ('previous', None),
+        ('results', [OrderedDict([
+            ('id', i),
+            ('title', f'Recipe {i} crème brûlée'),
+            ('time_minutes', 5 + i % 90),
+            ('price', f'{(i % 4999) / 100 + 1:.2f}'),
+            ('link', f'https://example.com/recipes/{i}.pdf'),
+            ('tags', nested('Tag', i % 20, 3)),
+            ('ingredients', nested('Ingredient', i % 50, 6)),
+            ('description', 'Whisk, fold and bake until golden. ' * 6),
+            ('image', f'{MEDIA_URL}{i}.jpg'),
+            ('image_variants', {
+                str(width): {
+                    'jpeg': f'{MEDIA_URL}{i}-{width}.jpg',
+                    'webp': f'{MEDIA_URL}{i}-{width}.webp',
+                }
+                for width in (320, 640, 1280)
+            }),
+        ]) for i in range(count)]),
+    ])
+
+
+class Command(BaseCommand):
+    """Time rendering and parsing one large recipe list per format"""
+    help = (
+        'Encode and decode a recipe list with the stdlib json, orjson and '
+        'messagepack renderers/parsers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--repeat', type=int, default=20, help='Best of this many runs',
+        )
+        parser.add_argument(
+            '--output', help='Write the json report to this file',
+        )
+
+    def _time(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return round(best * 1000, 2)
+
+    def handle(self, *args, **options):
+        data = recipe_page(options['recipes'])
+        formats = [('json', JSONRenderer(), JSONParser())]
+        if orjson is not None:
+            formats.append(('orjson', ORJSONRenderer(), ORJSONParser()))
+        else:
+            self.stdout.write(
+                self.style.WARNING('orjson: skipped, not installed'),
+            )
+        if msgpack is not None:
+            formats.append(
+                ('msgpack', MessagePackRenderer(), MessagePackParser()),
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING('msgpack: skipped, not installed'),
+            )
+
+        report = {}
+        for name, renderer, parser in formats:
+            body = renderer.render(data, renderer.media_type)
+            report[name] = {
+                'bytes': len(body),
+                'encode_ms': self._time(
+                    lambda: renderer.render(data, renderer.media_type),
+                    options['repeat'],
+                ),
+                'decode_ms': self._time(
+                    lambda: parser.parse(io.BytesIO(body)), options['repeat'],
+                ),
+            }
+
+        self.stdout.write(
+            f'{"format":<10}{"bytes":>10}{"encode ms":>11}{"decode ms":>11}'
+        )
+        for name, stats in report.items():
+            self.stdout.write(
+                f'{name:<10}{stats["bytes"]:>10}{stats["encode_ms"]:>11}'
+                f'{stats["decode_ms"]:>11}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Report written to {options["output"]}'
+            ))
@@ -0,0 +1,128 @@
+"""
+Django command to benchmark the dev server against the production profile
+"""
+import json
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.clients import HttpClient
+from benchmarks.runner import run
+from benchmarks.scenarios import SCENARIOS, SeedError, make_rng, seed
+from benchmarks.servers import SERVERS, Server, ServerError
+
+
+class Command(BaseCommand):
+    """Start each server, run the same api scenarios and compare throughput"""
+    help = (
+        'Run the benchmark_api scenarios against runserver and the gunicorn '
+        'profiles started on this machine, reporting req/s per core'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servers', default='runserver,gunicorn',
+            help=f'Comma separated subset of {",".join(SERVERS)}',
+        )
+        parser.add_argument('--users', type=int, default=4)
+        parser.add_argument(
+            '--recipes', type=int, default=200, help='Recipes per user',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=20, help='Tag names per user',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=50,
+            help='Ingredient names per user',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Timed requests per scenario',
+        )
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument(
+            '--concurrency', type=int, default=8, help='Client threads',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--scenarios', default='list,detail,filter,create',
+            help=f'Comma separated subset of {",".join(SCENARIOS)}',
+        )
+        parser.add_argument('--startup-timeout', type=int, default=30)
+        parser.add_argument(
+            '--output', help='Write the json report to this file',
+        )
+
+    def _bench(self, server, options, scenarios, cpus):
+        client = HttpClient(server.url)
+        users = seed(
+            client, options['users'], options['recipes'],
+            options['tags'], options['ingredients'], make_rng(options['seed']),
+        )
+        try:
+            report = run(
+                client, users, scenarios, options['requests'],
+                options['warmup'], options['concurrency'], options['seed'],
+                {'target': server.name, 'cpus': cpus},
+            )
+        finally:
+            # real servers commit - drop everything the run created
+            get_user_model().objects.filter(
+                email__in=[user.email for user in users],
+            ).delete()
+        for stats in report['scenarios'].values():
+            stats['requests_per_sec_per_core'] = round(
+                stats['requests_per_sec'] / cpus, 2,
+            )
+        return report
+
+    def handle(self, *args, **options):
+        servers = [
+            s.strip() for s in options['servers'].split(',') if s.strip()
+        ]
+        scenarios = [
+            s.strip() for s in options['scenarios'].split(',') if s.strip()
+        ]
+        unknown = (
+            (set(servers) - set(SERVERS)) | (set(scenarios) - set(SCENARIOS))
+        )
+        if unknown:
+            raise CommandError(
+                f'Unknown servers/scenarios: {", ".join(sorted(unknown))}'
+            )
+        # the load generator shares these cores with the server
+        cpus = os.cpu_count() or 1
+
+        reports = {}
+        for name in servers:
+            self.stdout.write(f'== {name}')
+            try:
+                server = Server(
+                    name, startup_timeout=options['startup_timeout'],
+                )
+                with server:
+                    reports[name] = self._bench(
+                        server, options, scenarios, cpus,
+                    )
+            except (ServerError, SeedError) as exc:
+                raise CommandError(f'{name}: {exc}')
+
+        self.stdout.write(
+            f'{"server":<15}{"scenario":<10}{"p50":>9}{"p95":>9}'
+            f'{"req/s":>10}{"req/s/core":>12}{"errors":>8}'
+        )
+        for name, report in reports.items():
+            for scenario, stats in report['scenarios'].items():
+                self.stdout.write(
+                    f'{name:<15}{scenario:<10}{stats["p50_ms"]:>9}'
+                    f'{stats["p95_ms"]:>9}{stats["requests_per_sec"]:>10}'
+                    f'{stats["requests_per_sec_per_core"]:>12}'
+                    f'{stats["errors"]:>8}'
+                )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(reports, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Report written to {options["output"]}'
+            ))
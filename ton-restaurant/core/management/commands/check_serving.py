@@ -0,0 +1,39 @@
+"""
+Django command to show the production serving profile and self-check it
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ton_restaurant import serving
+
+
+class Command(BaseCommand):
+    """Print the gunicorn worker profile and run the startup self-check"""
+    help = 'Show the gunicorn settings derived for this machine and check them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cpus', type=int,
+            help='Derive the profile for this many cpus instead of this '
+                 'machine',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            profile = serving.worker_profile(cpu_count=options['cpus'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for key, value in profile.items():
+            self.stdout.write(f'{key:<20}{value}')
+        self.stdout.write(
+            f'{"db connections":<20}{serving.db_connections_needed(profile)}'
+        )
+
+        errors, warnings = serving.self_check(profile)
+        for message in warnings:
+            self.stdout.write(self.style.WARNING(f'warning: {message}'))
+        for message in errors:
+            self.stdout.write(self.style.ERROR(f'error: {message}'))
+        if errors:
+            raise CommandError(f'{len(errors)} self-check errors')
+        self.stdout.write(self.style.SUCCESS('Serving profile OK.'))
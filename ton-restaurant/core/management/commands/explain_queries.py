@@ -0,0 +1,142 @@
+"""
+Django command to EXPLAIN the recipe/tag/ingredient api queries
+"""
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import usage
+from core.models import Recipe, Tag, Ingredient
+from recipe.filters import MATCH_ALL, filter_recipes
+
+# tags and ingredients linked to each seeded recipe
+LINKS_PER_RECIPE = 3
+
+
+class Rollback(Exception):
+    """raised to throw away the seeded rows"""
+
+
+class Command(BaseCommand):
+    """Print query plans for the per-user api queries"""
+    help = (
+        'Seed a throwaway user and EXPLAIN the recipe/tag/ingredient queries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=2000,
+            help='Recipes to seed for the throwaway user',
+        )
+        parser.add_argument(
+            '--attrs', type=int, default=200,
+            help='Tags and ingredients to seed for the throwaway user',
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Run EXPLAIN ANALYZE (postgres only)',
+        )
+
+    def _link(self, through, fk, user, model):
+        """link every recipe to a spread of attrs, like real usage"""
+        # ids read back, sqlite's bulk_create doesn't set them
+        recipe_ids = Recipe.objects.filter(user=user).values_list(
+            'id', flat=True).order_by('id')
+        attr_ids = list(model.objects.filter(user=user).values_list(
+            'id', flat=True).order_by('id'))
+        per_recipe = min(LINKS_PER_RECIPE, len(attr_ids))
+        through.objects.bulk_create([
+            through(**{
+                'recipe_id': recipe_id,
+                f'{fk}_id': attr_ids[(i * 7 + n) % len(attr_ids)],
+            })
+            for i, recipe_id in enumerate(recipe_ids)
+            for n in range(per_recipe)
+        ])
+
+    def _seed(self, recipes, attrs):
+        """create a user with recipes linked to tags and ingredients"""
+        # unique so a leftover or real account never collides
+        user = get_user_model().objects.create_user(
+            email=f'explain-queries-{uuid.uuid4().hex}@example.com',
+            password=None,
+        )
+        Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=Decimal('5.00'),
+            )
+            for i in range(recipes)
+        ])
+        Tag.objects.bulk_create(
+            [Tag(user=user, name=f'Tag {i}') for i in range(attrs)]
+        )
+        Ingredient.objects.bulk_create([
+            Ingredient(user=user, name=f'Ingredient {i}')
+            for i in range(attrs)
+        ])
+        if attrs:
+            self._link(Recipe.tags.through, 'tag', user, Tag)
+            self._link(
+                Recipe.ingredients.through, 'ingredient', user, Ingredient,
+            )
+        # bulk_create skips the signals that keep the counters
+        for model in (Tag, Ingredient):
+            usage.refresh_usage_counts(model, model.objects.filter(user=user))
+        # refresh planner stats so the seeded rows are taken into account
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return user
+
+    def _queries(self, user):
+        """the queries the recipe viewsets run, keyed by a label"""
+        names = [f'Tag {i}' for i in range(5)]
+        recipe_ids = list(Recipe.objects.filter(user=user).values_list(
+            'id', flat=True).order_by('-id')[:50])
+        tag_ids = ','.join(str(tag_id) for tag_id in Tag.objects.filter(
+            user=user).values_list('id', flat=True)[:2])
+        recipes = Recipe.objects.filter(user=user)
+        return {
+            'recipe list': Recipe.objects.filter(
+                user=user).order_by('-id')[:51],
+            'recipe detail': Recipe.objects.filter(
+                user=user, id=recipe_ids[0] if recipe_ids else None),
+            'recipe tags prefetch': Tag.objects.filter(
+                recipe__id__in=recipe_ids).order_by('id'),
+            'recipe filter by tag': filter_recipes(
+                recipes, {'tags': tag_ids}).order_by('-id')[:51],
+            'recipe filter all tags': filter_recipes(
+                recipes, {'tags': tag_ids, 'match': MATCH_ALL},
+            ).order_by('-id')[:51],
+            'tag list': Tag.objects.filter(
+                user=user).order_by('-name', '-id')[:101],
+            'tag popular': Tag.objects.filter(
+                user=user).order_by('-recipe_count', '-id')[:101],
+            'ingredient list': Ingredient.objects.filter(
+                user=user).order_by('-name', '-id')[:101],
+            'tag get_or_create': Tag.objects.filter(
+                user=user, name__in=names),
+        }
+
+    def handle(self, *args, **options):
+        """Seed, explain and roll back"""
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options['analyze'] = True
+
+        try:
+            with transaction.atomic():
+                user = self._seed(options['recipes'], options['attrs'])
+                for label, queryset in self._queries(user).items():
+                    self.stdout.write(self.style.SUCCESS(f'== {label}'))
+                    self.stdout.write(queryset.explain(**explain_options))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write('Seeded rows rolled back.')
@@ -0,0 +1,53 @@
+"""
+Django command to build recipe image variants whose background job was lost
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Process recipes that have an image but no variants"""
+    help = (
+        'Build variants for recipe images whose job was lost to a worker '
+        'restart, or list them with --check'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report recipes missing variants, exit non-zero if any',
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='Limit to one user id',
+        )
+
+    def handle(self, *args, **options):
+        queryset = images.missing_variants().order_by('id')
+        if options['user'] is not None:
+            queryset = queryset.filter(user_id=options['user'])
+        pending = list(queryset.values_list('id', 'image'))
+
+        failed = 0
+        for recipe_id, image_name in pending:
+            self.stdout.write(f'Recipe {recipe_id}: {image_name}')
+            if options['check']:
+                continue
+            try:
+                images.process_recipe_image(recipe_id, image_name)
+            except Exception:
+                # logged with the traceback, carry on with the others
+                failed += 1
+        self.stdout.write(f'{len(pending)} recipes without variants')
+
+        if options['check']:
+            if pending:
+                raise CommandError(
+                    f'{len(pending)} recipe images have no variants'
+                )
+            self.stdout.write(self.style.SUCCESS('Image variants complete.'))
+        elif failed:
+            raise CommandError(f'{failed} recipe images failed to process')
+        else:
+            self.stdout.write(self.style.SUCCESS('Image variants rebuilt.'))
@@ -0,0 +1,51 @@
+"""
+Django command to check and rebuild the tag/ingredient usage counters
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import usage
+from core.models import Tag, Ingredient
+
+
+class Command(BaseCommand):
+    """Compare recipe_count against a live aggregate and fix any drift"""
+    help = (
+        'Recompute tag/ingredient recipe_count, or report drift with --check'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report drifted counters, exit non-zero if any',
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='Limit to one user id',
+        )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for model in (Tag, Ingredient):
+            queryset = model.objects.all()
+            if options['user'] is not None:
+                queryset = queryset.filter(user_id=options['user'])
+
+            with transaction.atomic():
+                drift = usage.usage_drift(model, queryset)
+                for obj_id, stored, live in drift:
+                    self.stdout.write(
+                        f'{model.__name__} {obj_id}: '
+                        f'stored {stored}, live {live}'
+                    )
+                if not options['check']:
+                    usage.refresh_usage_counts(model, queryset)
+            drifted += len(drift)
+            self.stdout.write(f'{model.__name__}: {len(drift)} drifted')
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f'{drifted} usage counters have drifted')
+            self.stdout.write(self.style.SUCCESS('Usage counters match.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Usage counters recomputed.'))
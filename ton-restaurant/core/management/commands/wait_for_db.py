@@ -1,27 +1,88 @@
 """
 Django command to wait for database to be available
 """
-# used in sleep
+# whole seconds for libpq's connect_timeout
+import math
+# jitter for the backoff
+import random
+# used in sleep and the deadline
 import time
 # psycopg2 error when db not ready
 from psycopg2 import OperationalError as Psycopg2OpError
 # django error when db not ready
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db.health import probe
 
 
 class Command(BaseCommand):
     """Wait for database to be available"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Give up after this many seconds',
+        )
+        parser.add_argument(
+            '--initial-delay', type=float, default=0.1,
+            help='First backoff in seconds, doubled after every failure',
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='Longest backoff in seconds',
+        )
+        parser.add_argument('--database', default='default')
+
+    def probe(self, alias, timeout):
+        """one connection attempt and round trip, connecting for timeout"""
+        connection = connections[alias]
+        options = connection.settings_dict.get('OPTIONS', {})
+        if connection.vendor == 'postgresql':
+            # a hung connect (blackholed host) would otherwise block well
+            # past the deadline - libpq only takes whole seconds
+            connect_timeout = max(1, math.ceil(timeout))
+            if options.get('connect_timeout'):
+                connect_timeout = min(
+                    connect_timeout, int(options['connect_timeout']),
+                )
+            connection.settings_dict['OPTIONS'] = {
+                **options, 'connect_timeout': connect_timeout,
+            }
+        try:
+            probe(alias)
+        finally:
+            connection.close()
+            connection.settings_dict['OPTIONS'] = options
+
     def handle(self, *args, **options):
         """Wait for database to be available"""
         self.stdout.write('PLease wait for db to start...') # log text on screen as cmd is executed
-        db_up = False
-        while db_up is False:
+        deadline = time.monotonic() + options['timeout']
+        attempt = 0
+        while True:
             try:
-                self.check(databases=['default']) # called and db not ready go to except
-                db_up = True
+                # db not ready go to except
+                self.probe(
+                    options['database'], deadline - time.monotonic(),
+                )
+                break
             except(Psycopg2OpError, OperationalError):
-                self.stdout.write('Be humble eh! 1 sec please...')
-                time.sleep(1) # wait 1 second before checking again
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database unavailable after {options["timeout"]}s'
+                    )
+                # exponential backoff with full jitter - replicas starting
+                # together don't hit the db in lock step
+                cap = min(
+                    options['max_delay'],
+                    options['initial_delay'] * 2 ** attempt,
+                )
+                delay = min(random.uniform(0, cap), remaining)
+                self.stdout.write(f'Be humble eh! {delay:.2f} sec please...')
+                time.sleep(delay)
+                attempt += 1
 
-        self.stdout.write(self.style.SUCCESS('Woo-hoo congrats db available!'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('Woo-hoo congrats db available!'))
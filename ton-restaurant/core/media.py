@@ -0,0 +1,157 @@
+"""
+serving authorized media files - the front proxy sends the bytes when it
+can (X-Accel-Redirect / X-Sendfile), else a FileResponse the wsgi server
+can sendfile(), with Range and ETag support
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+_range_re = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.I)
+
+
+class FileRange:
+    """
+    File object limited to length bytes from its current position
+
+    keeps fileno() so gunicorn's file_wrapper can still sendfile() it, it
+    starts at the file position and stops after Content-Length bytes
+    """
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single byte range, None to send the whole
+    file (no header, several ranges, or a unit we don't know) - raises
+    ValueError when the range is outside the file
+    """
+    match = _range_re.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # suffix range - the last n bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError(header)
+    return start, end
+
+
+def file_etag(st):
+    """strong etag from mtime and size, the way nginx builds it"""
+    return f'"{int(st.st_mtime):x}-{st.st_size:x}"'
+
+
+def _cache_headers(response):
+    # uploads get a fresh uuid name and are never rewritten, but they are
+    # per user so shared caches must not keep them
+    response['Cache-Control'] = (
+        f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    )
+    return response
+
+
+def _handoff(name, content_type):
+    """empty response telling the proxy which file to send"""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SERVE_MODE == 'accel':
+        prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+        response['X-Accel-Redirect'] = prefix + name
+    else:
+        response['X-Sendfile'] = default_storage.path(name)
+    return _cache_headers(response)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """whether a Range may be honoured - If-Range has to match exactly"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_media(request, name):
+    """
+    Response for the storage file name, already authorized by the caller
+    """
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.MEDIA_SERVE_MODE != 'django':
+        # the proxy does ranges, etags and 304s itself
+        return _handoff(name, content_type)
+
+    path = default_storage.path(name)
+    try:
+        file = open(path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404(name)
+    st = os.fstat(file.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        file.close()
+        raise Http404(name)
+
+    etag, last_modified = file_etag(st), int(st.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified,
+    )
+    if response is not None:
+        file.close()
+        response['ETag'] = etag
+        return _cache_headers(response)
+
+    size, start, end = st.st_size, 0, st.st_size - 1
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is not None:
+        start, end = byte_range
+
+    response = FileResponse(
+        FileRange(file, start, end - start + 1), content_type=content_type,
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return _cache_headers(response)
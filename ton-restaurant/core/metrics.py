@@ -0,0 +1,372 @@
+"""
+in-process request metrics - per view/action latency, sql, serialize and
+render time, rendered in the prometheus text format for /metrics
+
+every gunicorn worker keeps its own registry. with METRICS_MULTIPROCESS_DIR
+set each one also writes it to a file there (at most every FLUSH_INTERVAL
+seconds) and a scrape answered by any worker sums all of them, so one
+target reports the whole server
+"""
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+from core.db import metrics as db_metrics
+
+# latency histogram upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# seconds a worker's file may lag behind its registry
+FLUSH_INTERVAL = 1.0
+
+
+def view_label(view_func, method):
+    """(view, action) naming a resolved view in metrics and logs"""
+    # viewsets map the method to an action, plain views use the method
+    cls = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    method = method.lower()
+    name = cls.__name__ if cls else view_func.__name__
+    return name, actions.get(method, method)
+
+
+class RequestTimer:
+    """timings for one request - also the execute_wrapper counting sql"""
+    __slots__ = (
+        'start', 'queries', 'db', 'serialize', 'render', '_serializing',
+        '_render_start',
+    )
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self._serializing = False
+        self._render_start = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    @contextmanager
+    def serializing(self):
+        """count the block as serialize time, less the sql it runs"""
+        if self._serializing:
+            # nested serializers are inside their parent's time already
+            yield
+            return
+        self._serializing = True
+        start, db = time.perf_counter(), self.db
+        try:
+            yield
+        finally:
+            self._serializing = False
+            elapsed = time.perf_counter() - start
+            self.serialize += max(elapsed - (self.db - db), 0)
+
+    def render_started(self):
+        self._render_start = time.perf_counter()
+
+    def render_finished(self, response):
+        if self._render_start is not None:
+            self.render += time.perf_counter() - self._render_start
+
+
+def serializing(request):
+    """RequestTimer.serializing of request, a no-op outside the middleware"""
+    timer = getattr(request, '_metrics_timer', None)
+    return timer.serializing() if timer is not None else nullcontext()
+
+
+class TimedSerializerMixin:
+    """Serializer whose representation counts as the request's serialize"""
+    # each instance of a many=True page is timed on its own, nested
+    # serializers run inside their parent's block and aren't
+
+    def to_representation(self, instance):
+        with serializing(self.context.get('request')):
+            return super().to_representation(instance)
+
+
+class _Series:
+    __slots__ = (
+        'count', 'duration', 'queries', 'db', 'serialize', 'render', 'buckets',
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+
+class Registry:
+    """Aggregates keyed by (view, action, status)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, action, status, duration, timer):
+        key = (view, action, str(status))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            series.count += 1
+            series.duration += duration
+            series.queries += timer.queries
+            series.db += timer.db
+            series.serialize += timer.serialize
+            series.render += timer.render
+            series.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+
+    def snapshot(self):
+        """{(view, action, status): series} copied under the lock"""
+        with self._lock:
+            return {
+                key: (
+                    s.count, s.duration, s.queries, s.db, s.serialize,
+                    s.render, list(s.buckets),
+                )
+                for key, s in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+registry = Registry()
+
+
+def _merge(total, data):
+    """add one process's {'requests': ..., 'db': ...} into total"""
+    for view, action, status, *values in data['requests']:
+        key = (view, action, status)
+        current = total['requests'].get(key)
+        if current is None:
+            total['requests'][key] = (*values[:-1], list(values[-1]))
+        else:
+            total['requests'][key] = (
+                *(a + b for a, b in zip(current[:-1], values[:-1])),
+                [a + b for a, b in zip(current[-1], values[-1])],
+            )
+    for event, count in data['db'].items():
+        total['db'][event] = total['db'].get(event, 0) + count
+    return total
+
+
+def _dump(requests, db):
+    return {
+        'requests': [[*key, *values] for key, values in requests.items()],
+        'db': db,
+    }
+
+
+class SharedStore:
+    """
+    Metric files of every worker in one directory - worker-<pid>.json
+    written by the worker, archive.json holding the workers that exited
+    so counters never go backwards when gunicorn recycles one
+    """
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, path):
+        self.path = path
+
+    def _worker_file(self, pid):
+        return os.path.join(self.path, f'worker-{pid}.json')
+
+    @contextmanager
+    def _locked(self, operation):
+        # collect takes it shared, archiving a worker exclusive - a scrape
+        # never sees one worker both archived and in its own file
+        with open(os.path.join(self.path, '.lock'), 'a') as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, data):
+        # replaced in one step, readers see the old or the new file
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def reset(self):
+        """Start empty, when the server (re)starts"""
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if name.endswith('.json') or name.endswith('.tmp'):
+                os.remove(os.path.join(self.path, name))
+
+    def write(self, pid, data):
+        self._write(self._worker_file(pid), data)
+
+    def archive(self, pid):
+        """Fold an exited worker's file into the archive"""
+        with self._locked(fcntl.LOCK_EX):
+            data = self._read(self._worker_file(pid))
+            if data is None:
+                return
+            archive_path = os.path.join(self.path, self.ARCHIVE)
+            total = {'requests': {}, 'db': {}}
+            for part in (self._read(archive_path), data):
+                if part is not None:
+                    _merge(total, part)
+            self._write(archive_path, _dump(total['requests'], total['db']))
+            os.remove(self._worker_file(pid))
+
+    def collect(self):
+        """{'requests': {key: series}, 'db': {event: count}} summed"""
+        total = {'requests': {}, 'db': {}}
+        with self._locked(fcntl.LOCK_SH):
+            for name in sorted(os.listdir(self.path)):
+                if name.endswith('.json'):
+                    data = self._read(os.path.join(self.path, name))
+                    if data is not None:
+                        _merge(total, data)
+        return total
+
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _local():
+    return _dump(registry.snapshot(), db_metrics.snapshot())
+
+
+def flush(force=False):
+    """
+    Write this process's metrics to METRICS_MULTIPROCESS_DIR, unless it was
+    done less than FLUSH_INTERVAL ago
+    """
+    global _last_flush
+    path = settings.METRICS_MULTIPROCESS_DIR
+    if not path:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    # one thread writes, the others don't wait for it
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        SharedStore(path).write(os.getpid(), _local())
+        _last_flush = now
+    finally:
+        _flush_lock.release()
+
+
+def collect():
+    """the series and db counters to report - every worker's when shared"""
+    path = settings.METRICS_MULTIPROCESS_DIR
+    if not path:
+        return {'requests': registry.snapshot(), 'db': db_metrics.snapshot()}
+    flush(force=True)
+    return SharedStore(path).collect()
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _labels(**labels):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def render_prometheus():
+    """Text exposition format 0.0.4 of the registry and db connections"""
+    collected = collect()
+    series = sorted(collected['requests'].items())
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family(
+        'http_requests_total', 'counter',
+        'Requests by view, action and status.',
+    )
+    for (view, action, status), (count, *_rest) in series:
+        labels = _labels(view=view, action=action, status=status)
+        lines.append(f'http_requests_total{{{labels}}} {count}')
+
+    family('http_request_duration_seconds', 'histogram', 'Request latency.')
+    totals = {}
+    for (view, action, _status), (count, duration, *_, buckets) in series:
+        total = totals.setdefault(
+            (view, action), [0, 0.0, [0] * len(buckets)],
+        )
+        total[0] += count
+        total[1] += duration
+        total[2] = [a + b for a, b in zip(total[2], buckets)]
+    for (view, action), (count, duration, buckets) in sorted(totals.items()):
+        cumulative = 0
+        for bound, hits in zip(BUCKETS + ('+Inf',), buckets):
+            cumulative += hits
+            labels = _labels(view=view, action=action, le=bound)
+            lines.append(
+                f'http_request_duration_seconds_bucket{{{labels}}} '
+                f'{cumulative}'
+            )
+        labels = _labels(view=view, action=action)
+        lines.append(
+            f'http_request_duration_seconds_sum{{{labels}}} {duration}'
+        )
+        lines.append(
+            f'http_request_duration_seconds_count{{{labels}}} {count}'
+        )
+
+    for name, index, help_text in (
+        ('http_request_db_queries_total', 2, 'SQL queries run by requests.'),
+        ('http_request_db_seconds_total', 3, 'Time requests spent in SQL.'),
+        ('http_request_serialize_seconds_total', 4,
+         'Time serializers spent building response data, less their SQL.'),
+        ('http_request_render_seconds_total', 5,
+         'Time renderers spent encoding response data.'),
+    ):
+        family(name, 'counter', help_text)
+        sums = {}
+        for (view, action, _status), values in series:
+            sums[(view, action)] = sums.get((view, action), 0) + values[index]
+        for (view, action), value in sorted(sums.items()):
+            labels = _labels(view=view, action=action)
+            lines.append(f'{name}{{{labels}}} {value}')
+
+    family('db_connections_total', 'counter', 'Database connection events.')
+    for event, count in collected['db'].items():
+        labels = _labels(event=event)
+        lines.append(f'db_connections_total{{{labels}}} {count}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,211 @@
+"""
+project wide middleware
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import Error as DatabaseError, connections
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from core import compression, metrics
+from core.db.detector import QueryDetector
+from core.db.health import probe
+
+logger = logging.getLogger(__name__)
+
+
+class HealthCheckMiddleware:
+    """Answer liveness and readiness probes before anything else runs"""
+    # first in MIDDLEWARE - orchestrators probe with the pod ip as Host, so
+    # these skip ALLOWED_HOSTS, sessions, auth and url resolving entirely
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routes = {
+            settings.HEALTH_LIVE_PATH: self.live,
+            settings.HEALTH_READY_PATH: self.ready,
+        }
+
+    def __call__(self, request):
+        check = self.routes.get(request.path)
+        if check is None:
+            return self.get_response(request)
+        response = check()
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def live(self):
+        """the process is serving requests - never touches the db"""
+        return JsonResponse({'status': 'ok'})
+
+    def ready(self):
+        """the database answers, so requests can be sent here"""
+        try:
+            probe()
+        except DatabaseError:
+            # details stay in the log, the endpoint is unauthenticated
+            logger.exception('readiness probe failed')
+            return JsonResponse(
+                {'status': 'unavailable', 'checks': {'database': 'error'}},
+                status=503,
+            )
+        return JsonResponse({'status': 'ok', 'checks': {'database': 'ok'}})
+
+
+class RequestMetricsMiddleware:
+    """Per view/action sql count, sql/serialize/render time and latency"""
+    # cheap enough to leave on - a perf_counter pair per query and one
+    # locked dict update per request
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == settings.METRICS_PATH:
+            return self.get_response(request)
+        timer = request._metrics_timer = metrics.RequestTimer()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - timer.start
+
+        view, action = getattr(request, '_metrics_view', ('unmatched', ''))
+        metrics.registry.observe(
+            view, action, response.status_code, duration, timer,
+        )
+        # no-op unless the workers share METRICS_MULTIPROCESS_DIR
+        metrics.flush()
+        if settings.SERVER_TIMING_HEADER:
+            app = max(
+                duration - timer.db - timer.serialize - timer.render, 0,
+            )
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timer.db * 1000:.2f};desc="{timer.queries} queries"',
+                f'serialize;dur={timer.serialize * 1000:.2f}',
+                f'render;dur={timer.render * 1000:.2f}',
+                f'app;dur={app * 1000:.2f}',
+                f'total;dur={duration * 1000:.2f}',
+            ])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = metrics.view_label(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # drf responses are rendered right after this hook
+        timer = getattr(request, '_metrics_timer', None)
+        if timer is not None:
+            timer.render_started()
+            response.add_post_render_callback(timer.render_finished)
+        return response
+
+
+class QueryDetectorError(AssertionError):
+    """raised instead of logging when QUERY_DETECTOR_RAISE is on (tests)"""
+
+
+class QueryDetectorMiddleware:
+    """Flag requests repeating one sql shape (N+1) or running slow sql"""
+    # opt-in with QUERY_DETECTOR_ENABLED - fingerprinting every query is
+    # too much to leave on everywhere
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_DETECTOR_ENABLED:
+            return self.get_response(request)
+        detector = QueryDetector(
+            settings.QUERY_DETECTOR_REPEAT_THRESHOLD,
+            settings.QUERY_DETECTOR_SLOW_MS,
+        )
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(detector))
+            response = self.get_response(request)
+
+        findings = detector.findings()
+        if findings:
+            view, action = getattr(
+                request, '_query_detector_view', ('unmatched', ''),
+            )
+            message = (
+                f'{request.method} {request.path} ({view}.{action}):\n'
+                + '\n'.join(f'  {finding}' for finding in findings)
+            )
+            if settings.QUERY_DETECTOR_RAISE:
+                raise QueryDetectorError(message)
+            logger.warning('query detector - %s', message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_detector_view = metrics.view_label(
+            view_func, request.method,
+        )
+
+
+class CompressionMiddleware:
+    """brotli/gzip for text-like responses, buffered and streamed"""
+    # above SecurityMiddleware so Server-Timing totals include compressing;
+    # small bodies, compressed media and ranges go out as they are
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not settings.COMPRESSION_ENABLED:
+            return response
+        if not self._compressible(response):
+            return response
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        # the body depends on Accept-Encoding from here on, even when
+        # this client gets it uncompressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = compression.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+        if coding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, coding,
+            )
+            # the length isn't known until the last chunk
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            compressed = compression.compress(response.content, coding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # a strong etag promises the same bytes, which these aren't
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
+
+    @staticmethod
+    def _compressible(response):
+        if response.status_code in (204, 206, 304):
+            return False
+        if response.has_header('Content-Range'):
+            return False
+        if response.has_header('Content-Encoding'):
+            return False
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return False
+        return compression.is_compressible(response.get('Content-Type', ''))
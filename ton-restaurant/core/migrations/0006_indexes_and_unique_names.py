@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:13
+
+from django.db import migrations, models
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Point recipes at the oldest tag/ingredient per (user, name) and drop the rest"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        fk = model_name.lower()
+        keep = {}
+        for obj in model.objects.order_by('id').iterator():
+            key = (obj.user_id, obj.name)
+            if key not in keep:
+                keep[key] = obj.id
+                continue
+            for link in through.objects.filter(**{f'{fk}_id': obj.id}):
+                through.objects.get_or_create(
+                    recipe_id=link.recipe_id, **{f'{fk}_id': keep[key]}
+                )
+            obj.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_user_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_user_name'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:22
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = 'recipe_search_vector_gin'
+
+# same vector as core.search.search_vector_expression, spelled out so the
+# migration doesn't change when that module does
+BACKFILL_SQL = '''
+UPDATE core_recipe SET search_vector =
+    setweight(to_tsvector('english', COALESCE(title, '')), 'A')
+    || setweight(to_tsvector('english', COALESCE((
+        SELECT string_agg(t.name, ' ') FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = core_recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', COALESCE((
+        SELECT string_agg(i.name, ' ') FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = core_recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', COALESCE(description, '')), 'C')
+'''
+
+
+def create_index_and_backfill(apps, schema_editor):
+    """GIN index and initial vectors - postgres only, sqlite keeps the fallback"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX {INDEX_NAME} ON core_recipe USING gin (search_vector)'
+    )
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_index_and_backfill, drop_index),
+    ]
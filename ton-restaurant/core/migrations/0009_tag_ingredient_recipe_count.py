@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    """count the recipes already linked to each tag/ingredient"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for name, through in (('tag', Recipe.tags.through),
+                          ('ingredient', Recipe.ingredients.through)):
+        fk = f'{name}_id'
+        counts = (
+            through.objects.filter(**{fk: OuterRef('pk')})
+            .order_by().values(fk).annotate(count=Count('*')).values('count')
+        )
+        apps.get_model('core', name).objects.update(
+            recipe_count=Coalesce(Subquery(counts), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', '-id'], name='ingredient_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', '-id'], name='tag_user_count_idx'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
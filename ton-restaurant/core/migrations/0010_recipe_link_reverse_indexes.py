@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-17 15:10
+
+from django.db import migrations
+
+# the m2m tables only get (recipe_id, x_id) unique and single column
+# indexes - match=all groups the links of a few tags by recipe, which
+# (x_id, recipe_id) answers from the index alone
+INDEXES = [
+    ('recipe_tags_tag_recipe_idx', 'core_recipe_tags', 'tag_id'),
+    ('recipe_ingredients_ingredient_recipe_idx', 'core_recipe_ingredients',
+     'ingredient_id'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_tag_ingredient_recipe_count'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX {name} ON {table} ({column}, recipe_id)',
+            f'DROP INDEX {name}',
+        )
+        for name, table, column in INDEXES
+    ]
@@ -5,7 +5,8 @@ import uuid
 import os
 
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 # AbstarctBaseUser - contain functionality of auth system
 # Permissionmmixinb  - contain functionality for permisiions and fields
 # bauser
@@ -15,6 +16,9 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 
+from core import usage
+
+
 # helper fun - determine where to path to stor image
 def recipe_image_file_path(instance, filename):
     """generate file path for new recipe image"""
@@ -60,6 +64,23 @@ class User(AbstractBaseUser, PermissionsMixin):
     # replace default field that came with dj user model
     USERNAME_FIELD = 'email'
 
+
+class RecipeQuerySet(models.QuerySet):
+    """recipe deletes that keep the tag/ingredient counters right"""
+
+    def delete(self):
+        # the collector drops the link rows without m2m_changed - count
+        # them per tag/ingredient in one statement first, a pre_delete
+        # receiver would have to query once per recipe
+        with transaction.atomic(using=self.db, savepoint=False):
+            for model in (Tag, Ingredient):
+                usage.release_recipe_links(model, self)
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 # Model - base class simple model
 class Recipe(models.Model):
     """Recipe object"""
@@ -76,10 +97,34 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # resized copies of image - {width: {format: storage name}}
+    # filled in by the background worker after upload
+    image_variants = models.JSONField(default=dict, blank=True)
+    # title/description/tag/ingredient names for full text search, kept up
+    # to date by recipe.signals - only filled in on postgres
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        # every recipe query is WHERE user = ? ORDER BY id DESC
+        indexes = [
+            models.Index(
+                fields=['user', '-id'], name='recipe_user_id_desc_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            for model in (Tag, Ingredient):
+                usage.release_recipe_links(
+                    model, Recipe.objects.filter(pk=self.pk),
+                )
+            return super().delete(*args, **kwargs)
+
 
 class Tag(models.Model):
     """Tag object"""
@@ -88,6 +133,24 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # number of recipes using it, kept up to date by recipe.signals -
+    # recompute_usage_counts rebuilds it
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # unique index on (user, name) also serves the per-user name ordering
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_tag_user_name',
+            ),
+        ]
+        # most used first, and assigned_only as recipe_count > 0
+        indexes = [
+            models.Index(
+                fields=['user', '-recipe_count', '-id'],
+                name='tag_user_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -99,6 +162,24 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # number of recipes using it, kept up to date by recipe.signals -
+    # recompute_usage_counts rebuilds it
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # unique index on (user, name) also serves the per-user name ordering
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_ingredient_user_name',
+            ),
+        ]
+        # most used first, and assigned_only as recipe_count > 0
+        indexes = [
+            models.Index(
+                fields=['user', '-recipe_count', '-id'],
+                name='ingredient_user_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+parsers matching core/renderers.py - orjson backed json and messagepack
+"""
+import codecs
+
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from core.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+
+
+class ORJSONParser(parsers.JSONParser):
+    """JSONParser on orjson for utf-8 bodies"""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # rejects NaN/Infinity like drf's strict mode
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackParser(parsers.BaseParser):
+    """Parses messagepack request bodies"""
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
@@ -0,0 +1,66 @@
+"""
+faster renderers for the apis - orjson backed json and messagepack
+
+both render exactly what drf's JSONRenderer would encode, anything orjson
+or msgpack can't handle natively (lazy strings, raw decimals...) goes
+through drf's own JSONEncoder.default
+"""
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# str for lazy translations, float for decimals, isoformat for datetimes
+encoder_default = JSONEncoder().default
+
+if orjson is not None:
+    # datetimes through the drf encoder so they keep its format
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+# drf escapes these so the output stays a javascript subset
+_LINE_SEPARATORS = (
+    (b'\xe2\x80\xa8', b'\\u2028'),
+    (b'\xe2\x80\xa9', b'\\u2029'),
+)
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer on orjson, compact output only"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # orjson only indents by 2 and always writes utf-8 - pretty printing
+        # (the browsable api) and ascii output stay on the stdlib encoder
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (
+            orjson is None or data is None or self.ensure_ascii
+            or not self.compact or indent is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(
+            data, default=encoder_default, option=ORJSON_OPTIONS,
+        )
+        for raw, escaped in _LINE_SEPARATORS:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """Renders the same values as json, as messagepack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encoder_default, use_bin_type=True)
@@ -0,0 +1,87 @@
+"""
+full text search over recipes - postgres tsvector with a sqlite fallback
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import DecimalField, Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+
+
+def is_supported():
+    """tsvector search only exists on postgres"""
+    return connection.vendor == 'postgresql'
+
+
+def _names(model):
+    """space separated names of a recipe's tags/ingredients as a subquery"""
+    return Subquery(
+        model.objects.filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('name', delimiter=' '))
+        .values('names')[:1]
+    )
+
+
+def search_vector_expression(tag_model, ingredient_model):
+    """Weighted vector - title A, tags/ingredients B, description C"""
+    # models passed in so migrations can use their historical versions
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_names(tag_model), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(
+            _names(ingredient_model), weight='B', config=SEARCH_CONFIG,
+        )
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_model, tag_model, ingredient_model,
+                          queryset=None):
+    """Recompute the stored vector for some or all recipes in one UPDATE"""
+    if not is_supported():
+        return 0
+    if queryset is None:
+        queryset = recipe_model.objects.all()
+    return queryset.update(
+        search_vector=search_vector_expression(tag_model, ingredient_model),
+    )
+
+
+def search_recipes(queryset, term):
+    """Filter recipes matching term, annotated with search_rank"""
+    if is_supported():
+        query = SearchQuery(
+            term, search_type='websearch', config=SEARCH_CONFIG,
+        )
+        # ts_rank is a float4 - as numeric the rank round trips exactly
+        # through the pagination cursor
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query),
+                DecimalField(max_digits=10, decimal_places=6),
+            ),
+        )
+    # sqlite and friends - substring match on the same fields, unranked
+    # tag/ingredient names through EXISTS so recipes aren't duplicated
+    model = queryset.model
+    matches = Q()
+    for word in term.split():
+        matches &= (
+            Q(title__icontains=word)
+            | Q(description__icontains=word)
+            | Exists(model.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag__name__icontains=word,
+            ))
+            | Exists(model.ingredients.through.objects.filter(
+                recipe_id=OuterRef('pk'), ingredient__name__icontains=word,
+            ))
+        )
+    return queryset.filter(matches)
@@ -0,0 +1,16 @@
+"""
+test helpers shared by the app test suites
+"""
+from django.test import override_settings
+
+
+# class or method decorator - every api request made under it fails the
+# test when it repeats a sql shape more than `threshold` times. latency is
+# left alone, it depends on the machine running the tests
+def detect_n_plus_one(threshold=5):
+    return override_settings(
+        QUERY_DETECTOR_ENABLED=True,
+        QUERY_DETECTOR_RAISE=True,
+        QUERY_DETECTOR_REPEAT_THRESHOLD=threshold,
+        QUERY_DETECTOR_SLOW_MS=0,
+    )
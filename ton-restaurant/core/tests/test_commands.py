@@ -2,40 +2,430 @@
 Test custom django management commands
 """
 # mock behaviour of db
-from unittest.mock import patch
+from unittest.mock import ANY, Mock, patch
 
 # possible error when connecting to db
 from psycopg2 import OperationalError as Psycopg2Error
 
 # call cmd testing by its name
 from django.core.management import call_command
+from django.core.management.base import CommandError
 
+from django.core.files.base import ContentFile
+from django.db import connection, connections
 from django.db.utils import OperationalError
 
 # testing unitest - simpletestcase since no creating db
-from django.test import SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from decimal import Decimal
+import http.client
+from io import BytesIO, StringIO
+import json
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from benchmarks.clients import HttpClient, LocalClient
+from core.models import Recipe, Tag
+
 
 # decorator to mock behaviour
-@patch('core.management.commands.wait_for_db.Command.check')
+@patch('core.management.commands.wait_for_db.Command.probe')
 class CommandTest(SimpleTestCase):
     """Test commands."""
 
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_probe):
         """Test waiting for db when db is ready."""
-        patched_check.return_value = True
+        patched_probe.return_value = None
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
 
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_probe.assert_called_once_with('default', ANY)
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_probe):
         """Test waiting for db with delays."""
-        patched_check.side_effect = [Psycopg2Error] * 2 + \
-            [OperationalError] * 3 + [True]
+        patched_probe.side_effect = [Psycopg2Error] * 2 + \
+            [OperationalError] * 3 + [None]
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
         # 3 + 2 + true-v
-        self.assertEqual(patched_check.call_count, 6)
+        self.assertEqual(patched_probe.call_count, 6)
+
+        patched_probe.assert_called_with('default', ANY)
+        # jittered delays stay under a cap doubling from 0.1s
+        delays = [c.args[0] for c in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        for attempt, delay in enumerate(delays):
+            self.assertLessEqual(delay, 0.1 * 2 ** attempt)
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff_capped(self, patched_sleep, patched_probe):
+        """Test the backoff never exceeds --max-delay."""
+        patched_probe.side_effect = [OperationalError] * 10 + [None]
+
+        call_command('wait_for_db', max_delay=0.5, stdout=StringIO())
+
+        self.assertTrue(all(
+            c.args[0] <= 0.5 for c in patched_sleep.call_args_list
+        ))
+
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(self, patched_sleep, patched_probe):
+        """Test giving up once the timeout has passed."""
+        patched_probe.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0, stdout=StringIO())
+
+        patched_sleep.assert_not_called()
+
+
+@patch('core.management.commands.wait_for_db.probe')
+class WaitForDbConnectTimeoutTest(SimpleTestCase):
+    """Test each wait_for_db attempt connects with a bounded timeout."""
+
+    def setUp(self):
+        self.connection = connections['default']
+        vendor = patch.object(self.connection, 'vendor', 'postgresql')
+        vendor.start()
+        self.addCleanup(vendor.stop)
+
+    def capture_options(self, patched_probe):
+        seen = []
+        patched_probe.side_effect = lambda alias: seen.append(
+            dict(self.connection.settings_dict['OPTIONS']),
+        )
+        return seen
+
+    def test_connect_timeout_capped_by_deadline(self, patched_probe):
+        """Test the connect timeout is the time left before --timeout."""
+        seen = self.capture_options(patched_probe)
+        before = dict(self.connection.settings_dict['OPTIONS'])
+
+        call_command('wait_for_db', timeout=2.5, stdout=StringIO())
+
+        self.assertEqual(seen[0]['connect_timeout'], 3)
+        self.assertEqual(self.connection.settings_dict['OPTIONS'], before)
+
+    def test_configured_connect_timeout_kept_when_lower(self, patched_probe):
+        """Test a lower connect_timeout from settings is not raised."""
+        seen = self.capture_options(patched_probe)
+        options = {**self.connection.settings_dict['OPTIONS']}
+        with patch.dict(
+            self.connection.settings_dict,
+            {'OPTIONS': {**options, 'connect_timeout': 1}},
+        ):
+            call_command('wait_for_db', timeout=60, stdout=StringIO())
+
+        self.assertEqual(seen[0]['connect_timeout'], 1)
+
+
+class ExplainQueriesCommandTest(TestCase):
+    """Test the explain_queries command."""
+
+    def test_explain_queries_prints_plans_and_rolls_back(self):
+        """Test plans are printed and seeded rows discarded."""
+        out = StringIO()
+
+        call_command('explain_queries', recipes=20, attrs=5, stdout=out)
+
+        output = out.getvalue()
+        for label in ['recipe list', 'recipe filter by tag', 'tag list',
+                      'tag popular', 'ingredient list']:
+            self.assertIn(f'== {label}', output)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_explain_queries_keeps_existing_users(self):
+        """Test the throwaway user never collides with a real one."""
+        get_user_model().objects.create_user(
+            'explain-queries@example.com', 'pass',
+        )
+
+        call_command('explain_queries', recipes=5, attrs=2, stdout=StringIO())
+
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+
+class BenchmarkApiCommandTest(TestCase):
+    """Test the benchmark_api command."""
+
+    def test_local_benchmark_report(self):
+        """Test a small local run reports every scenario and rolls back."""
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'benchmark_api', users=1, recipes=5, requests=3, warmup=1,
+                scenarios='list,detail,create,token_login',
+                output=output.name, stdout=out,
+            )
+            report = json.load(output)
+
+        self.assertEqual(report['meta']['mode'], 'local')
+        self.assertEqual(
+            set(report['scenarios']),
+            {'list', 'detail', 'create', 'token_login'},
+        )
+        for stats in report['scenarios'].values():
+            self.assertEqual(stats['requests'], 3)
+            self.assertEqual(stats['errors'], 0)
+            self.assertIsNotNone(stats['queries_per_request'])
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(
+        LOGIN_THROTTLE_RATE_IP='1/min', LOGIN_THROTTLE_RATE_EMAIL='1/min',
+    )
+    def test_local_benchmark_not_throttled(self):
+        """Test seeding and token_login run with the login throttles off."""
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'benchmark_api', users=2, recipes=1, requests=5, warmup=1,
+                scenarios='token_login', output=output.name, stdout=out,
+            )
+            report = json.load(output)
+
+        self.assertEqual(report['scenarios']['token_login']['errors'], 0)
+
+    def test_local_benchmark_keeps_media_root_clean(self):
+        """Test uploads go to a scratch directory that is removed."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command(
+                'benchmark_api', users=1, recipes=2, requests=2, warmup=0,
+                scenarios='upload_image', stdout=StringIO(),
+            )
+
+        self.assertEqual(os.listdir(media_root), [])
+
+    def test_savepoints_not_counted(self):
+        """Test queries per request leave out atomic() savepoints."""
+        user = get_user_model().objects.create_user('bench@ton.com', 'pass')
+        token = Token.objects.create(user=user)
+
+        # the test case's own transaction makes every atomic() a savepoint
+        with CaptureQueriesContext(connection) as ctx:
+            result = LocalClient().request('POST', '/api/recipe/recipes/', {
+                'title': 'Chapati', 'time_minutes': 5, 'price': '1.00',
+            }, token=token.key)
+        sql = [q['sql'] for q in ctx.captured_queries]
+        savepoints = [q for q in sql if 'SAVEPOINT' in q]
+
+        self.assertEqual(result.status, 201)
+        self.assertTrue(savepoints)
+        self.assertEqual(result.queries, len(sql) - len(savepoints))
+
+
+class HttpClientRetryTest(SimpleTestCase):
+    """Test the benchmark http client only repeats idempotent requests."""
+
+    def setUp(self):
+        self.client = HttpClient('http://127.0.0.1:1')
+        self.stale = Mock()
+        self.stale.getresponse.side_effect = http.client.RemoteDisconnected
+        self.fresh = Mock()
+        self.fresh.getresponse.return_value.status = 200
+        self.fresh.getresponse.return_value.read.return_value = b'{}'
+        connection = patch.object(
+            HttpClient, '_connection', side_effect=[self.stale, self.fresh],
+        )
+        connection.start()
+        self.addCleanup(connection.stop)
+
+    def test_get_retried_on_new_connection(self):
+        """Test a read is sent again after the keep-alive dropped."""
+        result = self.client.request('GET', '/api/recipe/recipes/')
+
+        self.assertEqual(result.status, 200)
+        self.fresh.request.assert_called_once()
+
+    def test_post_not_retried(self):
+        """Test a write that may have reached the server is not repeated."""
+        with self.assertRaises(http.client.RemoteDisconnected):
+            self.client.request('POST', '/api/recipe/recipes/', data={})
+
+        self.fresh.request.assert_not_called()
+
+
+class BenchmarkFiltersCommandTest(TestCase):
+    """Test the benchmark_filters command."""
+
+    def test_filter_strategies_timed_per_id_count(self):
+        """Test every strategy is timed for every id count."""
+        out = StringIO()
+
+        call_command(
+            'benchmark_filters', recipes=30, tags=10, tags_per_recipe=3,
+            ids='1,5', repeats=2, stdout=out,
+        )
+
+        output = out.getvalue()
+        for strategy in ['join_distinct', 'exists', 'in_subquery',
+                         'having_count']:
+            self.assertEqual(output.count(strategy), 2)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecomputeUsageCountsCommandTest(TestCase):
+    """Test the recompute_usage_counts command."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass12345',
+        )
+        self.tag = Tag.objects.create(user=user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            user=user, title='Pancake', time_minutes=10, price=Decimal('4.00'),
+        )
+        recipe.tags.add(self.tag)
+        Tag.objects.filter(id=self.tag.id).update(recipe_count=7)
+
+    def test_check_reports_drift(self):
+        """Test --check lists drifted counters and fails without fixing."""
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command('recompute_usage_counts', check=True, stdout=out)
+
+        self.assertIn(f'Tag {self.tag.id}: stored 7, live 1', out.getvalue())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 7)
+
+    def test_recompute_fixes_drift(self):
+        """Test the counters are rebuilt from the recipe links."""
+        call_command('recompute_usage_counts', stdout=StringIO())
+
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 1)
+        call_command('recompute_usage_counts', check=True, stdout=StringIO())
+
+
+class RebuildImageVariantsCommandTest(TestCase):
+    """Test the rebuild_image_variants command."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123',
+        )
+        buffer = BytesIO()
+        Image.new('RGB', (700, 350)).save(buffer, format='JPEG')
+        # uploaded, but the worker went away before building variants
+        self.recipe = Recipe.objects.create(
+            user=user, title='Toast', time_minutes=5, price=Decimal('1.00'),
+        )
+        self.recipe.image.save('lost.jpg', ContentFile(buffer.getvalue()))
+        Recipe.objects.create(
+            user=user, title='No image', time_minutes=5,
+            price=Decimal('1.00'),
+        )
+
+    def test_check_reports_missing(self):
+        """Test --check lists recipes without variants and fails."""
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_image_variants', check=True, stdout=out)
+
+        self.assertIn(f'Recipe {self.recipe.id}:', out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def test_rebuilds_lost_variants(self):
+        """Test variants are built and attached, then the check passes."""
+        call_command('rebuild_image_variants', stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(set(self.recipe.image_variants), {'320', '640'})
+        call_command('rebuild_image_variants', check=True, stdout=StringIO())
+
+
+class ServingCommandsTest(TestCase):
+    """Test the check_serving and benchmark_serving commands."""
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_table',
+    }})
+    def test_check_serving_prints_profile(self):
+        """Test the derived profile and self-check result are shown."""
+        out = StringIO()
+
+        call_command('check_serving', cpus=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('workers             3', output)
+        self.assertIn('Serving profile OK.', output)
+
+    def test_check_serving_fails_on_locmem(self):
+        """Test several workers on the per process cache fail the check."""
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command('check_serving', cpus=2, stdout=out)
+
+        self.assertIn('locmem', out.getvalue())
+
+    def test_benchmark_serving_unknown_server(self):
+        """Test unknown servers are rejected before anything starts."""
+        with self.assertRaises(CommandError):
+            call_command(
+                'benchmark_serving', servers='apache', stdout=StringIO(),
+            )
+
+
+class BenchmarkHashersCommandTest(SimpleTestCase):
+    """Test the benchmark_hashers command."""
+
+    def test_reports_each_hasher(self):
+        """Test logins/sec are reported for the chosen hashers."""
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            call_command(
+                'benchmark_hashers', hashers='scrypt', verifies=2, threads=2,
+                output=f.name, stdout=out,
+            )
+            report = json.load(open(f.name))
+
+        self.assertEqual(set(report), {'scrypt'})
+        self.assertGreater(report['scrypt']['logins_per_sec'], 0)
+        self.assertIn('scrypt', out.getvalue())
+
+    def test_unknown_hasher(self):
+        """Test hashers missing from PASSWORD_HASHERS are rejected."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark_hashers', hashers='md5', stdout=StringIO())
+
+
+class BenchmarkRenderersCommandTest(SimpleTestCase):
+    """Test the benchmark_renderers command."""
+
+    def test_reports_each_format(self):
+        """Test encode/decode times are reported for the stdlib json."""
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            call_command(
+                'benchmark_renderers', recipes=5, repeat=1,
+                output=f.name, stdout=out,
+            )
+            report = json.load(open(f.name))
 
-        patched_check.assert_called_with(databases=['default'])
\ No newline at end of file
+        self.assertIn('json', report)
+        self.assertGreater(report['json']['bytes'], 0)
+        for stats in report.values():
+            self.assertEqual(set(stats), {'bytes', 'encode_ms', 'decode_ms'})
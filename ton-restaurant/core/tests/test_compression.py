@@ -0,0 +1,212 @@
+"""
+Test response compression negotiation and the middleware
+"""
+import gzip
+import io
+import json
+import unittest
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import compression
+from core.middleware import CompressionMiddleware
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+BODY = json.dumps(
+    [{'id': i, 'title': f'Recipe {i}'} for i in range(200)]
+).encode()
+
+needs_brotli = unittest.skipUnless(compression.brotli, 'brotli not installed')
+
+
+def middleware(response):
+    return CompressionMiddleware(lambda request: response)
+
+
+def json_response():
+    return HttpResponse(BODY, content_type='application/json')
+
+
+def get(accept_encoding='gzip, deflate, br'):
+    return RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+
+
+class NegotiationTests(SimpleTestCase):
+    """Test Accept-Encoding parsing and the level table"""
+
+    def test_client_q_wins(self):
+        """Test the highest q is picked, malformed entries ignored"""
+        choose = compression.choose_encoding
+        self.assertEqual(choose('gzip;q=1.0, br;q=0.5'), 'gzip')
+        self.assertEqual(choose('gzip;q=x, deflate'), None)
+        self.assertIsNone(choose(''))
+        self.assertIsNone(choose('identity'))
+
+    def test_q_zero_refuses(self):
+        """Test q=0 rules a coding out, also through *"""
+        self.assertIsNone(compression.choose_encoding('gzip;q=0'))
+        self.assertIsNone(compression.choose_encoding('*;q=0'))
+
+    @needs_brotli
+    def test_brotli_preferred_on_ties(self):
+        """Test br wins when the client rates it like gzip"""
+        choose = compression.choose_encoding
+        self.assertEqual(choose('gzip, deflate, br'), 'br')
+        self.assertEqual(choose('*'), 'br')
+
+    def test_gzip_without_brotli(self):
+        """Test br is never chosen when the library is missing"""
+        with mock.patch.object(compression, 'brotli', None):
+            choose = compression.choose_encoding
+            self.assertEqual(choose('br, gzip;q=0.5'), 'gzip')
+            self.assertIsNone(choose('br'))
+
+    def test_levels_drop_with_size(self):
+        """Test bigger and streamed bodies get cheaper levels"""
+        small, large, streamed = (
+            compression.levels(2048), compression.levels(5 * 1024 * 1024),
+            compression.levels(),
+        )
+
+        self.assertGreater(small[1], large[1])
+        self.assertEqual(large, streamed)
+
+    def test_compressible_types(self):
+        """Test text-like types pass and compressed media doesn't"""
+        compressible = (
+            'application/json', 'text/csv; charset=utf-8',
+            'application/problem+json', 'application/msgpack',
+        )
+        for content_type in compressible:
+            self.assertTrue(
+                compression.is_compressible(content_type), content_type,
+            )
+        for content_type in ('image/jpeg', 'application/zip', 'video/mp4', ''):
+            self.assertFalse(
+                compression.is_compressible(content_type), content_type,
+            )
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test what the middleware compresses and the headers it sets"""
+
+    def test_gzip(self):
+        """Test a json body is gzipped with length, vary and a weak etag"""
+        response = HttpResponse(BODY, content_type='application/json')
+        response['ETag'] = '"abc"'
+        res = middleware(response)(get('gzip'))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), BODY)
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(res['ETag'], 'W/"abc"')
+
+    @needs_brotli
+    def test_brotli(self):
+        """Test br is used when accepted"""
+        res = middleware(json_response())(get())
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(res.content), BODY)
+
+    def test_not_accepted(self):
+        """Test the body goes out as is but still varies on the header"""
+        res = middleware(json_response())(get('identity'))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, BODY)
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+
+    def test_skipped(self):
+        """Test small, binary, ranged, encoded and no-transform bodies pass"""
+        responses = [
+            HttpResponse(b'{"id": 1}', content_type='application/json'),
+            HttpResponse(BODY, content_type='image/png'),
+            HttpResponse(BODY, content_type='application/json', status=206),
+        ]
+        encoded = HttpResponse(BODY, content_type='application/json')
+        encoded['Content-Encoding'] = 'identity'
+        no_transform = HttpResponse(BODY, content_type='application/json')
+        no_transform['Cache-Control'] = 'private, no-transform'
+        responses += [encoded, no_transform]
+
+        for response in responses:
+            content = response.content
+            res = middleware(response)(get())
+            self.assertEqual(res.content, content)
+            self.assertNotEqual(res.get('Content-Encoding'), 'br')
+            self.assertFalse(res.has_header('Vary'))
+
+    @override_settings(COMPRESSION_ENABLED=False)
+    def test_disabled(self):
+        """Test COMPRESSION_ENABLED off leaves everything to the proxy"""
+        res = middleware(json_response())(get())
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        """Test each chunk is flushed as it comes and the length dropped"""
+        chunks = [BODY[:4000], BODY[4000:]]
+        response = StreamingHttpResponse(iter(chunks), content_type='text/csv')
+        response['Content-Length'] = str(len(BODY))
+        res = middleware(response)(get('gzip'))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        parts = list(res.streaming_content)
+        # the first chunk decodes on its own, before the stream ends
+        self.assertEqual(
+            gzip.GzipFile(fileobj=io.BytesIO(parts[0])).read1(),
+            chunks[0],
+        )
+        self.assertEqual(gzip.decompress(b''.join(parts)), BODY)
+
+
+class CompressedApiTests(TestCase):
+    """Test compression on the recipe endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@ton.com', 'testpass',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.bulk_create([
+            Recipe(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price='5.00',
+            )
+            for i in range(40)
+        ])
+
+    def test_recipe_list_gzipped(self):
+        """Test the list decompresses to what an uncompressed client gets"""
+        plain = self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertLess(len(res.content), len(plain.content) / 4)
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_export_streamed_gzipped(self):
+        """Test the streamed export is compressed chunk by chunk"""
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(res.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 40)
@@ -0,0 +1,87 @@
+"""
+Tests for the health checked postgres backend
+"""
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connections
+from django.test import SimpleTestCase
+
+from core.db import metrics
+from core.db.backends.postgresql.base import DatabaseWrapper
+
+
+@skipUnless(
+    isinstance(connections['default'], DatabaseWrapper),
+    'core postgres backend only',
+)
+class ConnectionHealthCheckTests(SimpleTestCase):
+    """Test persistent connections are checked, replaced and counted"""
+
+    def make_db(self, **settings):
+        # a private wrapper, so closing and breaking it can't disturb the
+        # connection the test runner is using
+        settings_dict = dict(connections['default'].settings_dict, **settings)
+        db = DatabaseWrapper(settings_dict, alias='health-check-test')
+        self.addCleanup(db.close)
+        return db
+
+    def delta(self, before):
+        after = metrics.snapshot()
+        return {
+            k: after[k] - before[k] for k in after if after[k] != before[k]
+        }
+
+    def request(self, db):
+        """one request's worth of work - a query then the request end hook"""
+        with db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        db.close_if_unusable_or_obsolete()
+
+    def test_connection_reused_and_checked_once_per_request(self):
+        """Test a kept connection is pinged on first use in a request"""
+        db = self.make_db(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        before = metrics.snapshot()
+
+        self.request(db)
+        with patch.object(db, 'is_usable', wraps=db.is_usable) as is_usable:
+            db.cursor().close()
+            db.cursor().close()
+
+        self.assertEqual(is_usable.call_count, 1)
+        self.assertEqual(self.delta(before), {'opened': 1, 'reused': 1})
+
+    def test_dead_connection_replaced(self):
+        """Test a connection dropped while idle is replaced transparently"""
+        db = self.make_db(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        self.request(db)
+        # as if the server or a proxy closed it between requests
+        db.connection.close()
+        before = metrics.snapshot()
+
+        self.request(db)
+
+        self.assertEqual(self.delta(before), {
+            'health_check_failed': 1, 'discarded': 1, 'opened': 1,
+        })
+
+    def test_health_checks_disabled(self):
+        """Test no ping is sent when CONN_HEALTH_CHECKS is off"""
+        db = self.make_db(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=False)
+        self.request(db)
+
+        with patch.object(db, 'is_usable') as is_usable:
+            self.request(db)
+
+        is_usable.assert_not_called()
+
+    def test_conn_max_age_zero_discards_per_request(self):
+        """Test CONN_MAX_AGE=0 closes the connection after each request"""
+        db = self.make_db(CONN_MAX_AGE=0)
+        before = metrics.snapshot()
+
+        self.request(db)
+        self.request(db)
+
+        self.assertEqual(self.delta(before), {'opened': 2, 'discarded': 2})
@@ -0,0 +1,44 @@
+"""
+Tests for the liveness and readiness endpoints
+"""
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase
+
+
+class HealthCheckTests(TestCase):
+    """Test the probes answered by HealthCheckMiddleware"""
+
+    def test_live_skips_db_and_host_checks(self):
+        """Test liveness answers any Host without querying the db"""
+        with self.assertNumQueries(0):
+            res = self.client.get('/health/live/', HTTP_HOST='10.0.0.5')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+        self.assertEqual(res['Cache-Control'], 'no-store')
+
+    def test_ready(self):
+        """Test readiness checks the database"""
+        with self.assertNumQueries(1):
+            res = self.client.get('/health/ready/', HTTP_HOST='10.0.0.5')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['checks'], {'database': 'ok'})
+
+    @patch('core.middleware.probe', side_effect=OperationalError('down'))
+    def test_not_ready_when_db_down(self, patched_probe):
+        """Test readiness fails with 503 and hides the error"""
+        with self.assertLogs('core.middleware', level='ERROR'):
+            res = self.client.get('/health/ready/')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks'], {'database': 'error'})
+        self.assertNotIn('down', res.content.decode())
+
+    def test_other_paths_untouched(self):
+        """Test everything else goes through the normal stack"""
+        res = self.client.get('/health/')
+
+        self.assertEqual(res.status_code, 404)
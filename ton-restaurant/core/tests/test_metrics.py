@@ -0,0 +1,182 @@
+"""
+Tests for the request metrics middleware and /metrics
+"""
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Tag
+
+TAGS_URL = '/api/recipe/tags/'
+
+
+class RequestMetricsTests(TestCase):
+    """Test per request timings and the prometheus registry"""
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123',
+        )
+        Tag.objects.create(user=self.user, name='Breakfast')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        """Test the response reports db, serialize, render, app and total"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL)
+
+        timing = res['Server-Timing']
+        for name in ('db', 'serialize', 'render', 'app', 'total'):
+            self.assertRegex(timing, rf'{name};dur=\d+\.\d\d')
+        self.assertIn(f'desc="{len(ctx)} queries"', timing)
+
+    def test_registry_keyed_by_view_and_action(self):
+        """Test viewset actions and plain views are labelled"""
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+        self.client.post('/api/user/token/', {'email': 'x', 'password': 'y'})
+        self.client.get('/no-such-page/')
+
+        snapshot = metrics.registry.snapshot()
+
+        count, _duration, queries, *_ = snapshot[('TagViewSet', 'list', '200')]
+        self.assertEqual(count, 2)
+        self.assertGreater(queries, 0)
+        self.assertIn(('CreateTokenView', 'post', '400'), snapshot)
+        self.assertIn(('unmatched', '', '404'), snapshot)
+
+    def test_serializer_timed_apart_from_rendering(self):
+        """Test serializer work and rendering land in their own series"""
+        self.client.get(TAGS_URL)
+
+        *_, serialize, render, _buckets = metrics.registry.snapshot()[
+            ('TagViewSet', 'list', '200')
+        ]
+
+        self.assertGreater(serialize, 0)
+        self.assertGreater(render, 0)
+
+    def test_serializing_skips_nested_and_sql(self):
+        """Test nested blocks count once and sql inside is left to db"""
+        timer = metrics.RequestTimer()
+        with timer.serializing():
+            with timer.serializing():
+                # stands in for a query run while serializing
+                timer.db += 10.0
+
+        self.assertGreaterEqual(timer.serialize, 0)
+        self.assertLess(timer.serialize, 1.0)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_server_timing_disabled(self):
+        """Test the header can be turned off"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(METRICS_PUBLIC=True)
+    def test_metrics_endpoint(self):
+        """Test /metrics renders the registry in prometheus text format"""
+        self.client.get(TAGS_URL)
+
+        res = self.client.get('/metrics')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(
+            res['Content-Type'].startswith('text/plain; version=0.0.4'),
+        )
+        body = res.content.decode()
+        self.assertRegex(
+            body,
+            r'http_requests_total\{view="TagViewSet",action="list",'
+            r'status="200"\} 1',
+        )
+        self.assertIn('http_request_duration_seconds_bucket{', body)
+        self.assertIn('le="+Inf"', body)
+        self.assertIn('db_connections_total{event="opened"', body)
+        # the scrape itself is not counted
+        self.assertNotIn('metrics_view', body)
+        for line in body.splitlines():
+            if not line.startswith('#'):
+                self.assertRegex(line, r'^[a-z_]+\{.*\} [0-9.e+-]+$')
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_token(self):
+        """Test a configured token is required to scrape"""
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+        res = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_metrics_hidden_without_token(self):
+        """Test the endpoint is off unless a token or METRICS_PUBLIC is set"""
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class SharedStoreTests(TestCase):
+    """Test metrics summed across worker processes"""
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.store = metrics.SharedStore(self.path)
+        self.store.reset()
+
+    def worker(self, count, db_opened):
+        return {
+            'requests': [[
+                'TagViewSet', 'list', '200', count, 0.5 * count, 2 * count,
+                0.1, 0.2, 0.3, [count] + [0] * len(metrics.BUCKETS),
+            ]],
+            'db': {'opened': db_opened},
+        }
+
+    def test_workers_summed_and_archived(self):
+        """Test a scrape sums every worker and exited workers are kept"""
+        self.store.write(101, self.worker(2, 1))
+        self.store.write(102, self.worker(3, 1))
+        self.store.archive(101)
+        self.store.write(103, self.worker(1, 1))
+        self.store.archive(103)
+
+        collected = self.store.collect()
+
+        count, duration, queries, *_, buckets = collected['requests'][
+            ('TagViewSet', 'list', '200')
+        ]
+        self.assertEqual((count, duration, queries), (6, 3.0, 12))
+        self.assertEqual(buckets[0], 6)
+        self.assertEqual(collected['db'], {'opened': 3})
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.path)
+                   if name.endswith('.json')),
+            ['archive.json', 'worker-102.json'],
+        )
+
+    def test_scrape_covers_other_workers(self):
+        """Test /metrics from one worker reports another's requests"""
+        self.store.write(999999, self.worker(4, 0))
+        with override_settings(
+            METRICS_MULTIPROCESS_DIR=self.path, METRICS_TOKEN='s3cret',
+        ):
+            body = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer s3cret',
+            ).content.decode()
+
+        self.assertIn(
+            'http_requests_total{view="TagViewSet",action="list",'
+            'status="200"} 4',
+            body,
+        )
+        self.assertNotIn('pid=', body)
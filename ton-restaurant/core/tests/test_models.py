@@ -5,6 +5,7 @@ from unittest.mock import patch
 from decimal import Decimal
 # base class fro tests
 from django.test import TestCase
+from django.db import IntegrityError
 # helper fun get default user model
 from django.contrib.auth import get_user_model
 
@@ -85,6 +86,17 @@ class ModelTests(TestCase):
         ingredient = models.Ingredient.objects.create(user=user, name='ingredient')
         self.assertEqual(str(ingredient), ingredient.name)
 
+    def test_tag_name_unique_per_user(self):
+        """test the same tag name can't be created twice for a user"""
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        models.Tag.objects.create(user=user, name='Tag1')
+        # other users may reuse the name
+        models.Tag.objects.create(user=other_user, name='Tag1')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Tag1')
+
     # uuid - unique identifier for the file going to test
     @patch('core.models.uuid.uuid4')
     def test_recipe_file_uuid(self, mock_uuid):
@@ -0,0 +1,143 @@
+"""
+Tests for the N+1 / slow query detector
+"""
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.db.detector import QueryDetector, allow_repeats, fingerprint
+from core.middleware import QueryDetectorError
+from core.models import Recipe, Tag
+from core.testing import detect_n_plus_one
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = '/api/recipe/recipes/'
+
+
+def fake_execute(sql, params, many, context):
+    return None
+
+
+class FingerprintTests(SimpleTestCase):
+    """Test sql is normalised to its shape"""
+
+    def test_literals_and_placeholders(self):
+        """Test values, placeholders and limits collapse to ?"""
+        self.assertEqual(
+            fingerprint(
+                "SELECT *  FROM t WHERE a = 'x''y' AND b = %s\n LIMIT 21"
+            ),
+            'SELECT * FROM t WHERE a = ? AND b = ? LIMIT ?',
+        )
+
+    def test_lists_of_any_length(self):
+        """Test IN lists and multi row VALUES collapse"""
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT 1 FROM t WHERE id IN (%s)'),
+        )
+        self.assertEqual(
+            fingerprint('INSERT INTO t2 (a, b) VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t2 (a, b) VALUES (?, ?), ...',
+        )
+
+
+class QueryDetectorTests(SimpleTestCase):
+    """Test the execute_wrapper findings"""
+
+    def run_queries(self, detector, sqls):
+        for sql in sqls:
+            detector(fake_execute, sql, [], False, {})
+
+    def test_repeated_shape_over_threshold(self):
+        """Test more than K runs of one shape is flagged once"""
+        detector = QueryDetector(repeat_threshold=3, slow_ms=0)
+
+        self.run_queries(detector, [
+            f'SELECT * FROM t WHERE id = {i}' for i in range(4)
+        ] + ['SAVEPOINT "s1"'] * 10)
+
+        [finding] = detector.findings()
+        self.assertEqual(finding.kind, 'repeated')
+        self.assertEqual(finding.count, 4)
+        self.assertEqual(finding.fingerprint, 'SELECT * FROM t WHERE id = ?')
+        self.assertTrue(
+            any('test_query_detector.py' in f for f in finding.stack)
+        )
+
+    def test_at_threshold_and_allowed_repeats_pass(self):
+        """Test K runs, or repeats inside allow_repeats, are fine"""
+        detector = QueryDetector(repeat_threshold=3, slow_ms=0)
+
+        self.run_queries(detector, ['SELECT 1'] * 3)
+        with allow_repeats():
+            self.run_queries(detector, ['SELECT 2'] * 10)
+
+        self.assertEqual(detector.findings(), [])
+
+    def test_slow_query(self):
+        """Test a query over the latency threshold is flagged"""
+        detector = QueryDetector(repeat_threshold=5, slow_ms=1)
+
+        def slow_execute(*args):
+            time.sleep(0.005)
+
+        detector(slow_execute, 'SELECT pg_sleep(%s)', [1], False, {})
+        detector(fake_execute, 'SELECT 1', [], False, {})
+
+        [finding] = detector.findings()
+        self.assertEqual(finding.kind, 'slow')
+        self.assertGreater(finding.duration_ms, 1)
+
+
+# the dropped prefetch below only matters on the serializer read path
+@override_settings(RECIPE_FAST_READS=False)
+class QueryDetectorMiddlewareTests(TestCase):
+    """Test requests with N+1 patterns are logged or fail tests"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass12345',
+        )
+        for i in range(8):
+            recipe = Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5,
+                price=Decimal('1.00'),
+            )
+            recipe.tags.add(Tag.objects.create(user=user, name=f'Tag {i}'))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        # as if the list prefetch were dropped - one tag query per recipe
+        plans = dict(RecipeViewSet.query_plans, list={})
+        patcher = patch.object(RecipeViewSet, 'query_plans', plans)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_off_by_default(self):
+        """Test nothing is checked unless enabled"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(QUERY_DETECTOR_ENABLED=True)
+    def test_n_plus_one_logged(self):
+        """Test the view, fingerprint and call site are logged"""
+        with self.assertLogs('core.middleware', level='WARNING') as logs:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        [message] = logs.output
+        self.assertIn('RecipeViewSet.list', message)
+        self.assertIn('repeated: 8 x SELECT', message)
+        self.assertIn('core_recipe_tags', message)
+        self.assertIn('recipe/', message)
+
+    @detect_n_plus_one()
+    def test_n_plus_one_fails_tests(self):
+        """Test the test helper turns a new N+1 into a failure"""
+        with self.assertRaises(QueryDetectorError):
+            self.client.get(RECIPES_URL)
@@ -0,0 +1,186 @@
+"""
+Test the orjson and messagepack renderers and parsers
+"""
+import datetime
+import io
+import unittest
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.parsers import MessagePackParser, ORJSONParser
+from core.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+PAYLOAD = OrderedDict([
+    ('id', 1),
+    ('title', 'Crème brûlée   "quoted"  '),
+    ('price', Decimal('5.50')),
+    ('label', gettext_lazy('Recipe')),
+    ('created', datetime.datetime(
+        2021, 6, 1, 12, 30, 15, 123456, datetime.timezone.utc,
+    )),
+    ('tags', [{'id': 2, 'name': 'Vegan', 'recipe_count': 0}]),
+    ('image', None),
+    ('variants', {320: {'jpeg': 'http://testserver/a.jpg'}}),
+    ('ok', True),
+    ('ratio', 0.1),
+])
+
+needs_orjson = unittest.skipUnless(orjson, 'orjson not installed')
+needs_msgpack = unittest.skipUnless(msgpack, 'msgpack not installed')
+
+
+@needs_orjson
+class ORJSONTests(SimpleTestCase):
+    """Test orjson renders and parses like drf's stdlib json classes"""
+
+    def test_render_matches_json_renderer(self):
+        """Test the output is byte for byte drf's"""
+        self.assertEqual(
+            ORJSONRenderer().render(PAYLOAD), JSONRenderer().render(PAYLOAD),
+        )
+
+    def test_indent_falls_back(self):
+        """Test pretty printing still uses the stdlib encoder"""
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(
+            ORJSONRenderer().render(PAYLOAD, media_type),
+            JSONRenderer().render(PAYLOAD, media_type),
+        )
+
+    def test_parse(self):
+        """Test bodies parse as the stdlib parser does"""
+        body = (
+            '{"title": "Crème", "price": 5.5, "tags": [{"name": "a"}]}'
+        ).encode()
+
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body)),
+        )
+
+    def test_parse_other_charset(self):
+        """Test a non utf-8 body is left to the stdlib parser"""
+        body = '{"title": "Crème"}'.encode('latin-1')
+
+        data = ORJSONParser().parse(
+            io.BytesIO(body), parser_context={'encoding': 'latin-1'},
+        )
+
+        self.assertEqual(data, {'title': 'Crème'})
+
+    def test_parse_errors(self):
+        """Test invalid json and NaN are parse errors"""
+        for body in (b'{"title": ', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
+
+
+@needs_msgpack
+class MessagePackTests(SimpleTestCase):
+    """Test messagepack carries the same values as json"""
+
+    def test_round_trip_matches_json(self):
+        """Test decimals, lazy strings and datetimes come out as in json"""
+        # messagepack keeps int map keys, json turns them into strings
+        payload = dict(PAYLOAD, variants={'320': PAYLOAD['variants'][320]})
+        rendered = MessagePackRenderer().render(payload)
+
+        data = MessagePackParser().parse(io.BytesIO(rendered))
+
+        rendered_json = JSONRenderer().render(payload)
+        expected = JSONParser().parse(io.BytesIO(rendered_json))
+        self.assertEqual(data, expected)
+        self.assertEqual(data['price'], 5.5)
+
+    def test_parse_errors(self):
+        """Test truncated and garbage bodies are parse errors"""
+        truncated = MessagePackRenderer().render({'a': 'b' * 10})[:-3]
+        for body in (truncated, b'\xc1'):
+            with self.assertRaises(ParseError):
+                MessagePackParser().parse(io.BytesIO(body))
+
+
+class NegotiationTests(TestCase):
+    """Test the api picks renderers and parsers by Accept/Content-Type"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user, title='Tarte', time_minutes=20,
+            price=Decimal('7.10'),
+        )
+
+    def test_json_by_default(self):
+        """Test clients accepting anything get json"""
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='*/*')
+
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertEqual(res.json()['results'][0]['price'], '7.10')
+
+    @needs_msgpack
+    def test_msgpack_list(self):
+        """Test the same list comes back as messagepack"""
+        json_res = self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(res.content), json_res.json())
+        # separate representations, separately validated
+        self.assertNotEqual(res['ETag'], json_res['ETag'])
+        self.assertIn('Accept', res['Vary'])
+
+    @needs_msgpack
+    def test_msgpack_create(self):
+        """Test a messagepack body creates a recipe"""
+        body = msgpack.packb({
+            'title': 'Soupe', 'time_minutes': 5, 'price': '3.25',
+            'tags': [{'name': 'Hot'}],
+        })
+
+        res = self.client.post(
+            RECIPES_URL, body, content_type='application/msgpack',
+            HTTP_ACCEPT='application/msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        data = msgpack.unpackb(res.content)
+        self.assertEqual(data['price'], '3.25')
+        self.assertEqual(data['tags'][0]['name'], 'Hot')
+
+    @needs_msgpack
+    def test_msgpack_token_login(self):
+        """Test the token view takes the configured parsers too"""
+        self.client.force_authenticate(None)
+
+        res = self.client.post(
+            TOKEN_URL,
+            msgpack.packb(
+                {'email': 'user@example.com', 'password': 'testpass123'},
+            ),
+            content_type='application/msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.json())
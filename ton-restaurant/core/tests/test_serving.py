@@ -0,0 +1,109 @@
+"""
+Tests for the production serving profile
+"""
+from django.test import TestCase, override_settings
+
+from ton_restaurant import serving
+
+
+class WorkerProfileTests(TestCase):
+    """Test gunicorn settings derived from the cpu count"""
+
+    def test_gthread_default(self):
+        """Test gthread runs cores + 1 processes with a few threads"""
+        profile = serving.worker_profile(cpu_count=4, environ={})
+
+        self.assertEqual(profile['worker_class'], 'gthread')
+        self.assertEqual(
+            profile['wsgi_app'], 'ton_restaurant.wsgi:application',
+        )
+        self.assertEqual((profile['workers'], profile['threads']), (5, 4))
+        self.assertEqual(profile['max_requests_jitter'], 100)
+        self.assertTrue(profile['preload_app'])
+
+    def test_sync_and_uvicorn_sized_per_core(self):
+        """Test single threaded workers follow 2 * cores + 1, capped"""
+        sync = serving.worker_profile(2, {'WEB_WORKER_CLASS': 'sync'})
+        self.assertEqual((sync['workers'], sync['threads']), (5, 1))
+
+        asgi = serving.worker_profile(16, {'WEB_WORKER_CLASS': 'uvicorn'})
+        self.assertEqual(asgi['wsgi_app'], 'ton_restaurant.asgi:application')
+        self.assertEqual(asgi['workers'], 12)
+
+    def test_env_overrides(self):
+        """Test WEB_* variables win over the derived values"""
+        profile = serving.worker_profile(4, {
+            'WEB_CONCURRENCY': '2', 'WEB_THREADS': '8',
+            'WEB_KEEPALIVE': '75', 'WEB_PRELOAD': '0',
+        })
+
+        self.assertEqual((profile['workers'], profile['threads']), (2, 8))
+        self.assertEqual(profile['keepalive'], 75)
+        self.assertFalse(profile['preload_app'])
+
+    def test_invalid_env(self):
+        """Test unknown worker classes and non-integers are rejected"""
+        with self.assertRaises(ValueError):
+            serving.worker_profile(1, {'WEB_WORKER_CLASS': 'eventlet'})
+        with self.assertRaises(ValueError):
+            serving.worker_profile(1, {'WEB_CONCURRENCY': 'many'})
+
+
+class SelfCheckTests(TestCase):
+    """Test the startup self-check"""
+
+    def test_locmem_cache_with_many_workers_is_error(self):
+        """Test a per process cache fails the check with several workers"""
+        profile = serving.worker_profile(2, {})
+
+        errors, _ = serving.self_check(profile)
+
+        self.assertTrue(any('locmem' in e for e in errors))
+
+    def test_login_throttle_on_locmem_is_error(self):
+        """Test login rates kept per worker fail the check"""
+        profile = serving.worker_profile(2, {})
+
+        errors, _ = serving.self_check(profile)
+        with override_settings(
+            LOGIN_THROTTLE_RATE_IP='', LOGIN_THROTTLE_RATE_EMAIL='',
+        ):
+            unthrottled, _ = serving.self_check(profile)
+
+        self.assertTrue(any('login throttling' in e for e in errors))
+        self.assertFalse(any('login throttling' in e for e in unthrottled))
+
+    def test_locmem_cache_with_one_worker(self):
+        """Test a single worker may keep the per process cache"""
+        profile = serving.worker_profile(2, {'WEB_CONCURRENCY': '1'})
+
+        errors, _ = serving.self_check(profile)
+
+        self.assertEqual(errors, [])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_table',
+    }})
+    def test_shared_cache_with_many_workers(self):
+        """Test a shared cache passes with several workers"""
+        profile = serving.worker_profile(2, {})
+
+        errors, _ = serving.self_check(profile)
+
+        self.assertEqual(errors, [])
+
+    @override_settings(RECIPE_IMAGE_WORKERS=1)
+    def test_db_connections_needed(self):
+        """Test the connection budget counts threads and image workers"""
+        profile = serving.worker_profile(3, {})
+
+        self.assertEqual(serving.db_connections_needed(profile), 4 * 5)
+
+    def test_invalid_profile_is_error(self):
+        """Test zero workers fails the check"""
+        profile = serving.worker_profile(1, {'WEB_CONCURRENCY': '0'})
+
+        errors, _ = serving.self_check(profile)
+
+        self.assertIn('workers and threads must be at least 1', errors)
@@ -0,0 +1,75 @@
+"""
+denormalized tag/ingredient usage counters - recipe_count on each row is
+the number of recipes linked to it
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _links(model):
+    """the recipe through table for model and its fk column"""
+    # reverse accessor so migrations can pass historical models
+    return model.recipe_set.through, f'{model._meta.model_name}_id'
+
+
+def live_count(model):
+    """correlated COUNT of the recipes linked to each row"""
+    through, fk = _links(model)
+    counts = through.objects.filter(**{fk: OuterRef('pk')}).order_by().values(
+        fk).annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
+
+def apply_usage_deltas(model, deltas):
+    """Add {id: delta} to the counters, one UPDATE per distinct delta"""
+    # relative UPDATEs take the row lock before reading the counter so
+    # concurrent links to the same tag don't overwrite each other
+    by_delta = defaultdict(list)
+    for obj_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(obj_id)
+    for delta, ids in by_delta.items():
+        model.objects.filter(id__in=ids).update(
+            recipe_count=F('recipe_count') + delta,
+        )
+
+
+def release_recipe_links(model, recipes):
+    """
+    Take the links of recipes (a queryset, before it is deleted) off the
+    counters - one UPDATE however many recipes and links there are
+    """
+    through, fk = _links(model)
+    links = through.objects.filter(recipe_id__in=recipes.values('id'))
+    released = links.filter(**{fk: OuterRef('pk')}).order_by().values(
+        fk).annotate(count=Count('*')).values('count')
+    return model.objects.filter(id__in=links.values(fk)).update(
+        recipe_count=F('recipe_count') - Subquery(released),
+    )
+
+
+def refresh_usage_counts(model, queryset=None):
+    """Recompute the drifted counters for some or all rows in one UPDATE"""
+    if queryset is None:
+        queryset = model.objects.all()
+    # only rows that are wrong - a clean table writes nothing, so a check
+    # run doesn't churn every row and its index entries
+    drifted = queryset.annotate(live_count=live_count(model)).exclude(
+        recipe_count=F('live_count'))
+    return model.objects.filter(id__in=drifted.values('id')).update(
+        recipe_count=live_count(model),
+    )
+
+
+def usage_drift(model, queryset=None):
+    """(id, stored, live) for every row whose counter is wrong"""
+    if queryset is None:
+        queryset = model.objects.all()
+    return list(
+        queryset.annotate(live_count=live_count(model))
+        .exclude(recipe_count=F('live_count'))
+        .order_by('id')
+        .values_list('id', 'recipe_count', 'live_count')
+    )
@@ -0,0 +1,27 @@
+"""
+project level views
+"""
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from core import metrics
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape of the server's request metrics"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        given = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(given.encode(), expected.encode()):
+            return HttpResponse(status=401)
+    elif not settings.METRICS_PUBLIC:
+        # per view timings are not for everyone - no token, no endpoint
+        raise Http404
+    return HttpResponse(
+        metrics.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
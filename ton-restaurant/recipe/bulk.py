@@ -0,0 +1,238 @@
+"""
+bulk create/update/delete of recipes in one request
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import usage
+from core.db.detector import allow_repeats
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_generation
+from recipe.signals import schedule_search_refresh
+from recipe.serializers import RecipeSerializer, get_or_create_attrs
+
+# nested field -> (model, m2m field on Recipe)
+RELATIONS = {
+    'tags': (Tag, 'tags'),
+    'ingredients': (Ingredient, 'ingredients'),
+}
+
+
+class BulkValidationError(Exception):
+    """raised with the per-item error report, nothing was written"""
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _is_id(value):
+    # bools are ints to python but not ids
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _validate(user, payload, context):
+    """
+    validate every item, collecting errors by operation and index - run
+    inside the transaction, the recipes to update are locked as loaded
+    """
+    errors = {}
+    operations = {}
+    for name in ('create', 'update', 'delete'):
+        value = payload.get(name)
+        if value is None:
+            value = []
+        elif not isinstance(value, list):
+            errors[name] = ['Expected a list.']
+            value = []
+        operations[name] = value
+    create_data, update_data, delete_ids = (
+        operations['create'], operations['update'], operations['delete'],
+    )
+
+    total = len(create_data) + len(update_data) + len(delete_ids)
+    if total > settings.RECIPE_BULK_MAX_ITEMS:
+        raise BulkValidationError({
+            'non_field_errors': [
+                f'At most {settings.RECIPE_BULK_MAX_ITEMS} items per request.'
+            ],
+        })
+
+    created = []
+    for index, item in enumerate(create_data):
+        serializer = RecipeSerializer(data=item, context=context)
+        if serializer.is_valid():
+            created.append(serializer.validated_data)
+        else:
+            errors.setdefault('create', {})[index] = serializer.errors
+
+    # one query for every recipe being updated, locked until commit so a
+    # concurrent write can't land between validating and saving
+    update_ids = [
+        item.get('id') for item in update_data
+        if isinstance(item, dict) and _is_id(item.get('id'))
+    ]
+    instances = {
+        recipe.id: recipe for recipe in Recipe.objects.select_for_update()
+        .filter(user=user, id__in=update_ids).order_by('id')
+    } if update_ids else {}
+    updated = []
+    for index, item in enumerate(update_data):
+        if not isinstance(item, dict):
+            errors.setdefault('update', {})[index] = {
+                'non_field_errors': ['Expected an object.'],
+            }
+            continue
+        if not _is_id(item.get('id')):
+            errors.setdefault('update', {})[index] = {
+                'id': ['A valid integer is required.'],
+            }
+            continue
+        instance = instances.get(item['id'])
+        if instance is None:
+            errors.setdefault('update', {})[index] = {'id': ['Not found.']}
+            continue
+        serializer = RecipeSerializer(
+            instance, data=item, partial=True, context=context,
+        )
+        if serializer.is_valid():
+            updated.append((instance, serializer.validated_data))
+        else:
+            errors.setdefault('update', {})[index] = serializer.errors
+
+    valid_delete_ids = [i for i in delete_ids if _is_id(i)]
+    found = set(Recipe.objects.filter(
+        user=user, id__in=valid_delete_ids,
+    ).values_list('id', flat=True)) if valid_delete_ids else set()
+    for index, recipe_id in enumerate(delete_ids):
+        if not _is_id(recipe_id):
+            errors.setdefault('delete', {})[index] = [
+                'A valid integer is required.',
+            ]
+        elif recipe_id not in found:
+            errors.setdefault('delete', {})[index] = ['Not found.']
+
+    if errors:
+        raise BulkValidationError(errors)
+    return created, updated, list(found)
+
+
+def _update_recipes(updated):
+    """save the fields each item sent, one bulk_update per set of fields"""
+    by_fields = defaultdict(list)
+    for instance, data in updated:
+        fields = tuple(sorted(attr for attr in data if attr not in RELATIONS))
+        for attr in fields:
+            setattr(instance, attr, data[attr])
+        if fields:
+            by_fields[fields].append(instance)
+    for fields, instances in by_fields.items():
+        Recipe.objects.bulk_update(instances, list(fields))
+
+
+def _resolve_relations(user, items):
+    """get or create every tag/ingredient named anywhere in the batch"""
+    resolved = {}
+    for field, (model, _) in RELATIONS.items():
+        names = [
+            attr for data in items for attr in (data.get(field) or [])
+        ]
+        resolved[field] = {
+            obj.name: obj for obj in get_or_create_attrs(model, user, names)
+        }
+    return resolved
+
+
+def _create_recipes(user, created):
+    """insert the new recipes, in one query where the db returns ids"""
+    recipes = [
+        Recipe(user=user, **{
+            k: v for k, v in data.items() if k not in RELATIONS
+        })
+        for data in created
+    ]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Recipe.objects.bulk_create(recipes)
+    # eg sqlite - ids are needed for the relation rows
+    with allow_repeats():
+        for recipe in recipes:
+            recipe.save()
+    return recipes
+
+
+def _set_relations(recipes_with_data, resolved, replace):
+    """write relation rows for many recipes with one delete/insert each"""
+    for field, (model, m2m_field) in RELATIONS.items():
+        through = getattr(Recipe, m2m_field).through
+        fk = f'{model.__name__.lower()}_id'
+        wanted = {}
+        for recipe, data in recipes_with_data:
+            if data.get(field) is None:
+                continue
+            wanted[recipe.id] = {
+                resolved[field][attr['name']].id for attr in data[field]
+            }
+        if not wanted:
+            continue
+
+        existing = {}
+        # direct through table writes skip m2m_changed, so the usage
+        # counters are adjusted here
+        deltas = defaultdict(int)
+        if replace:
+            rows = through.objects.filter(
+                recipe_id__in=wanted,
+            ).values_list('id', 'recipe_id', fk)
+            stale = []
+            for row_id, recipe_id, attr_id in rows:
+                if attr_id in wanted[recipe_id]:
+                    existing.setdefault(recipe_id, set()).add(attr_id)
+                else:
+                    stale.append(row_id)
+                    deltas[attr_id] -= 1
+            if stale:
+                through.objects.filter(id__in=stale).delete()
+
+        links = [
+            through(recipe_id=recipe_id, **{fk: attr_id})
+            for recipe_id, attr_ids in wanted.items()
+            for attr_id in attr_ids - existing.get(recipe_id, set())
+        ]
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        for link in links:
+            deltas[getattr(link, fk)] += 1
+        usage.apply_usage_deltas(model, deltas)
+
+
+def apply_bulk(user, payload, context):
+    """Validate then create/update/delete recipes in one transaction"""
+    with transaction.atomic():
+        created, updated, delete_ids = _validate(user, payload, context)
+        resolved = _resolve_relations(
+            user, created + [data for _, data in updated],
+        )
+
+        new_recipes = _create_recipes(user, created)
+        _set_relations(
+            list(zip(new_recipes, created)), resolved, replace=False,
+        )
+
+        _update_recipes(updated)
+        _set_relations(updated, resolved, replace=True)
+
+        Recipe.objects.filter(user=user, id__in=delete_ids).delete()
+
+    # bulk writes skip the model signals the list cache and search
+    # vectors listen to
+    bump_generation(user.pk)
+    schedule_search_refresh(
+        [recipe.id for recipe in new_recipes]
+        + [instance.id for instance, _ in updated]
+    )
+
+    return {
+        'created': [recipe.id for recipe in new_recipes],
+        'updated': [instance.id for instance, _ in updated],
+        'deleted': delete_ids,
+    }
@@ -0,0 +1,93 @@
+"""
+per-user response cache for recipe list apis
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _generation_key(user_id):
+    return f'recipe-gen:{user_id}'
+
+
+def get_generation(user_id):
+    """Return the current cache generation for a user"""
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # start from the clock - if the counter is evicted a new one never
+        # lands on a generation that still has list entries cached
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(user_id):
+    """Invalidate every cached list for a user"""
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # counter missing - any fresh value invalidates old entries
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def etag_matches(header, etag):
+    """whether an If-None-Match header matches etag, compared weakly"""
+    etags = parse_etags(header or '')
+    if etags == ['*']:
+        return True
+    # the compression middleware hands out W/ versions of our etags
+    return any(
+        (tag[2:] if tag.startswith('W/') else tag) == etag for tag in etags
+    )
+
+
+class CachedListMixin:
+    """Cache list responses per user, query params and generation"""
+    # old generations are never read again so a short timeout only
+    # controls how long dead entries take up memory
+    list_cache_timeout = settings.RECIPE_LIST_CACHE_TIMEOUT
+
+    def _list_cache_key(self, request):
+        params = sorted(request.query_params.lists())
+        generation = get_generation(request.user.pk)
+        # json and msgpack bodies are different representations, each needs
+        # its own etag
+        media_type = request.accepted_media_type
+        raw = (
+            f'{self.basename}:{request.user.pk}:{generation}:{params}:'
+            f'{media_type}'
+        )
+        return 'recipe-list:' + hashlib.md5(raw.encode()).hexdigest()
+
+    def _finalize_list_response(self, response, etag):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Authorization', 'Accept'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """List with a per-user cache and ETag revalidation"""
+        key = self._list_cache_key(request)
+        # etag is derived from the key so a match needs no db or serializer
+        etag = f'"{key.split(":")[1]}"'
+
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return self._finalize_list_response(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag,
+            )
+
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, self.list_cache_timeout)
+
+        return self._finalize_list_response(Response(data), etag)
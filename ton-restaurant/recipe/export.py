@@ -0,0 +1,73 @@
+"""
+streaming export of a user's recipes
+"""
+import csv
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import Recipe
+from recipe.serializers import RecipeDetailSerializer
+
+CSV_COLUMNS = [
+    'id', 'title', 'time_minutes', 'price', 'link',
+    'description', 'image', 'tags', 'ingredients',
+]
+
+
+def iter_recipe_chunks(queryset, chunk_size):
+    """Yield lists of recipes with tags/ingredients prefetched per chunk"""
+    # ids come off a server side cursor so the full id list never sits in
+    # memory, each chunk is then loaded with its own prefetch queries
+    ids = queryset.values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    chunk = []
+    for recipe_id in ids:
+        chunk.append(recipe_id)
+        if len(chunk) == chunk_size:
+            yield _load_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield _load_chunk(chunk)
+
+
+def _load_chunk(ids):
+    # the search vector is never exported and is the widest column
+    recipes = Recipe.objects.filter(id__in=ids).defer(
+        'search_vector',
+    ).prefetch_related('tags', 'ingredients').in_bulk()
+    # keep the export order, in_bulk returns a dict keyed by id
+    return [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes]
+
+
+def iter_jsonl(queryset, context, chunk_size):
+    """One RecipeDetailSerializer object per line"""
+    for chunk in iter_recipe_chunks(queryset, chunk_size):
+        data = RecipeDetailSerializer(chunk, many=True, context=context).data
+        yield ''.join(
+            json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n'
+            for row in data
+        )
+
+
+class _Echo:
+    """file-like object csv.writer can write to, returns the line"""
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, context, chunk_size):
+    """Header then one row per recipe, tags/ingredients joined by ;"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for chunk in iter_recipe_chunks(queryset, chunk_size):
+        data = RecipeDetailSerializer(chunk, many=True, context=context).data
+        lines = []
+        for row in data:
+            row['tags'] = ';'.join(tag['name'] for tag in row['tags'])
+            row['ingredients'] = ';'.join(
+                ingredient['name'] for ingredient in row['ingredients']
+            )
+            lines.append(writer.writerow(
+                ['' if row[col] is None else row[col] for col in CSV_COLUMNS]
+            ))
+        yield ''.join(lines)
@@ -0,0 +1,233 @@
+"""
+read fast path for recipe list/retrieve - rows come from values() and are
+projected straight into the dicts the serializers would build, nested
+tags/ingredients from one values query per relation
+
+no model instances and no per instance walk over ModelSerializer fields,
+but each value still goes through the serializer field that would have
+rendered it, so the output is the same - test_fastpath.py holds it to that
+"""
+import functools
+import operator
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from core.metrics import serializing
+from recipe.fields import field_names
+
+# to_representation of these returns what the database hands back as is
+_PASSTHROUGH = (
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+)
+
+COPY, CONVERT, FILE, METHOD, NESTED = range(5)
+
+
+class UnsupportedField(Exception):
+    """a serializer field the fast path can't project"""
+
+
+class _Row:
+    """attribute access to a values() row, for serializer method fields"""
+    __slots__ = ('_row',)
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        try:
+            return self._row[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class Projection:
+    """
+    Precompiled fields of a serializer - the columns to fetch and how each
+    output value is made from a row
+    """
+    def __init__(self, serializer_class, fields):
+        model = serializer_class.Meta.model
+        declared = serializer_class().fields
+        self.pk = model._meta.pk.attname
+        self.columns = [self.pk]
+        self.steps = []
+        for name in fields:
+            field = declared[name]
+            if isinstance(field, serializers.ListSerializer):
+                relation = self._model_field(model, field.source)
+                if not relation.many_to_many or not isinstance(
+                    field.child, serializers.ModelSerializer,
+                ):
+                    raise UnsupportedField(name)
+                child = Projection(
+                    type(field.child), tuple(field.child.fields),
+                )
+                self.steps.append((name, NESTED, (relation, child)))
+            elif isinstance(field, serializers.SerializerMethodField):
+                # method fields are named after the column they read, as in
+                # recipe.fields.load_plan
+                self._add_column(model, name)
+                self.steps.append((name, METHOD, None))
+            elif isinstance(field, serializers.Serializer):
+                raise UnsupportedField(name)
+            else:
+                if field.source == '*' or '.' in field.source:
+                    raise UnsupportedField(name)
+                model_field = self._add_column(model, field.source)
+                if isinstance(field, serializers.FileField):
+                    kind = FILE
+                elif type(field).to_representation in _PASSTHROUGH:
+                    kind = COPY
+                else:
+                    kind = CONVERT
+                self.steps.append((name, kind, (field.source, model_field)))
+
+    @staticmethod
+    def _model_field(model, name):
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise UnsupportedField(name)
+
+    def _add_column(self, model, name):
+        model_field = self._model_field(model, name)
+        if not model_field.concrete or model_field.is_relation:
+            raise UnsupportedField(name)
+        if name not in self.columns:
+            self.columns.append(name)
+        return model_field
+
+    def _load_nested(self, relation, child, pks, child_serializer):
+        """{pk: [rendered child, ...]} in child id order"""
+        through = relation.remote_field.through
+        source = through._meta.get_field(relation.m2m_field_name()).attname
+        target = relation.m2m_reverse_field_name()
+        rows = through.objects.filter(**{f'{source}__in': pks}).order_by(
+            f'{target}__{child.pk}',
+        ).values_list(source, *[f'{target}__{c}' for c in child.columns])
+        owners, child_rows = [], []
+        for owner, *values in rows:
+            owners.append(owner)
+            child_rows.append(dict(zip(child.columns, values)))
+        grouped = {}
+        rendered = child.render(child_rows, child_serializer)
+        for owner, item in zip(owners, rendered):
+            grouped.setdefault(owner, []).append(item)
+        return grouped
+
+    def _getters(self, rows, serializer):
+        bound = serializer.fields
+        getters = []
+        for name, kind, arg in self.steps:
+            if kind == COPY:
+                getter = operator.itemgetter(arg[0])
+            elif kind == CONVERT:
+                def getter(row, column=arg[0],
+                           convert=bound[name].to_representation):
+                    value = row[column]
+                    return None if value is None else convert(value)
+            elif kind == FILE:
+                # the serializer field takes the FieldFile a model would hold
+                def getter(row, column=arg[0], model_field=arg[1],
+                           convert=bound[name].to_representation):
+                    value = row[column]
+                    if value is None:
+                        return None
+                    return convert(
+                        model_field.attr_class(None, model_field, value),
+                    )
+            elif kind == METHOD:
+                def getter(row, method=getattr(
+                        serializer, bound[name].method_name)):
+                    return method(_Row(row))
+            else:
+                relation, child = arg
+                grouped = self._load_nested(
+                    relation, child, [row[self.pk] for row in rows],
+                    bound[name].child,
+                ) if rows else {}
+
+                def getter(row, grouped=grouped):
+                    return grouped.get(row[self.pk], [])
+            getters.append((name, getter))
+        return getters
+
+    def render(self, rows, serializer):
+        """rows from values(*columns) as serializer would render them"""
+        getters = self._getters(rows, serializer)
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+@functools.lru_cache(maxsize=256)
+def compile_projection(serializer_class, fields):
+    """Projection of fields, None when one of them can't be projected"""
+    try:
+        return Projection(serializer_class, fields)
+    except UnsupportedField:
+        return None
+
+
+class FastReadMixin:
+    """
+    list and retrieve through a Projection when the serializer compiles to
+    one, for viewsets with SparseFieldsMixin
+
+    object permissions are not checked, get_queryset has to scope the rows
+    to what the user may read
+    """
+    def _projection(self):
+        if not settings.RECIPE_FAST_READS:
+            return None
+        serializer_class = self.get_serializer_class()
+        return compile_projection(
+            serializer_class,
+            self.sparse_fields or field_names(serializer_class),
+        )
+
+    def _rows(self, queryset, projection, extra=()):
+        columns = dict.fromkeys([*projection.columns, *extra])
+        # prefetches are for instances, values() rows get theirs from render
+        return queryset.prefetch_related(None).values(*columns)
+
+    def list(self, request, *args, **kwargs):
+        projection = self._projection()
+        if projection is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        # the cursor is read from the ordering columns of the last row
+        ordering = ()
+        if hasattr(self.paginator, 'get_ordering'):
+            ordering = self.paginator.get_ordering(request, queryset, self)
+        rows = self._rows(
+            queryset, projection, [o.lstrip('-') for o in ordering],
+        )
+        page = self.paginate_queryset(rows)
+        paginated = page is not None
+        if not paginated:
+            page = list(rows)
+        # the nested values queries inside are counted as db, not here
+        with serializing(request):
+            data = projection.render(page, self.get_serializer())
+        if paginated:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        projection = self._projection()
+        if projection is None:
+            return super().retrieve(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self._rows(queryset, projection),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        with serializing(request):
+            data = projection.render([row], self.get_serializer())[0]
+        return Response(data)
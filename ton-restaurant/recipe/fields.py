@@ -0,0 +1,127 @@
+"""
+sparse fieldsets - ?fields= / ?exclude= trim what a read returns, and the
+queryset only loads the columns and relations those fields read
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+@functools.lru_cache(maxsize=None)
+def field_names(serializer_class):
+    """the fields a serializer returns, in its order"""
+    return tuple(serializer_class().fields)
+
+
+def selected_fields(query_params, available):
+    """names kept by fields/exclude in serializer order, None if not sent"""
+    if FIELDS_PARAM not in query_params and EXCLUDE_PARAM not in query_params:
+        return None
+    chosen = list(available)
+    errors = {}
+    for param in (FIELDS_PARAM, EXCLUDE_PARAM):
+        if param not in query_params:
+            continue
+        names = _split(query_params[param])
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            errors[param] = [
+                f'Unknown fields: {", ".join(unknown)}. '
+                f'Choose from {", ".join(available)}.'
+            ]
+        elif param == FIELDS_PARAM:
+            chosen = [name for name in chosen if name in names]
+        else:
+            chosen = [name for name in chosen if name not in names]
+    if not errors and not chosen:
+        errors[FIELDS_PARAM] = ['No fields left to return.']
+    if errors:
+        raise ValidationError(errors)
+    return tuple(chosen)
+
+
+@functools.lru_cache(maxsize=1024)
+def load_plan(serializer_class, fields):
+    """
+    (columns, relations) the model must load to render fields - columns is
+    None when a field reads something we can't map to a column
+    """
+    model = serializer_class.Meta.model
+    declared = serializer_class().fields
+    columns, relations = {model._meta.pk.name}, []
+    for name in fields:
+        field = declared[name]
+        # method fields have source '*', they are named after what they read
+        source = name if field.source == '*' else field.source.split('.')[0]
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            # a property or method - load everything to be safe
+            columns = None
+            continue
+        if model_field.many_to_many or model_field.one_to_many:
+            relations.append(source)
+        elif columns is not None and model_field.concrete:
+            columns.add(source)
+    if columns is not None:
+        columns = tuple(sorted(columns))
+    return columns, tuple(relations)
+
+
+class SparseFieldsSerializerMixin:
+    """Serializer accepting fields=[...] and dropping the others"""
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsMixin:
+    """
+    ?fields= / ?exclude= on the read actions of a viewset whose serializers
+    use SparseFieldsSerializerMixin
+    """
+    sparse_actions = ('list', 'retrieve')
+    # columns read outside the serializer, eg by the pagination cursor
+    sparse_always_load = ()
+
+    @cached_property
+    def sparse_fields(self):
+        """the fields asked for, None for all of the serializer's"""
+        if self.action not in self.sparse_actions:
+            return None
+        return selected_fields(
+            self.request.query_params,
+            field_names(self.get_serializer_class()),
+        )
+
+    def sparse_load_plan(self):
+        """(columns, relations) to load, None outside sparse actions"""
+        if self.action not in self.sparse_actions:
+            return None
+        serializer_class = self.get_serializer_class()
+        fields = self.sparse_fields or field_names(serializer_class)
+        return load_plan(serializer_class, fields)
+
+    def load_only_rendered(self, queryset):
+        """Defer the columns no returned field reads"""
+        plan = self.sparse_load_plan()
+        if plan is None or plan[0] is None:
+            return queryset
+        return queryset.only(*plan[0], *self.sparse_always_load)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.sparse_fields is not None:
+            kwargs.setdefault('fields', self.sparse_fields)
+        return super().get_serializer(*args, **kwargs)
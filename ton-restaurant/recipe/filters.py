@@ -0,0 +1,86 @@
+"""
+filters for recipe apis
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+
+# query param -> (recipe field, lookup, parser)
+RANGE_PARAMS = {
+    'time_minutes_min': ('time_minutes', 'gte', int),
+    'time_minutes_max': ('time_minutes', 'lte', int),
+    'price_min': ('price', 'gte', Decimal),
+    'price_max': ('price', 'lte', Decimal),
+}
+
+
+def params_to_ints(param, value):
+    """Convert a comma separated list of string IDs to a set of integers"""
+    try:
+        return {int(str_id) for str_id in value.split(',') if str_id.strip()}
+    except ValueError:
+        raise ValidationError(
+            {param: ['Must be a comma separated list of IDs.']}
+        )
+
+
+def match_all(through, fk, ids):
+    """Recipes linked to every one of ids"""
+    # recipe ids having a link to every requested id, one grouped scan of
+    # the through table: GROUP BY recipe_id HAVING COUNT(*) = n - read off
+    # the (fk, recipe_id) index from migration 0010 without the table
+    matching = (
+        through.objects.filter(**{f'{fk}__in': ids})
+        .values('recipe_id')
+        .annotate(matched=Count(fk))
+        .filter(matched=len(ids))
+        .values('recipe_id')
+    )
+    return Q(id__in=matching)
+
+
+def filter_recipes(queryset, query_params):
+    """Apply tags/ingredients (match=any|all) and range filters"""
+    match = query_params.get('match', MATCH_ANY)
+    if match not in (MATCH_ANY, MATCH_ALL):
+        raise ValidationError(
+            {'match': [f'Must be {MATCH_ANY} or {MATCH_ALL}.']}
+        )
+
+    joined = False
+    for param, through, fk in (
+        ('tags', Recipe.tags.through, 'tag_id'),
+        ('ingredients', Recipe.ingredients.through, 'ingredient_id'),
+    ):
+        value = query_params.get(param)
+        if not value:
+            continue
+        ids = params_to_ints(param, value)
+        if not ids:
+            continue
+        if match == MATCH_ALL:
+            queryset = queryset.filter(match_all(through, fk, ids))
+        else:
+            # a plain join and DISTINCT - benchmark_filters has it ahead
+            # of EXISTS and IN subqueries on the first page at every size
+            queryset = queryset.filter(**{f'{param}__id__in': ids})
+            joined = True
+    if joined:
+        queryset = queryset.distinct()
+
+    for param, (field, lookup, parse) in RANGE_PARAMS.items():
+        value = query_params.get(param)
+        if value in (None, ''):
+            continue
+        try:
+            queryset = queryset.filter(**{f'{field}__{lookup}': parse(value)})
+        except (ValueError, InvalidOperation):
+            raise ValidationError({param: ['Must be a number.']})
+
+    return queryset
@@ -0,0 +1,149 @@
+"""
+background processing of uploaded recipe images
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from core.models import Recipe
+from recipe.cache import bump_generation
+
+logger = logging.getLogger(__name__)
+
+# format name -> (pillow format, extension, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {
+        'quality': 82, 'optimize': True, 'progressive': True,
+    }),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """create the worker pool on first use - not at import time"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-image',
+            )
+        return _executor
+
+
+def _available_formats():
+    """skip formats this pillow build can't write eg webp without libwebp"""
+    return {
+        name: spec for name, spec in VARIANT_FORMATS.items()
+        if name != 'webp' or features.check('webp')
+    }
+
+
+def _variant_name(image_name, width, ext):
+    """uploads/recipe/<uuid>.jpg -> uploads/recipe/variants/<uuid>-320w.webp"""
+    folder, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'variants', f'{stem}-{width}w.{ext}')
+
+
+def build_variants(image_name):
+    """Resize an uploaded image to each configured width and format"""
+    with default_storage.open(image_name) as image_file:
+        original = Image.open(image_file)
+        original.load()
+
+    # never upscale - an image narrower than every width gets one variant
+    widths = [w for w in settings.RECIPE_IMAGE_WIDTHS if w < original.width]
+    widths = widths or [original.width]
+
+    variants = {}
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for name, (pil_format, ext, options) in _available_formats().items():
+            image = resized
+            if pil_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format=pil_format, **options)
+            saved = default_storage.save(
+                _variant_name(image_name, width, ext),
+                ContentFile(buffer.getvalue()),
+            )
+            variants.setdefault(str(width), {})[name] = saved
+    return variants
+
+
+def _delete_variants(variants):
+    for formats in variants.values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def delete_variants_on_commit(variants):
+    """Remove a replaced image's variant files once the swap is committed"""
+    if variants:
+        transaction.on_commit(lambda: _delete_variants(variants))
+
+
+def missing_variants():
+    """recipes with an image but no variants - their job never finished"""
+    return Recipe.objects.exclude(image='').filter(
+        image__isnull=False, image_variants={},
+    )
+
+
+def process_recipe_image(recipe_id, image_name):
+    """Generate variants and attach them to the recipe"""
+    try:
+        variants = build_variants(image_name)
+        # only attach if the image wasn't replaced while we were working,
+        # and nobody (a rebuild racing a queued job) attached some first
+        updated = Recipe.objects.filter(
+            pk=recipe_id, image=image_name, image_variants={},
+        ).update(image_variants=variants)
+        if not updated:
+            _delete_variants(variants)
+        else:
+            # update() sends no post_save, the cached lists show variants
+            owner = Recipe.objects.values_list('user_id', flat=True)
+            bump_generation(owner.get(pk=recipe_id))
+        return variants
+    except Exception:
+        logger.exception('Failed to process image for recipe %s', recipe_id)
+        raise
+
+
+def _process_in_worker(recipe_id, image_name):
+    """pool entry point - tidy the worker thread's own db connection"""
+    try:
+        return process_recipe_image(recipe_id, image_name)
+    finally:
+        close_old_connections()
+
+
+def schedule_recipe_image(recipe):
+    """
+    Queue variant generation once the upload is committed
+
+    the queue is in process - jobs lost to a worker restart are picked up
+    by the rebuild_image_variants command
+    """
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: _get_executor().submit(
+            _process_in_worker, recipe_id, image_name,
+        )
+    )
@@ -0,0 +1,135 @@
+"""
+pagination for recipe apis
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+# cursor (keyset) pagination - next page is WHERE id < last seen id
+# so deep pages cost the same as the first, no OFFSET scan
+# cursor is opaque base64 so clients can't build their own
+class RecipeCursorPagination(CursorPagination):
+    """Paginate recipes newest first"""
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        # ranked search pages on rank, id keeps equal ranks in a stable order
+        if getattr(view, 'is_ranked_search', False):
+            return ('-search_rank', '-id')
+        return super().get_ordering(request, queryset, view)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor holding every ordering value instead of the first one plus an
+    offset - drf's cursor counts past the rows tying on the first column,
+    which costs O(offset) again when that column has few distinct values
+
+    the ordering must end in a unique column. a row whose values change
+    between requests can move past the cursor, the others stay put
+    """
+
+    @staticmethod
+    def _fields(ordering):
+        return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def _get_position_from_instance(self, instance, ordering):
+        names = [name for name, _desc in self._fields(ordering)]
+        if isinstance(instance, dict):
+            values = [instance[name] for name in names]
+        else:
+            values = [getattr(instance, name) for name in names]
+        return json.dumps(values)
+
+    def _after(self, model, ordering, position):
+        """Q for the rows following position in ordering"""
+        try:
+            values = json.loads(position)
+            fields = self._fields(ordering)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError(position)
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _desc), value in zip(fields, values)
+            ]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        # (a, b) > (x, y) spelt out - a > x or (a = x and b > y)
+        after, equal = Q(), Q()
+        for (name, desc), value in zip(fields, values):
+            after |= equal & Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+            equal &= Q(**{name: value})
+        return after
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        # positions are unique so offsets are never needed, any sent are
+        # ignored
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self._after(queryset.model, ordering, position),
+            )
+
+        # one extra row tells whether there is a page after this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = None
+        if len(results) > self.page_size:
+            following = self._get_position_from_instance(
+                results[-1], self.ordering,
+            )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.next_position = position
+            self.has_previous = following is not None
+            self.previous_position = following
+        else:
+            self.has_next = following is not None
+            self.next_position = following
+            self.has_previous = position is not None
+            self.previous_position = position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class RecipeAttrCursorPagination(KeysetCursorPagination):
+    """Paginate tags/ingredients by name"""
+    # id keeps the ordering total so the cursor stays stable
+    ordering = ('-name', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        # popular pages on the stored usage counter - many tags share a
+        # count, the keyset cursor keeps ties from turning into offsets
+        if getattr(view, 'is_popular_ordering', False):
+            return ('-recipe_count', '-id')
+        return super().get_ordering(request, queryset, view)
@@ -1,6 +1,8 @@
 """
 serializers for recipe api
 """
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
 
 from core.models import (
@@ -8,26 +10,85 @@ from core.models import (
     Tag,
     Ingredient,
 )
+from core.metrics import TimedSerializerMixin
+from recipe.fields import SparseFieldsSerializerMixin
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+def get_or_create_attrs(model, user, items_data):
+    """Get or create tags/ingredients by name in a fixed number of queries"""
+    # keep first-seen order and drop repeated names
+    names = list(dict.fromkeys(item['name'] for item in items_data))
+    if not names:
+        return []
+
+    # one query for what already exists
+    found = {}
+    for obj in model.objects.filter(user=user, name__in=names).order_by('id'):
+        found.setdefault(obj.name, obj)
+
+    missing = [name for name in names if name not in found]
+    if missing:
+        # ignore_conflicts - a racing request may insert the same name
+        # between our select and insert, the (user, name) unique constraint
+        # turns our insert into a no-op so re-read the rows instead of
+        # trusting what bulk_create returned
+        model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        created = model.objects.filter(
+            user=user, name__in=missing
+        ).order_by('id')
+        for obj in created:
+            found.setdefault(obj.name, obj)
+
+    return [found[name] for name in names]
+
+
+class BaseRecipeAttrSerializer(
+    TimedSerializerMixin, SparseFieldsSerializerMixin,
+    serializers.ModelSerializer,
+):
+    """base serializer for tags and ingredients"""
+    def validate_name(self, value):
+        """Names are unique per user"""
+        # nested inside a recipe existing names are reused, not rejected
+        if self.parent is not None:
+            return value
+        queryset = self.Meta.model.objects.filter(
+            user=self.context['request'].user, name=value,
+        )
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(
+                f'{self.Meta.model.__name__} with this name already exists.'
+            )
+        return value
+
+
+class IngredientSerializer(BaseRecipeAttrSerializer):
     """serializer for ingredients"""
     class Meta:
         model = Ingredient
-        fields = ['id', 'name']
+        fields = ['id', 'name', 'recipe_count']
         read_only_field = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(BaseRecipeAttrSerializer):
     class Meta:
         model = Tag
-        fields = ['id', 'name']
+        fields = ['id', 'name', 'recipe_count']
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(
+    TimedSerializerMixin, SparseFieldsSerializerMixin,
+    serializers.ModelSerializer,
+):
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    image_variants = serializers.SerializerMethodField()
     class Meta:
         model = Recipe
         fields = [
@@ -38,31 +99,55 @@ class RecipeSerializer(serializers.ModelSerializer):
             'link',
             'tags',
             'ingredients',
+            'image_variants',
         ]
         read_only_fields = ['id']
+
+    def _variant_urls(self, variants):
+        """{width: {format: url}} for stored variant names"""
+        request = self.context.get('request')
+        urls = {}
+        for width, formats in variants.items():
+            urls[width] = {}
+            for name, path in formats.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[width][name] = url
+        return urls
+
+    def get_image_variants(self, obj):
+        """the smallest resized image for list cards, empty until processed"""
+        variants = obj.image_variants or {}
+        if not variants:
+            return {}
+        smallest = min(variants, key=int)
+        return self._variant_urls({smallest: variants[smallest]})
+
     #  internal methosd = start with _
     def _get_or_create_tags(self, tags_data, recipe):
         """Helper method to get or create existing tags"""
         auth_user = self.context['request'].user
-        for tag in tags_data:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            recipe.tags.add(tag_obj)
+        tags = get_or_create_attrs(Tag, auth_user, tags_data)
+        recipe.tags.add(*tags)
     # this method not be used outside serializer
     def _get_or_create_ingredients(self, ingredients_data, recipe):
         """handle getting or creating ingredients"""
         auth_user = self.context['request'].user
-        for ingredient in ingredients_data:
-            ingredient_obj, created = Ingredient.objects.get_or_create(user=auth_user, **ingredient)
-            recipe.ingredients.add(ingredient_obj)
+        ingredients = get_or_create_attrs(
+            Ingredient, auth_user, ingredients_data,
+        )
+        recipe.ingredients.add(*ingredients)
 
     def create(self, validated_data):
         # rm tag/ingedient from valiadated data and assign to varible tag_data,ingredient_data
         tags_data = validated_data.pop('tags', [])
         ingredients_data = validated_data.pop('ingredients', [])
-        # exluding tag_data will used to create a new recipe
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags_data, recipe)
-        self._get_or_create_ingredients(ingredients_data, recipe)
+        with transaction.atomic():
+            # exluding tag_data will used to create a new recipe
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags_data, recipe)
+            self._get_or_create_ingredients(ingredients_data, recipe)
 
         return recipe
 
@@ -70,19 +155,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         # rm tags/ingredients from valiadetd data
         tags_data = validated_data.pop('tags', None)
         ingredients_data = validated_data.pop('ingredients', None)
-        if tags_data is not None:
-            # if value associated to tags then clear
-            instance.tags.clear()
-            self._get_or_create_tags(tags_data, instance)
-        if ingredients_data is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients_data, instance)
-
-        # Update the recipe's attributes (like title, price
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-
-        instance.save()
+        auth_user = self.context['request'].user
+        with transaction.atomic():
+            # set() diffs against current rows - only removed/new links touched
+            if tags_data is not None:
+                instance.tags.set(
+                    get_or_create_attrs(Tag, auth_user, tags_data)
+                )
+            if ingredients_data is not None:
+                instance.ingredients.set(get_or_create_attrs(
+                    Ingredient, auth_user, ingredients_data,
+                ))
+
+            # Update the recipe's attributes (like title, price
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+
+            instance.save()
         return instance
 
 # RecipeSerializer as base class to help in extension and add extra fields
@@ -92,8 +181,14 @@ class RecipeDetailSerializer(RecipeSerializer):
         # take existing fields and add descr
         fields = RecipeSerializer.Meta.fields + ['description', 'image']
 
+    def get_image_variants(self, obj):
+        """urls of every resized image, empty until processing finishes"""
+        return self._variant_urls(obj.image_variants or {})
+
 # separate api to handle image upload
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer,
+):
     """serializer for uploading images to recipes"""
     class Meta:
         model = Recipe
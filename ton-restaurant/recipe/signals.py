@@ -0,0 +1,174 @@
+"""
+signals for recipe apis - keep cached lists, search vectors and usage
+counters in step with writes
+"""
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core import search, usage
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_generation
+
+_pending = threading.local()
+
+
+# any recipe/tag/ingredient write by the api, admin or shell invalidates
+# the owner's cached lists - covers perform_create, update, destroy and
+# upload_image without each view remembering to do it
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_owner_lists(sender, instance, **kwargs):
+    bump_generation(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_relation_change(sender, instance, action, **kwargs):
+    # instance is the recipe, or the tag/ingredient on the reverse side -
+    # both belong to the same user
+    if action.startswith('post_'):
+        bump_generation(instance.user_id)
+
+
+# a new user may reuse the id of a deleted one - start them on a fresh
+# generation so nothing cached for the old owner is served
+@receiver(post_save, sender=get_user_model())
+def reset_new_user_lists(sender, instance, created, **kwargs):
+    if created:
+        bump_generation(instance.pk)
+
+
+def _flush_search_refresh():
+    ids = getattr(_pending, 'recipe_ids', None)
+    if not ids:
+        # an earlier callback of the same commit took them already
+        return
+    _pending.recipe_ids = set()
+    search.update_search_vectors(
+        Recipe, Tag, Ingredient, Recipe.objects.filter(id__in=ids),
+    )
+
+
+def schedule_search_refresh(recipe_ids):
+    """Recompute search vectors once the current transaction commits"""
+    if not search.is_supported():
+        return
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    # one UPDATE per transaction however many saves/m2m changes happened,
+    # eg RecipeSerializer.create saves then adds tags then ingredients -
+    # every call queues a callback and the first one to run takes the
+    # whole set. a rollback drops its callbacks but leaves the ids for the
+    # next commit, recomputing a vector from current rows is harmless
+    _pending.recipe_ids = getattr(_pending, 'recipe_ids', set()) | recipe_ids
+    # runs straight away outside a transaction
+    transaction.on_commit(_flush_search_refresh)
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'title', 'description'} & set(update_fields):
+        return
+    schedule_search_refresh([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def refresh_relation_search(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    if not search.is_supported():
+        return
+    if not reverse:
+        if action.startswith('post_'):
+            schedule_search_refresh([instance.pk])
+        return
+    # reverse side - instance is a tag/ingredient, pk_set holds recipe ids
+    if action == 'pre_clear':
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        schedule_search_refresh(getattr(instance, '_search_recipe_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        schedule_search_refresh(pk_set)
+
+
+# renaming or deleting a tag/ingredient changes the text of its recipes
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def refresh_attr_search(sender, instance, created, **kwargs):
+    if created or not search.is_supported():
+        return
+    schedule_search_refresh(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_attr_recipes(sender, instance, **kwargs):
+    if search.is_supported():
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def refresh_deleted_attr_search(sender, instance, **kwargs):
+    schedule_search_refresh(getattr(instance, '_search_recipe_ids', []))
+
+
+# usage counters - relation changes from either side. recipe deletes drop
+# their link rows without m2m_changed, RecipeQuerySet.delete handles those
+def _linked_ids(through, fk, instance, reverse, pk_set=None):
+    """ids on the other side of instance's links, limited to pk_set"""
+    mine, other = (fk, 'recipe_id') if reverse else ('recipe_id', fk)
+    links = through.objects.filter(**{mine: instance.pk})
+    if pk_set is not None:
+        links = links.filter(**{f'{other}__in': pk_set})
+    return list(links.values_list(other, flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_usage_counts(sender, instance, action, reverse, model, pk_set,
+                        **kwargs):
+    attr_model = type(instance) if reverse else model
+    fk = f'{attr_model._meta.model_name}_id'
+    # remove is sent with every requested id, linked or not - look up
+    # what's really going before the rows are deleted
+    if action == 'pre_remove':
+        instance._usage_removed = _linked_ids(
+            sender, fk, instance, reverse, pk_set,
+        )
+        return
+    if action == 'pre_clear':
+        instance._usage_removed = _linked_ids(sender, fk, instance, reverse)
+        return
+    if action == 'post_add':
+        # add only reports the ids it inserted
+        ids, sign = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        ids, sign = getattr(instance, '_usage_removed', []), -1
+    else:
+        return
+    if reverse:
+        deltas = {instance.pk: sign * len(ids)}
+    else:
+        deltas = {obj_id: sign for obj_id in ids}
+    usage.apply_usage_deltas(attr_model, deltas)
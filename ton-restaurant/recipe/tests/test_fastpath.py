@@ -0,0 +1,195 @@
+"""
+test the recipe read fast path renders exactly what the serializers do
+"""
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import serializers, status
+from rest_framework.test import APIClient
+
+from core import search
+from core.models import Recipe, Tag, Ingredient
+from core.testing import detect_n_plus_one
+from recipe.fastpath import compile_projection
+from recipe.serializers import RecipeDetailSerializer, RecipeSerializer
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@detect_n_plus_one()
+class FastPathParityTests(TestCase):
+    """test fast and serializer reads return the same bytes"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(4)
+        ]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ingrédient {i}')
+            for i in range(3)
+        ]
+        self.recipes = []
+        for i, price in enumerate(['5.50', '0.05', '999.99', '12.00', '7.1']):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i} – crème',
+                time_minutes=i * 7, price=Decimal(price),
+                description='Some "quoted" text\n' * i,
+                link='' if i % 2 else f'http://example.com/{i}.pdf',
+            )
+            # linked out of id order, output is in tag/ingredient id order
+            recipe.tags.add(*reversed(tags[:i]))
+            recipe.ingredients.add(*ingredients[i % 3:])
+            self.recipes.append(recipe)
+        Recipe.objects.filter(pk=self.recipes[1].pk).update(
+            image='uploads/recipe/one.jpg',
+            image_variants={
+                '640': {'jpeg': 'uploads/recipe/one-640.jpg'},
+                '320': {'jpeg': 'uploads/recipe/one-320.jpg'},
+            },
+        )
+
+    def assertSameResponse(self, url, params=None):
+        """the fast path response against the serializer one, byte for byte"""
+        responses = []
+        for fast in (True, False):
+            cache.clear()
+            with override_settings(RECIPE_FAST_READS=fast):
+                responses.append(self.client.get(url, params or {}))
+        fast, slow = responses
+        self.assertEqual(slow.status_code, status.HTTP_200_OK)
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_list(self):
+        """test the default list page"""
+        res = self.assertSameResponse(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 5)
+
+    def test_list_pages(self):
+        """test cursors come out the same on every page"""
+        res = self.assertSameResponse(RECIPES_URL, {'page_size': 2})
+        while res.data['next']:
+            res = self.assertSameResponse(res.data['next'])
+
+    def test_list_filtered(self):
+        """test filtered lists"""
+        tag = Tag.objects.get(name='Tag 1')
+        self.assertSameResponse(RECIPES_URL, {'tags': str(tag.id)})
+        self.assertSameResponse(RECIPES_URL, {'price_max': '10'})
+
+    def test_list_sparse(self):
+        """test trimmed lists, with and without nested fields"""
+        for params in (
+            {'fields': 'id,title'},
+            {'fields': 'tags'},
+            {'exclude': 'tags,price'},
+        ):
+            self.assertSameResponse(RECIPES_URL, params)
+
+    def test_list_thumbnail(self):
+        """test list rows carry the smallest variant only"""
+        res = self.assertSameResponse(RECIPES_URL)
+        variants = {
+            r['id']: r['image_variants'] for r in res.data['results']
+        }
+
+        self.assertEqual(set(variants[self.recipes[1].id]), {'320'})
+        self.assertEqual(variants[self.recipes[0].id], {})
+
+    def test_list_empty(self):
+        """test a list with no results"""
+        self.assertSameResponse(RECIPES_URL, {'price_min': '5000'})
+
+    def test_retrieve(self):
+        """test every recipe detail"""
+        for recipe in self.recipes:
+            self.assertSameResponse(detail_url(recipe.id))
+
+    def test_retrieve_with_image(self):
+        """test image and variant urls are built the same"""
+        res = self.assertSameResponse(detail_url(self.recipes[1].id))
+        self.assertEqual(
+            res.data['image'],
+            'http://testserver/static/media/uploads/recipe/one.jpg',
+        )
+        self.assertEqual(set(res.data['image_variants']), {'320', '640'})
+
+    def test_retrieve_sparse(self):
+        """test a trimmed detail"""
+        self.assertSameResponse(
+            detail_url(self.recipes[1].id), {'fields': 'image,image_variants'},
+        )
+
+    def test_retrieve_missing(self):
+        """test unknown and other users' recipes are 404 on both paths"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123',
+        )
+        theirs = Recipe.objects.create(
+            user=other, title='Theirs', time_minutes=1, price=Decimal('1.00'),
+        )
+        for url in (detail_url(theirs.id), detail_url(0)):
+            for fast in (True, False):
+                with override_settings(RECIPE_FAST_READS=fast):
+                    res = self.client.get(url)
+                self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @skipUnless(search.is_supported(), 'ranked search needs postgres')
+    def test_ranked_search(self):
+        """test ranked search pages"""
+        self.assertSameResponse(
+            RECIPES_URL, {'search': 'crème', 'page_size': 2},
+        )
+
+    def test_list_queries(self):
+        """test recipes plus one query per nested relation"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(RECIPES_URL)
+        self.assertEqual(len(ctx.captured_queries), 3)
+        # nested rows read off the link table, not prefetched instances
+        self.assertIn(
+            'FROM "core_recipe_tags"', ctx.captured_queries[1]['sql'],
+        )
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+
+class ProjectionTests(TestCase):
+    """test serializers compile to a projection or fall back"""
+
+    def test_recipe_serializers_compile(self):
+        """test the recipe serializers have no unsupported fields"""
+        for serializer_class in (RecipeSerializer, RecipeDetailSerializer):
+            fields = tuple(serializer_class().fields)
+            self.assertIsNotNone(compile_projection(serializer_class, fields))
+
+    def test_unsupported_field_falls_back(self):
+        """test a field reading the whole instance can't be projected"""
+        class WholeRecipeSerializer(RecipeSerializer):
+            summary = serializers.CharField(source='*', read_only=True)
+
+            class Meta(RecipeSerializer.Meta):
+                fields = ['id', 'summary']
+
+        self.assertIsNone(
+            compile_projection(WholeRecipeSerializer, ('id', 'summary')),
+        )
@@ -48,7 +48,7 @@ class PrivateIngredientsApiTests(TestCase):
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """test list of ingredients limited to autrhenticated user only"""
@@ -62,9 +62,9 @@ class PrivateIngredientsApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         # created 2 ingredients but the one assigned to auth user is returned
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_update_ingredient(self):
         """test updating an ingredient"""
@@ -104,10 +104,11 @@ class PrivateIngredientsApiTests(TestCase):
         recipe.ingredients.add(ingredient1)
 
         res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
+        ingredient1.refresh_from_db()
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         """Test filtering ingredients by assigned returns unique items"""
@@ -133,4 +134,26 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_ingredients_recipe_count(self):
+        """Test each ingredient carries the number of recipes using it"""
+        ingredient1 = Ingredient.objects.create(user=self.user, name='Apples')
+        ingredient2 = Ingredient.objects.create(user=self.user, name='Flour')
+        recipe = Recipe.objects.create(
+            title='Apple Crumble',
+            time_minutes=5,
+            price=Decimal('10.00'),
+            user=self.user,
+        )
+        recipe.ingredients.add(ingredient1)
+
+        res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
+
+        self.assertEqual(
+            [(i['id'], i['recipe_count']) for i in res.data['results']],
+            [(ingredient1.id, 1)],
+        )
+        res = self.client.get(INGREDIENT_URL)
+        counts = {i['id']: i['recipe_count'] for i in res.data['results']}
+        self.assertEqual(counts, {ingredient1.id: 1, ingredient2.id: 0})
@@ -2,20 +2,31 @@
 test for recipe apis
 """
 from decimal import Decimal
+import csv
+import io
+import json
 import tempfile
 import os
 
+from unittest import skipUnless
+from unittest.mock import patch
+
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import (Recipe, Tag, Ingredient, )
+from core.testing import detect_n_plus_one
 
+from recipe import bulk, images
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
@@ -27,6 +38,10 @@ RECIPES_URL = reverse('recipe:recipe-list')
 def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
+
+EXPORT_URL = reverse('recipe:recipe-export')
+BULK_URL = reverse('recipe:recipe-bulk')
+
 def image_upload_url(recipe_id):
     """create and return image upload url"""
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
@@ -52,6 +67,7 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
+@detect_n_plus_one()
 class PublicRecipeAPITests(TestCase):
     """test unauthenticated recipe api access"""
     def setUp(self):
@@ -64,6 +80,7 @@ class PublicRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@detect_n_plus_one()
 class PrivateRecipeApiTests(TestCase):
     """test authenticated recipe api access"""
     def setUp(self):
@@ -88,7 +105,7 @@ class PrivateRecipeApiTests(TestCase):
         # pass list of items
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """test retrieving a list of recipes is limited to authenticated user"""
@@ -105,7 +122,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         # create and assign recipe to user
@@ -418,9 +435,9 @@ class PrivateRecipeApiTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     # test filterign by ingredients
     def test_filter_by_ingredients(self):
@@ -439,12 +456,798 @@ class PrivateRecipeApiTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+
+# cursor pagination
+@detect_n_plus_one()
+class RecipePaginationTests(TestCase):
+    """test paginating the recipe list"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_walk_pages_with_cursor(self):
+        """test following next cursor returns every recipe once in order"""
+        recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(7)
+        ]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 3})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        seen = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += [r['id'] for r in res.data['results']]
+
+        self.assertEqual(seen, [r.id for r in reversed(recipes)])
+
+    def test_cursor_stable_after_insert(self):
+        """test new recipes don't shift an existing cursor"""
+        for i in range(4):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        second_page = self.client.get(res.data['next'])
+        create_recipe(user=self.user, title='Newest')
+        again = self.client.get(res.data['next'])
+
+        self.assertEqual(again.data['results'], second_page.data['results'])
+
+    def test_invalid_cursor(self):
+        """test a tampered cursor is rejected"""
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+# streaming export
+@detect_n_plus_one()
+class RecipeExportTests(TestCase):
+    """test streaming recipe export"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _content(self, res):
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_jsonl(self):
+        """test each recipe is one json line matching the detail serializer"""
+        recipe = create_recipe(user=self.user, title='Ugali')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Kenyan'))
+        create_recipe(user=self.user, title='Chapati')
+        other_user = create_user(
+            email='other@example.com', password='pass12345',
+        )
+        create_recipe(user=other_user, title='Not mine')
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self._content(res).splitlines()]
+        self.assertEqual([r['title'] for r in rows], ['Chapati', 'Ugali'])
+        self.assertEqual(
+            rows[1]['tags'],
+            [{
+                'id': recipe.tags.get().id, 'name': 'Kenyan',
+                'recipe_count': 1,
+            }],
+        )
+        self.assertEqual(rows[1]['price'], '5.50')
+
+    def test_export_csv(self):
+        """test csv export flattens tags and ingredients"""
+        recipe = create_recipe(user=self.user, title='Pilau')
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='rice'),
+            Ingredient.objects.create(user=self.user, name='beef'),
+        )
+
+        res = self.client.get(EXPORT_URL, {'export_format': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self._content(res))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Pilau')
+        self.assertEqual(
+            set(rows[0]['ingredients'].split(';')), {'rice', 'beef'},
+        )
+
+    def test_export_invalid_format(self):
+        """test unknown export format is rejected"""
+        res = self.client.get(EXPORT_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_queries_per_chunk(self):
+        """test queries grow with chunks, not recipes"""
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}'),
+            )
+
+        res = self.client.get(EXPORT_URL)
+        # ids query + 3 chunks x (recipes, tags, ingredients)
+        with self.assertNumQueries(10) as ctx:
+            lines = self._content(res).splitlines()
+        self.assertEqual(len(lines), 5)
+        # the search vector isn't exported so it's never loaded
+        for query in ctx.captured_queries:
+            self.assertNotIn('search_vector', query['sql'])
+
+
+# bulk create/update/delete
+@detect_n_plus_one()
+class RecipeBulkTests(TestCase):
+    """test the bulk recipe endpoint"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_update_delete(self):
+        """test all three operations apply in one request"""
+        to_update = create_recipe(user=self.user, title='Old title')
+        to_update.tags.add(Tag.objects.create(user=self.user, name='Drop'))
+        to_delete = create_recipe(user=self.user)
+        payload = {
+            'create': [
+                {'title': 'Ugali', 'time_minutes': 20, 'price': '1.50',
+                 'tags': [{'name': 'Kenyan'}]},
+                {'title': 'Chapati', 'time_minutes': 30, 'price': '2.00',
+                 'tags': [{'name': 'Kenyan'}, {'name': 'Bread'}],
+                 'ingredients': [{'name': 'flour'}]},
+            ],
+            'update': [
+                {'id': to_update.id, 'title': 'New title',
+                 'tags': [{'name': 'Kenyan'}]},
+            ],
+            'delete': [to_delete.id],
+        }
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['created']), 2)
+        self.assertEqual(res.data['updated'], [to_update.id])
+        self.assertEqual(res.data['deleted'], [to_delete.id])
+
+        chapati = Recipe.objects.get(title='Chapati')
+        self.assertEqual(chapati.user, self.user)
+        self.assertEqual(
+            set(chapati.tags.values_list('name', flat=True)),
+            {'Kenyan', 'Bread'},
+        )
+        self.assertEqual(chapati.ingredients.get().name, 'flour')
+        # one Kenyan tag shared across the batch
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, name='Kenyan').count(), 1,
+        )
+        # counters kept up to date without m2m_changed
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'recipe_count')),
+            {'Drop': 0, 'Kenyan': 3, 'Bread': 1},
+        )
+
+        to_update.refresh_from_db()
+        self.assertEqual(to_update.title, 'New title')
+        self.assertEqual(
+            list(to_update.tags.values_list('name', flat=True)), ['Kenyan'],
+        )
+        self.assertFalse(Recipe.objects.filter(id=to_delete.id).exists())
+
+    def test_bulk_errors_reported_per_item(self):
+        """test any invalid item rolls back the whole batch"""
+        other_user = create_user(
+            email='other@example.com', password='pass12345',
+        )
+        not_mine = create_recipe(user=other_user)
+        payload = {
+            'create': [
+                {'title': 'Fine', 'time_minutes': 5, 'price': '1.00'},
+                {'title': 'Missing time', 'price': '1.00'},
+            ],
+            'update': [{'id': not_mine.id, 'title': 'Hijack'}],
+            'delete': [not_mine.id],
+        }
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('time_minutes', res.data['create'][1])
+        self.assertNotIn(0, res.data['create'])
+        self.assertIn(0, res.data['update'])
+        self.assertIn(0, res.data['delete'])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        not_mine.refresh_from_db()
+        self.assertNotEqual(not_mine.title, 'Hijack')
+
+    def test_bulk_malformed_operations(self):
+        """test non list operations and non integer ids are 400s"""
+        recipe = create_recipe(user=self.user)
+        cases = [
+            ({'create': 5}, {'create': ['Expected a list.']}),
+            ({'update': 5}, {'update': ['Expected a list.']}),
+            ({'delete': 5}, {'delete': ['Expected a list.']}),
+            ({'update': [{'id': [1]}]},
+             {'update': {0: {'id': ['A valid integer is required.']}}}),
+            ({'update': [5]},
+             {'update': {0: {'non_field_errors': ['Expected an object.']}}}),
+            ({'delete': [[1], True, recipe.id]},
+             {'delete': {0: ['A valid integer is required.'],
+                         1: ['A valid integer is required.']}}),
+        ]
+
+        for payload, errors in cases:
+            res = self.client.post(BULK_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(res.data, errors)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_update_writes_sent_fields_only(self):
+        """test an update doesn't write back fields the item didn't send"""
+        first = create_recipe(user=self.user, title='First')
+        second = create_recipe(user=self.user, title='Second')
+        resolve = bulk._resolve_relations
+
+        def concurrent_write(*args):
+            # lands after validation loaded the instances
+            Recipe.objects.filter(id=first.id).update(price=Decimal('9.99'))
+            return resolve(*args)
+
+        payload = {'update': [
+            {'id': first.id, 'title': 'First renamed'},
+            {'id': second.id, 'price': '1.25'},
+        ]}
+        with patch.object(bulk, '_resolve_relations', concurrent_write):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(
+            (first.title, first.price), ('First renamed', Decimal('9.99')),
+        )
+        self.assertEqual(
+            (second.title, second.price), ('Second', Decimal('1.25')),
+        )
+
+    def test_bulk_invalidates_list_cache(self):
+        """test bulk writes are visible in the next list"""
+        self.client.get(RECIPES_URL)
+        payload = {
+            'create': [
+                {'title': 'Ugali', 'time_minutes': 20, 'price': '1.50'},
+            ],
+        }
+        self.client.post(BULK_URL, payload, format='json')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_bulk_nested_queries_constant(self):
+        """test nested tags resolve in set based queries"""
+        def payload(count):
+            return {'create': [
+                {'title': f'Recipe {i}', 'time_minutes': 5, 'price': '1.00',
+                 'tags': [{'name': f'Tag {i}'}, {'name': 'Shared'}]}
+                for i in range(count)
+            ]}
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(BULK_URL, payload(2), format='json')
+        Recipe.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(BULK_URL, payload(12), format='json')
+
+        # only the per-recipe insert fallback may grow (sqlite)
+        returns_rows = connection.features.can_return_rows_from_bulk_insert
+        per_recipe = 0 if returns_rows else 1
+        self.assertEqual(
+            len(large.captured_queries) - len(small.captured_queries),
+            10 * per_recipe,
+        )
+
+    def test_bulk_delete_queries_constant(self):
+        """test deleting many linked recipes doesn't query per recipe"""
+        tag = Tag.objects.create(user=self.user, name='Shared')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        kept = create_recipe(user=self.user, title='Kept')
+        kept.tags.add(tag)
+
+        def delete(count):
+            ids = []
+            for i in range(count):
+                recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+                recipe.tags.add(tag)
+                recipe.ingredients.add(ingredient)
+                ids.append(recipe.id)
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(
+                    BULK_URL, {'delete': ids}, format='json',
+                )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries.captured_queries)
+
+        self.assertEqual(delete(2), delete(30))
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual((tag.recipe_count, ingredient.recipe_count), (1, 0))
+
+
+# per-user list cache
+@detect_n_plus_one()
+class RecipeListCacheTests(TestCase):
+    """test caching of the recipe list"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        create_recipe(user=self.user)
+
+    def test_repeat_list_served_from_cache(self):
+        """test second identical list hits no database"""
+        first = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_query_params_cached_separately(self):
+        """test filtered and unfiltered lists don't share an entry"""
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'tags': str(tag.id)})
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_write_invalidates_cache(self):
+        """test creating, updating and deleting refresh the list"""
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        created = self.client.post(RECIPES_URL, {
+            'title': 'New', 'time_minutes': 5, 'price': Decimal('1.00'),
+        })
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertNotEqual(res['ETag'], etag)
+
+        self.client.patch(detail_url(created.data['id']), {'title': 'Renamed'})
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data['results'][0]['title'], 'Renamed')
+
+        self.client.delete(detail_url(created.data['id']))
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_cache_is_per_user(self):
+        """test one user's cached list is never served to another"""
+        self.client.get(RECIPES_URL)
+        other_user = create_user(
+            email='other@example.com', password='pass12345',
+        )
+        self.client.force_authenticate(other_user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_if_none_match_returns_304(self):
+        """test unchanged list revalidates without serializing"""
+        res = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_none_match_list(self):
+        """test etag lists, weak etags and * all revalidate"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        for header in (f'"other", {etag}', f'W/{etag}', '*'):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(
+                res.status_code, status.HTTP_304_NOT_MODIFIED, header,
+            )
+
+    def test_if_none_match_partial_etag(self):
+        """test an etag containing ours as a substring is a miss"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(
+            RECIPES_URL, HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_if_none_match_stale_after_write(self):
+        """test a write makes the old etag miss"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        create_recipe(user=self.user, title='Another')
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+
+
+# query count regression - stop the N+1 on nested tags/ingredients
+@detect_n_plus_one()
+class RecipeQueryCountTests(TestCase):
+    """test recipe endpoints run a constant number of queries"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _create_recipes(self, count):
+        """create recipes each with own tags and ingredients"""
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}a'),
+                Tag.objects.create(user=self.user, name=f'Tag {i}b'),
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}'),
+            )
+
+    def test_list_queries_constant(self):
+        """test list runs the same queries for 1 or many recipes"""
+        self._create_recipes(1)
+        # recipes + tags prefetch + ingredients prefetch
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 1)
+
+        self._create_recipes(10)
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 11)
+
+    def test_list_filtered_queries_constant(self):
+        """test filtering does not bring the N+1 back"""
+        self._create_recipes(5)
+        tag_ids = ','.join(str(t.id) for t in Tag.objects.all())
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL, {'tags': tag_ids})
+        self.assertEqual(len(res.data['results']), 5)
+
+    def test_retrieve_queries_constant(self):
+        """test detail loads tags/ingredients with one query each"""
+        self._create_recipes(1)
+        recipe = Recipe.objects.get(user=self.user)
+        recipe.tags.add(*[
+            Tag.objects.create(user=self.user, name=f'Extra {i}')
+            for i in range(5)
+        ])
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(len(res.data['tags']), 7)
+
+    def test_upload_image_skips_prefetch(self):
+        """test upload image does not load tags/ingredients"""
+        self._create_recipes(1)
+        recipe = Recipe.objects.get(user=self.user)
+        url = image_upload_url(recipe.id)
+
+        # recipe lookup only - invalid image never reaches save
+        with self.assertNumQueries(1):
+            res = self.client.post(url, {'image': 'bad image'},
+                                   format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_with_many_ingredients_batched(self):
+        """test nested ingredients don't cost queries per item"""
+        Ingredient.objects.create(user=self.user, name='Ing 0')
+
+        def payload(count):
+            return {
+                'title': 'Big stew',
+                'time_minutes': 60,
+                'price': Decimal('9.00'),
+                'tags': [{'name': f'Dinner {count}'}],
+                'ingredients': [{'name': f'Ing {i}'} for i in range(count)],
+            }
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(RECIPES_URL, payload(2), format='json')
+        # constant no matter how many tags/ingredients are sent
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.post(RECIPES_URL, payload(30), format='json')
+
+        self.assertEqual(
+            len(large.captured_queries), len(small.captured_queries),
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.ingredients.count(), 30)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 30)
+
+    def test_update_tags_applies_diff(self):
+        """test update keeps unchanged tag links instead of rebuilding"""
+        recipe = create_recipe(user=self.user)
+        keep = Tag.objects.create(user=self.user, name='Keep')
+        drop = Tag.objects.create(user=self.user, name='Drop')
+        recipe.tags.add(keep, drop)
+        through = Recipe.tags.through
+        keep_link = through.objects.get(recipe=recipe, tag=keep)
+
+        payload = {'tags': [{'name': 'Keep'}, {'name': 'New'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        names = set(recipe.tags.values_list('name', flat=True))
+        self.assertEqual(names, {'Keep', 'New'})
+        # same through row - link was not deleted and re-added
+        self.assertTrue(through.objects.filter(id=keep_link.id).exists())
+
+    def test_duplicate_names_in_payload(self):
+        """test repeated names resolve to one tag"""
+        payload = {
+            'title': 'Chapati',
+            'time_minutes': 20,
+            'price': Decimal('1.00'),
+            'tags': [{'name': 'Kenyan'}, {'name': 'Kenyan'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+
+# full text search
+@detect_n_plus_one()
+class RecipeSearchTests(TestCase):
+    """test searching recipes"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        # postgres refreshes search vectors on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.by_title = create_recipe(
+                user=self.user, title='Chicken curry',
+            )
+            self.by_tag = create_recipe(user=self.user, title='Ugali')
+            self.by_tag.tags.add(
+                Tag.objects.create(user=self.user, name='chicken'),
+            )
+            self.by_ingredient = create_recipe(user=self.user, title='Pilau')
+            self.by_ingredient.ingredients.add(Ingredient.objects.create(
+                user=self.user, name='chicken thighs',
+            ))
+            self.no_match = create_recipe(
+                user=self.user, title='Beef stew', description='Slow cooked',
+            )
+
+    def test_search_title_tags_and_ingredients(self):
+        """test search matches every searchable field"""
+        res = self.client.get(RECIPES_URL, {'search': 'chicken'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = {r['id'] for r in res.data['results']}
+        self.assertEqual(
+            ids, {self.by_title.id, self.by_tag.id, self.by_ingredient.id},
+        )
+
+    def test_search_description(self):
+        """test search matches the description"""
+        res = self.client.get(RECIPES_URL, {'search': 'cooked'})
+
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids, [self.no_match.id])
+
+    def test_search_limited_to_user(self):
+        """test other users' recipes never match"""
+        other_user = create_user(
+            email='other@example.com', password='pass12345',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(user=other_user, title='Chicken wings')
+
+        res = self.client.get(RECIPES_URL, {'search': 'wings'})
+
+        self.assertEqual(res.data['results'], [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'ranking needs postgres')
+    def test_search_ranked_and_paginated(self):
+        """test title matches rank above tag matches across pages"""
+        res = self.client.get(
+            RECIPES_URL, {'search': 'chicken', 'page_size': 1},
+        )
+        ids = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [r['id'] for r in res.data['results']]
+
+        self.assertEqual(ids[0], self.by_title.id)
+        self.assertEqual(len(ids), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'vectors need postgres')
+    def test_tag_rename_updates_search(self):
+        """test renaming a tag refreshes its recipes"""
+        tag = self.by_tag.tags.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.name = 'mchuzi'
+            tag.save()
+
+        res = self.client.get(RECIPES_URL, {'search': 'mchuzi'})
+
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [self.by_tag.id],
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'vectors need postgres')
+    def test_refresh_after_rollback(self):
+        """test a rolled back savepoint doesn't swallow later refreshes"""
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        create_recipe(user=self.user, title='Lost pancakes')
+                        raise ValueError
+                except ValueError:
+                    pass
+                recipe = create_recipe(user=self.user, title='Kept pancakes')
+                recipe.tags.add(Tag.objects.create(user=self.user, name='pan'))
+        updates = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE') and 'search_vector' in q['sql']
+        ]
+
+        res = self.client.get(RECIPES_URL, {'search': 'pancakes'})
+
+        self.assertEqual(len(updates), 1)
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+
+# tag/ingredient match semantics and range filters
+@detect_n_plus_one()
+class RecipeFilterTests(TestCase):
+    """test filtering recipes"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.kenyan = Tag.objects.create(user=self.user, name='Kenyan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.both = create_recipe(
+            user=self.user, title='Both', time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        self.both.tags.add(self.kenyan, self.quick)
+        self.kenyan_only = create_recipe(
+            user=self.user, title='Kenyan only', time_minutes=60,
+            price=Decimal('8.00'),
+        )
+        self.kenyan_only.tags.add(self.kenyan)
+        self.untagged = create_recipe(user=self.user, title='Untagged',
+                                      time_minutes=30, price=Decimal('5.00'))
+
+    def _ids(self, params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [r['id'] for r in res.data['results']]
+
+    def test_match_any_default(self):
+        """test recipes with any of the tags are returned once each"""
+        ids = self._ids({'tags': f'{self.kenyan.id},{self.quick.id}'})
+
+        self.assertEqual(ids, [self.kenyan_only.id, self.both.id])
+
+    def test_match_all(self):
+        """test match=all only returns recipes with every tag"""
+        ids = self._ids({
+            'tags': f'{self.kenyan.id},{self.quick.id}', 'match': 'all',
+        })
+
+        self.assertEqual(ids, [self.both.id])
+
+    def test_match_all_repeated_id(self):
+        """test a repeated id doesn't make match=all impossible"""
+        ids = self._ids({
+            'tags': f'{self.quick.id},{self.quick.id}', 'match': 'all',
+        })
+
+        self.assertEqual(ids, [self.both.id])
+
+    def test_match_all_tags_and_ingredients(self):
+        """test tag and ingredient filters combine with AND"""
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        self.kenyan_only.ingredients.add(salt)
+
+        ids = self._ids({
+            'tags': str(self.kenyan.id),
+            'ingredients': str(salt.id),
+            'match': 'all',
+        })
+
+        self.assertEqual(ids, [self.kenyan_only.id])
+
+    def test_time_and_price_ranges(self):
+        """test min/max filters are inclusive"""
+        self.assertEqual(
+            self._ids({'time_minutes_min': 30}),
+            [self.untagged.id, self.kenyan_only.id],
+        )
+        self.assertEqual(self._ids({'time_minutes_max': 10}), [self.both.id])
+        self.assertEqual(
+            self._ids({'price_min': '2.00', 'price_max': '5.00'}),
+            [self.untagged.id, self.both.id],
+        )
+
+    def test_invalid_filters_rejected(self):
+        """test bad filter values return 400 instead of 500"""
+        for params in [
+            {'tags': 'one,two'},
+            {'match': 'some'},
+            {'price_min': 'cheap'},
+            {'time_minutes_max': '1.5'},
+        ]:
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
+
+    def test_match_any_joins_match_all_groups(self):
+        """test any joins and dedupes, all groups the links instead"""
+        tags = f'{self.kenyan.id},{self.quick.id}'
+        with CaptureQueriesContext(connection) as queries:
+            self._ids({'tags': tags})
+        any_sql = queries.captured_queries[0]['sql']
+        with CaptureQueriesContext(connection) as queries:
+            self._ids({'tags': tags, 'match': 'all'})
+        all_sql = queries.captured_queries[0]['sql']
+
+        self.assertIn('DISTINCT', any_sql)
+        self.assertIn('JOIN', any_sql)
+        self.assertNotIn('DISTINCT', all_sql)
+        self.assertIn('HAVING', all_sql)
 
 
 # test images upload
+@detect_n_plus_one()
 class ImageUploadTests(TestCase):
     """tests for image upload api"""
     def setUp(self):
@@ -485,4 +1288,99 @@ class ImageUploadTests(TestCase):
         payload = {'image': 'bad image'}
         res = self.client.post(url, payload, format='multipart')
 
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _upload(self, size=(10, 10)):
+        """upload a generated jpeg to the recipe"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', size).save(image_file, format='JPEG')
+            image_file.seek(0)
+            return self.client.post(
+                url, {'image': image_file}, format='multipart',
+            )
+
+    @patch('recipe.images._get_executor')
+    def test_upload_schedules_variants_after_commit(self, patched_executor):
+        """test upload returns before variants are built"""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self._upload()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        patched_executor.return_value.submit.assert_called_once_with(
+            images._process_in_worker, self.recipe.id, self.recipe.image.name,
+        )
+
+    def test_process_image_builds_variants(self):
+        """test worker resizes to each width narrower than the original"""
+        self._upload(size=(700, 350))
+        self.recipe.refresh_from_db()
+        # cached before the variants exist
+        self.client.get(RECIPES_URL)
+
+        variants = images.process_recipe_image(
+            self.recipe.id, self.recipe.image.name,
+        )
+        self.addCleanup(images._delete_variants, variants)
+
+        self.assertEqual(set(variants), {'320', '640'})
+        with default_storage.open(variants['320']['jpeg']) as f:
+            self.assertEqual(Image.open(f).size, (320, 160))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        jpeg_url = res.data['image_variants']['640']['jpeg']
+        self.assertTrue(jpeg_url.startswith('http://testserver/'))
+        # the list only carries the smallest width
+        res = self.client.get(RECIPES_URL)
+        listed = res.data['results'][0]['image_variants']
+        self.assertEqual(set(listed), {'320'})
+
+    @patch('recipe.images._get_executor')
+    def test_reupload_deletes_old_variants(self, patched_executor):
+        """test variant files of a replaced image are removed on commit"""
+        self._upload(size=(700, 350))
+        self.recipe.refresh_from_db()
+        old_name = self.recipe.image.name
+        variants = images.process_recipe_image(self.recipe.id, old_name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload()
+
+        for formats in variants.values():
+            for name in formats.values():
+                self.assertFalse(default_storage.exists(name))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        default_storage.delete(old_name)
+
+    def test_process_twice_keeps_first_variants(self):
+        """test a second job for the same upload discards its own files"""
+        self._upload()
+        self.recipe.refresh_from_db()
+        first = images.process_recipe_image(
+            self.recipe.id, self.recipe.image.name,
+        )
+        self.addCleanup(images._delete_variants, first)
+
+        second = images.process_recipe_image(
+            self.recipe.id, self.recipe.image.name,
+        )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, first)
+        self.assertFalse(default_storage.exists(second['10']['jpeg']))
+
+    def test_process_replaced_image_discarded(self):
+        """test variants for a superseded upload are not attached"""
+        self._upload()
+        self.recipe.refresh_from_db()
+        old_name = self.recipe.image.name
+        self._upload()
+
+        variants = images.process_recipe_image(self.recipe.id, old_name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        self.assertFalse(default_storage.exists(variants['10']['jpeg']))
+        default_storage.delete(old_name)
@@ -0,0 +1,188 @@
+"""
+Test serving recipe images to their owner
+"""
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.media import parse_range
+from core.models import Recipe
+
+IMAGE = 'uploads/recipe/0b6f8d3e-8a8e-4a43-9a6e-0c1f4f7a2b11.jpg'
+VARIANT = (
+    'uploads/recipe/variants/0b6f8d3e-8a8e-4a43-9a6e-0c1f4f7a2b11-320w.webp'
+)
+CONTENT = bytes(range(256)) * 40
+
+
+def image_url(name):
+    return reverse('recipe-image', args=[name[len('uploads/recipe/'):]])
+
+
+class ParseRangeTests(SimpleTestCase):
+    """Test Range header parsing"""
+
+    def test_single_ranges(self):
+        """Test closed, open and suffix ranges, clamped to the file"""
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_whole_file(self):
+        """Test no header, several ranges and other units send everything"""
+        for header in (None, '', 'bytes=0-1,5-9', 'items=0-1', 'bytes=-'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        """Test ranges outside the file raise"""
+        for header in ('bytes=1000-', 'bytes=5-1', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 1000)
+
+
+class RecipeImageTests(TestCase):
+    """Test the recipe image view"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+        for name in (IMAGE, VARIANT):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(CONTENT)
+
+        self.user = get_user_model().objects.create_user(
+            'owner@ton.com', 'testpass',
+        )
+        Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=5, price='1.00',
+            image=IMAGE,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_owner_gets_file(self):
+        """Test the file comes back with validators and year long caching"""
+        res = self.client.get(image_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', res)
+        self.assertEqual(
+            res['Cache-Control'], 'private, max-age=31536000, immutable',
+        )
+
+    def test_variant(self):
+        """Test variants are served to the owner of the original"""
+        res = self.client.get(image_url(VARIANT))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/webp')
+
+    def test_range(self):
+        """Test a byte range gets 206 with only those bytes"""
+        res = self.client.get(image_url(IMAGE), HTTP_RANGE='bytes=100-199')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT[100:200])
+        self.assertEqual(res['Content-Length'], '100')
+        self.assertEqual(res['Content-Range'], f'bytes 100-199/{len(CONTENT)}')
+
+    def test_range_unsatisfiable(self):
+        """Test a range past the end gets 416 with the size"""
+        res = self.client.get(image_url(IMAGE), HTTP_RANGE='bytes=999999-')
+
+        self.assertEqual(
+            res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        )
+        self.assertEqual(res['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_if_range_stale(self):
+        """Test a Range whose If-Range doesn't match sends the whole file"""
+        res = self.client.get(
+            image_url(IMAGE), HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets 304 with no body"""
+        etag = self.client.get(image_url(IMAGE))['ETag']
+        res = self.client.get(image_url(IMAGE), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_other_users_image(self):
+        """Test another user's image is a 404, not a 403"""
+        other = get_user_model().objects.create_user(
+            'other@ton.com', 'testpass',
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+
+        for name in (IMAGE, VARIANT):
+            res = client.get(image_url(name))
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_requires_auth(self):
+        """Test anonymous requests are refused"""
+        res = APIClient().get(image_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bad_names(self):
+        """Test names outside the upload layout are 404"""
+        names = (
+            '../../settings.py', 'variants/../x.jpg', 'x', 'variants/abc.jpg',
+        )
+        for name in names:
+            res = self.client.get(reverse('recipe-image', args=[name]))
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND, name)
+
+    def test_missing_file(self):
+        """Test a recipe whose file is gone gets 404"""
+        os.remove(os.path.join(self.media_root, IMAGE))
+
+        res = self.client.get(image_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(MEDIA_SERVE_MODE='accel')
+    def test_x_accel_redirect(self):
+        """Test nginx is told which internal location to send"""
+        res = self.client.get(image_url(IMAGE))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected-media/{IMAGE}')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_x_sendfile(self):
+        """Test X-Sendfile carries the absolute path"""
+        res = self.client.get(image_url(IMAGE))
+
+        self.assertEqual(
+            res['X-Sendfile'], os.path.join(self.media_root, IMAGE),
+        )
+        self.assertEqual(res.content, b'')
@@ -0,0 +1,143 @@
+"""
+test ?fields= / ?exclude= on the recipe, tag and ingredient apis
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from core.testing import detect_n_plus_one
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@detect_n_plus_one()
+class SparseFieldsTests(TestCase):
+    """test trimmed responses load only what they return"""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=10,
+                price=Decimal('5.50'), description='Long text ' * 100,
+            )
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}'),
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}'),
+            )
+        self.recipe = recipe
+
+    def _get(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params)
+        return res, [q['sql'] for q in ctx.captured_queries]
+
+    def test_list_titles_only(self):
+        """test fields=title skips the prefetches and other columns"""
+        res, queries = self._get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['results'][0],
+            {'id': self.recipe.id, 'title': 'Recipe 2'},
+        )
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"price"', queries[0])
+
+    def test_list_one_relation_prefetched(self):
+        """test asking for tags prefetches tags but not ingredients"""
+        res, queries = self._get(RECIPES_URL, {'fields': 'title,tags'})
+
+        self.assertEqual(set(res.data['results'][0]), {'title', 'tags'})
+        self.assertEqual(len(queries), 2)
+        self.assertIn('core_tag', queries[1])
+
+    def test_default_list_skips_description(self):
+        """test the list never loads the description it doesn't return"""
+        res, queries = self._get(RECIPES_URL, {})
+
+        self.assertNotIn('description', res.data['results'][0])
+        self.assertNotIn('"description"', queries[0])
+        self.assertEqual(len(queries), 3)
+
+    def test_retrieve_exclude(self):
+        """test exclude drops fields from the detail response"""
+        res, queries = self._get(
+            detail_url(self.recipe.id), {'exclude': 'description,ingredients'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('description', res.data)
+        self.assertNotIn('ingredients', res.data)
+        self.assertIn('image_variants', res.data)
+        self.assertEqual(len(res.data['tags']), 1)
+        self.assertNotIn('"description"', queries[0])
+        self.assertEqual(len(queries), 2)
+
+    def test_fields_and_exclude_combined(self):
+        """test exclude applies to what fields picked"""
+        res = self.client.get(RECIPES_URL, {
+            'fields': 'id,title,price', 'exclude': 'price',
+        })
+
+        self.assertEqual(set(res.data['results'][0]), {'id', 'title'})
+
+    def test_unknown_fields_rejected(self):
+        """test unknown or no fields left returns 400"""
+        for params in (
+            {'fields': 'title,secret'},
+            {'exclude': 'nope'},
+            {'fields': 'title', 'exclude': 'title'},
+        ):
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
+
+    def test_writes_ignore_fields(self):
+        """test fields only shapes reads, a write returns everything"""
+        res = self.client.patch(
+            detail_url(self.recipe.id) + '?fields=title', {'title': 'New'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('description', res.data)
+
+    def test_tags_and_ingredients(self):
+        """test tags and ingredients take fields too"""
+        res, queries = self._get(TAGS_URL, {'fields': 'name'})
+
+        self.assertEqual(res.data['results'][0], {'name': 'Tag 2'})
+        self.assertEqual(len(queries), 1)
+
+        res = self.client.get(INGREDIENTS_URL, {'exclude': 'recipe_count'})
+
+        self.assertEqual(set(res.data['results'][0]), {'id', 'name'})
+
+    def test_cursor_columns_loaded(self):
+        """test paging a trimmed list doesn't reload ordering columns"""
+        res, queries = self._get(TAGS_URL, {'fields': 'id', 'page_size': 2})
+
+        self.assertIsNotNone(res.data['next'])
+        self.assertEqual(len(queries), 1)
@@ -3,6 +3,8 @@ test for the tag apis
 """
 from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 
@@ -52,7 +54,7 @@ class PrivateTagsApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test that tags returned are for the authenticated user."""
@@ -64,9 +66,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAG_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
 
     def test_update_tag(self):
         """Test updating a tag"""
@@ -106,10 +108,11 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAG_URL, {'assigned_only': 1})
 
+        tag1.refresh_from_db()
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_filtered_tags_unique(self):
         """Test filtering tags returns unique tags"""
@@ -132,4 +135,139 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAG_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_paginate_tags_by_name(self):
+        """Test tags are paginated by name with a stable cursor"""
+        for name in ['Apple', 'Banana', 'Cherry', 'Dates', 'Eggs']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAG_URL, {'page_size': 2})
+        seen = [t['id'] for t in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            seen += [t['id'] for t in res.data['results']]
+
+        expected = Tag.objects.order_by('-name', '-id')
+        self.assertEqual(seen, [t.id for t in expected])
+
+    def test_update_tag_duplicate_name_rejected(self):
+        """Test renaming a tag to an existing name fails validation"""
+        Tag.objects.create(user=self.user, name='Breakfast')
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Breakfast'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Lunch')
+
+    def test_list_tags_recipe_count(self):
+        """Test each tag carries the number of recipes using it"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        for title in ['Pancake', 'Omelette']:
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=title,
+                time_minutes=10,
+                price=Decimal('4.00'),
+            )
+            recipe.tags.add(tag1)
+
+        res = self.client.get(TAG_URL)
+
+        counts = {t['id']: t['recipe_count'] for t in res.data['results']}
+        self.assertEqual(counts, {tag1.id: 2, tag2.id: 0})
+
+    def test_assigned_only_uses_counter(self):
+        """Test assigned_only reads the stored counter, no join/DISTINCT"""
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(5)
+        ]
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Pancake',
+            time_minutes=10,
+            price=Decimal('4.00'),
+        )
+        recipe.tags.add(*tags)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAG_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 5)
+        tag_queries = [
+            q['sql'] for q in ctx.captured_queries
+            if 'core_tag' in q['sql']
+        ]
+        self.assertEqual(len(tag_queries), 1)
+        self.assertNotIn('core_recipe_tags', tag_queries[0])
+        self.assertNotIn('DISTINCT', tag_queries[0])
+
+    def test_list_tags_popular(self):
+        """Test ordering=popular lists the most used tags first"""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Apple', 'Banana', 'Cherry']
+        ]
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=Decimal('4.00'),
+            )
+            recipe.tags.add(*tags[:i + 1])
+
+        res = self.client.get(TAG_URL, {'ordering': 'popular', 'page_size': 2})
+        seen = [(t['name'], t['recipe_count']) for t in res.data['results']]
+        res = self.client.get(res.data['next'])
+        seen += [(t['name'], t['recipe_count']) for t in res.data['results']]
+
+        self.assertEqual(seen, [('Apple', 3), ('Banana', 2), ('Cherry', 1)])
+
+    def test_popular_pages_through_ties(self):
+        """Test popular pages walk shared counts without offsets or repeats"""
+        for i in range(7):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+        expected = list(
+            Tag.objects.filter(user=self.user)
+            .order_by('-recipe_count', '-id').values_list('name', flat=True)
+        )
+
+        seen, url = [], TAG_URL
+        params = {'ordering': 'popular', 'page_size': 3}
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(url, params)
+            self.assertFalse(any(
+                'OFFSET' in q['sql'] for q in ctx.captured_queries
+            ))
+            seen += [t['name'] for t in res.data['results']]
+            url, params = res.data['next'], None
+        self.assertEqual(seen, expected)
+
+        # and back from the last page
+        back = [t['name'] for t in res.data['results']]
+        url = res.data['previous']
+        while url:
+            res = self.client.get(url)
+            back = [t['name'] for t in res.data['results']] + back
+            url = res.data['previous']
+        self.assertEqual(back, expected)
+
+    def test_invalid_cursor(self):
+        """Test a cursor that doesn't decode to the ordering is a 404"""
+        res = self.client.get(
+            TAG_URL, {'ordering': 'popular', 'cursor': 'cD1bImEiXQ=='},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_assigned_only_invalid(self):
+        """Test a non-integer assigned_only is a validation error"""
+        res = self.client.get(TAG_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,98 @@
+"""
+Tests for the materialized tag/ingredient usage counters
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core import usage
+from core.models import Recipe, Tag, Ingredient
+
+
+def create_recipe(user, title='Recipe'):
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=Decimal('4.00'),
+    )
+
+
+class UsageCounterTests(TestCase):
+    """Test recipe_count follows relation changes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123',
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Breakfast', 'Lunch', 'Dinner']
+        ]
+        self.recipe = create_recipe(self.user)
+
+    def counts(self):
+        return [
+            Tag.objects.get(id=tag.id).recipe_count for tag in self.tags
+        ]
+
+    def test_add_remove_from_recipe(self):
+        """Test adding and removing tags on a recipe"""
+        self.recipe.tags.add(*self.tags[:2])
+        # re-adding an existing link changes nothing
+        self.recipe.tags.add(self.tags[0])
+        self.assertEqual(self.counts(), [1, 1, 0])
+
+        # removing something that isn't linked changes nothing
+        self.recipe.tags.remove(self.tags[1], self.tags[2])
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+        self.recipe.tags.set([self.tags[1], self.tags[2]])
+        self.assertEqual(self.counts(), [0, 1, 1])
+
+        self.recipe.tags.clear()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_add_remove_from_tag(self):
+        """Test changing links from the tag side"""
+        other = create_recipe(self.user, title='Other')
+        self.tags[0].recipe_set.add(self.recipe, other)
+        self.assertEqual(self.counts(), [2, 0, 0])
+
+        self.tags[0].recipe_set.remove(other)
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+        self.tags[0].recipe_set.clear()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_recipe_delete(self):
+        """Test deleting recipes releases their tags and ingredients"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Eggs')
+        other = create_recipe(self.user, title='Other')
+        for recipe in (self.recipe, other):
+            recipe.tags.add(self.tags[0])
+            recipe.ingredients.add(ingredient)
+
+        self.recipe.delete()
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+        Recipe.objects.filter(id=other.id).delete()
+        self.assertEqual(self.counts(), [0, 0, 0])
+        ingredient.refresh_from_db()
+        self.assertEqual(ingredient.recipe_count, 0)
+
+    def test_drift_detected_and_fixed(self):
+        """Test drift against the live aggregate and recomputing it"""
+        self.recipe.tags.add(self.tags[0])
+        Tag.objects.filter(id=self.tags[1].id).update(recipe_count=5)
+        # through table writes bypass the signals
+        Recipe.tags.through.objects.filter(recipe=self.recipe).delete()
+
+        self.assertEqual(usage.usage_drift(Tag), [
+            (self.tags[0].id, 1, 0),
+            (self.tags[1].id, 5, 0),
+        ])
+
+        self.assertEqual(usage.refresh_usage_counts(Tag), 2)
+        self.assertEqual(usage.usage_drift(Tag), [])
+        self.assertEqual(self.counts(), [0, 0, 0])
+        # nothing left to write
+        self.assertEqual(usage.refresh_usage_counts(Tag), 0)
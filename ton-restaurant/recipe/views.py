@@ -1,20 +1,65 @@
 """
 views for recipe apis
 """
+import re
+
 from drf_spectacular.utils import (
     extend_schema,
     extend_schema_view,
     OpenApiParameter,
     OpenApiTypes,
 )
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import (viewsets, mixins, status, )
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from core import search
+from core.media import serve_media
 from core.models import (Recipe, Tag, Ingredient, )
-from recipe import serializers
+from user.authentication import CachedTokenAuthentication
+from recipe import serializers, images
+from recipe.bulk import BulkValidationError, apply_bulk
+from recipe.cache import CachedListMixin
+from recipe.export import iter_csv, iter_jsonl
+from recipe.fastpath import FastReadMixin
+from recipe.fields import SparseFieldsMixin
+from recipe.filters import filter_recipes
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+)
+
+# export_format -> (row writer, content type, file extension)
+EXPORT_FORMATS = {
+    'jsonl': (iter_jsonl, 'application/x-ndjson', 'jsonl'),
+    'csv': (iter_csv, 'text/csv', 'csv'),
+}
+
+# uploads/recipe/<uuid>.<ext> and the variants recipe/images.py makes of it
+_recipe_image_re = re.compile(
+    r'^(?:variants/)?(?P<stem>[\w-]+?)(?P<variant>-\d+w)?\.\w+$'
+)
+
+# ?fields= / ?exclude= on list and retrieve, see recipe/fields.py
+SPARSE_FIELD_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated fields to return, the rest are left out',
+    ),
+    OpenApiParameter(
+        'exclude',
+        OpenApiTypes.STR,
+        description='Comma separated fields to leave out',
+    ),
+]
 
 @extend_schema_view(
     list=extend_schema(
@@ -29,43 +74,119 @@ from recipe import serializers
                 OpenApiTypes.STR,
                 description='Comma separated list of ingredient IDs to filter',
             ),
-        ]
-    )
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR, enum=['any', 'all'],
+                description=(
+                    'any (default) - recipes with at least one of the tags/'
+                    'ingredients, all - recipes with every one of them'
+                ),
+            ),
+            OpenApiParameter(
+                'time_minutes_min', OpenApiTypes.INT,
+                description='Minimum preparation time in minutes',
+            ),
+            OpenApiParameter(
+                'time_minutes_max', OpenApiTypes.INT,
+                description='Maximum preparation time in minutes',
+            ),
+            OpenApiParameter(
+                'price_min', OpenApiTypes.DECIMAL,
+                description='Minimum price',
+            ),
+            OpenApiParameter(
+                'price_max', OpenApiTypes.DECIMAL,
+                description='Maximum price',
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description=(
+                    'Full text search over title, description, tag and '
+                    'ingredient names, best matches first'
+                ),
+            ),
+        ] + SPARSE_FIELD_PARAMETERS
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELD_PARAMETERS),
 )
 
 # modelviewset is set to work direclty with the model
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin,
+                    FastReadMixin,
+                    SparseFieldsMixin,
+                    viewsets.ModelViewSet):
     """Manage recipes in the database"""
     # use RecipeDetailSerializer since its most uused in several functions
     # if list is called at get_serializer_class fun then RecieSerailzer is called
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
     # for one to access must go through tokenauth and also authenticated
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    # query plan per action - related objects loaded up front so
+    # nested tags/ingredients cost one query each instead of one per recipe
+    # actions not listed here load nothing extra
+    query_plans = {
+        'list': {'prefetch': ['tags', 'ingredients']},
+        'retrieve': {'prefetch': ['tags', 'ingredients']},
+        # writes reload the relations after save so prefetching is wasted
+        'upload_image': {},
+        'destroy': {},
+        # export prefetches chunk by chunk itself
+        'export': {},
+        'bulk': {},
+    }
 
-    def _params_to_ints(self, qs):
-        """Convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+    def _apply_query_plan(self, queryset):
+        """Add the select/prefetch strategy for the current action"""
+        plan = self.query_plans.get(self.action, {})
+        prefetch = plan.get('prefetch', [])
+        sparse = self.sparse_load_plan()
+        if sparse is not None:
+            # no prefetch for tags/ingredients left out of the response
+            prefetch = [name for name in prefetch if name in sparse[1]]
+        if plan.get('select'):
+            queryset = queryset.select_related(*plan['select'])
+        if prefetch:
+            # nested lists in id order, the order the fast path returns
+            lookups = []
+            for name in prefetch:
+                related = Recipe._meta.get_field(name).related_model
+                lookups.append(
+                    Prefetch(name, queryset=related.objects.order_by('id')),
+                )
+            queryset = queryset.prefetch_related(*lookups)
+        return self.load_only_rendered(queryset)
 
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user"""
         # filter the recipes only for the specific users in the system
         # return self.queryset.filter(user=self.request.user).order_by('-id')
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(
+        queryset = filter_recipes(self.queryset, self.request.query_params)
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).defer('search_vector')
+
+        term = self.request.query_params.get('search', '').strip()
+        if term:
+            queryset = search.search_recipes(queryset, term)
+        if self.is_ranked_search:
+            queryset = queryset.order_by('-search_rank', '-id')
+        else:
+            queryset = queryset.order_by('-id')
+
+        # filters and search use subqueries - no join fan out to DISTINCT away
+        return self._apply_query_plan(queryset)
+
+    @property
+    def is_ranked_search(self):
+        """best matches first - only postgres can rank"""
+        return (
+            bool(self.request.query_params.get('search', '').strip())
+            and search.is_supported()
+        )
 
      # all occasions except for listing use RecipeDetailSerializer
     def get_serializer_class(self):
@@ -94,11 +215,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            # old variants belong to the old image - cleared until the
+            # worker has built new ones
+            old_variants = recipe.image_variants
+            recipe = serializer.save(image_variants={})
+            images.delete_variants_on_commit(old_variants)
+            images.schedule_recipe_image(recipe)
             return Response(serializer.data, status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'export_format',
+                OpenApiTypes.STR, enum=list(EXPORT_FORMATS),
+                description='jsonl (default) or csv',
+            ),
+        ]
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream every recipe of the user as JSON Lines or CSV"""
+        export_format = request.query_params.get('export_format', 'jsonl')
+        if export_format not in EXPORT_FORMATS:
+            choices = ', '.join(EXPORT_FORMATS)
+            return Response(
+                {'export_format': f'Must be one of {choices}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        writer, content_type, ext = EXPORT_FORMATS[export_format]
+        # streamed straight out - bypasses drf renderers and pagination
+        response = StreamingHttpResponse(
+            writer(
+                self.filter_queryset(self.get_queryset()),
+                self.get_serializer_context(),
+                settings.RECIPE_EXPORT_CHUNK_SIZE,
+            ),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{ext}"'
+        )
+        return response
+
+    @extend_schema(
+        request=OpenApiTypes.OBJECT,
+        responses=OpenApiTypes.OBJECT,
+        description=(
+            'Body: {"create": [recipe, ...], "update": [{"id": 1, ...}, ...], '
+            '"delete": [id, ...]}. All items are validated first; any error '
+            'returns 400 with errors keyed by operation and index and '
+            'nothing is written.'
+        ),
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Create, partially update and delete many recipes at once"""
+        if not isinstance(request.data, dict):
+            return Response(
+                {'non_field_errors': ['Expected an object.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            result = apply_bulk(
+                request.user, request.data, self.get_serializer_context(),
+            )
+        except BulkValidationError as exc:
+            return Response(exc.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(result, status=status.HTTP_200_OK)
+
 # use mixin to add functionality
 # ensure mixin defined b4 generic
 @extend_schema_view(
@@ -107,28 +294,50 @@ class RecipeViewSet(viewsets.ModelViewSet):
             OpenApiParameter(
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
-                description='Filter by time assigned',
+                description='Only tags/ingredients assigned to a recipe',
                 ),
-        ]
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR, enum=['popular'],
+                description='popular lists the most used first',
+                ),
+        ] + SPARSE_FIELD_PARAMETERS
     )
 )
-class BaseRecipeAttrViewSet(mixins.ListModelMixin,
+class BaseRecipeAttrViewSet(CachedListMixin,
+                            SparseFieldsMixin,
+                            mixins.ListModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin,
                             viewsets.GenericViewSet):
     """base class for tag and ingredient viewset"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+    # the cursor is built from the ordering columns of the last row
+    sparse_always_load = ('name', 'recipe_count')
+
+    @property
+    def is_popular_ordering(self):
+        """most used first instead of by name"""
+        return self.request.query_params.get('ordering') == 'popular'
 
     def get_queryset(self):
         """Retrieve the ingredients/tags for the authenticated user"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
-        queryset = self.queryset
+        try:
+            assigned_only = bool(
+                int(self.request.query_params.get('assigned_only', 0))
+            )
+        except ValueError:
+            raise ValidationError({'assigned_only': ['Must be 0 or 1.']})
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+            # stored counter - no join to the recipe links at all
+            queryset = queryset.filter(recipe_count__gt=0)
+        queryset = self.load_only_rendered(queryset)
+        if self.is_popular_ordering:
+            return queryset.order_by('-recipe_count', '-id')
+        return queryset.order_by('-name')
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
@@ -139,3 +348,34 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+class RecipeImageView(APIView):
+    """Recipe images and their variants, for the recipe's owner only"""
+    # session too, so the browsable api and admin can show them
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        operation_id='recipe_image_retrieve', tags=['recipe'],
+        responses={(200, 'image/*'): OpenApiTypes.BINARY},
+    )
+    def get(self, request, name):
+        """The file, or a header telling the proxy to send it"""
+        match = _recipe_image_re.match(name)
+        if match is None:
+            raise Http404(name)
+        if name.startswith('variants/') != bool(match['variant']):
+            raise Http404(name)
+        image = f'uploads/recipe/{name}'
+        recipes = Recipe.objects.filter(user=request.user)
+        if match['variant']:
+            # variants/<uuid>-320w.webp belongs to uploads/recipe/<uuid>.*
+            recipes = recipes.filter(
+                image__startswith=f'uploads/recipe/{match["stem"]}.',
+            )
+        else:
+            recipes = recipes.filter(image=image)
+        if not recipes.exists():
+            raise Http404(name)
+        return serve_media(request, image)
@@ -0,0 +1,82 @@
+"""
+gunicorn config for production
+
+    gunicorn -c python:ton_restaurant.gunicorn_conf
+
+worker model comes from ton_restaurant.serving, WEB_* env vars override it
+"""
+import os
+
+from ton_restaurant import serving
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ton_restaurant.settings')
+
+_profile = serving.worker_profile()
+
+bind = _profile['bind']
+wsgi_app = _profile['wsgi_app']
+worker_class = _profile['worker_class']
+workers = _profile['workers']
+threads = _profile['threads']
+keepalive = _profile['keepalive']
+max_requests = _profile['max_requests']
+max_requests_jitter = _profile['max_requests_jitter']
+timeout = _profile['timeout']
+graceful_timeout = _profile['graceful_timeout']
+preload_app = _profile['preload_app']
+worker_tmp_dir = _profile['worker_tmp_dir']
+accesslog = _profile['accesslog']
+errorlog = _profile['errorlog']
+
+# workers share their metrics next to the heartbeat files, see core/metrics
+os.environ.setdefault(
+    'METRICS_MULTIPROCESS_DIR', os.path.join(worker_tmp_dir, 'ton-metrics'),
+)
+
+
+def on_starting(server):
+    """refuse to start workers if the self-check finds errors"""
+    import django
+    django.setup()
+    server.log.info(
+        'serving %s with %s x %s (%s threads)', wsgi_app, workers,
+        worker_class, threads,
+    )
+    from django.conf import settings
+    from django.db import connections
+    from core import metrics
+    errors, warnings = serving.self_check(_profile)
+    if settings.METRICS_MULTIPROCESS_DIR:
+        # counters restart with the server, not with each worker
+        metrics.SharedStore(settings.METRICS_MULTIPROCESS_DIR).reset()
+    # forked workers must not inherit the check's db socket
+    connections.close_all()
+    for message in warnings:
+        server.log.warning('self-check: %s', message)
+    for message in errors:
+        server.log.error('self-check: %s', message)
+    if errors:
+        raise SystemExit(1)
+
+
+def post_fork(server, worker):
+    # a preloaded app may have connected in the master - never share
+    # those sockets between processes
+    from django.db import connections
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # last requests since the periodic flush
+    from core import metrics
+    metrics.flush(force=True)
+
+
+def child_exit(server, worker):
+    # in the master - keep a recycled worker's counts in the archive
+    from django.conf import settings
+    from core import metrics
+    if settings.METRICS_MULTIPROCESS_DIR:
+        metrics.SharedStore(settings.METRICS_MULTIPROCESS_DIR).archive(
+            worker.pid,
+        )
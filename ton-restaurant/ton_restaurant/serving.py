@@ -0,0 +1,148 @@
+"""
+production serving profile - gunicorn worker settings derived from the cpu
+count, and the self-check run before any worker starts
+
+see ton_restaurant/gunicorn_conf.py
+"""
+import os
+
+# gunicorn worker class and the app it serves
+WORKER_CLASSES = {
+    'sync': ('sync', 'ton_restaurant.wsgi:application'),
+    'gthread': ('gthread', 'ton_restaurant.wsgi:application'),
+    'uvicorn': (
+        'uvicorn.workers.UvicornWorker', 'ton_restaurant.asgi:application',
+    ),
+}
+
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer, got {value!r}')
+
+
+def worker_profile(cpu_count=None, environ=None):
+    """gunicorn settings for this machine, each overridable from the env"""
+    if environ is None:
+        environ = os.environ
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+
+    kind = environ.get('WEB_WORKER_CLASS', 'gthread')
+    if kind not in WORKER_CLASSES:
+        raise ValueError(
+            f'WEB_WORKER_CLASS must be one of {", ".join(WORKER_CLASSES)}, '
+            f'got {kind!r}'
+        )
+    worker_class, app = WORKER_CLASSES[kind]
+
+    # the api is sync django waiting on postgres - gthread overlaps those
+    # waits with a few threads per process, so fewer processes (and db
+    # connections) are needed than the classic 2 * cores + 1 for sync.
+    # django runs sync views on one thread per process under asgi, so
+    # uvicorn workers are sized like sync ones
+    if kind == 'gthread':
+        workers, threads = cpu_count + 1, 4
+    else:
+        workers, threads = 2 * cpu_count + 1, 1
+    workers = min(workers, _env_int(environ, 'WEB_MAX_WORKERS', 12))
+    max_requests = _env_int(environ, 'WEB_MAX_REQUESTS', 1000)
+
+    return {
+        'bind': environ.get('WEB_BIND', '0.0.0.0:8000'),
+        'wsgi_app': app,
+        'worker_class': worker_class,
+        'workers': _env_int(environ, 'WEB_CONCURRENCY', workers),
+        'threads': _env_int(environ, 'WEB_THREADS', threads),
+        # keep above the load balancer's idle timeout so it never reuses a
+        # connection gunicorn already closed (sync workers don't keep alive)
+        'keepalive': _env_int(environ, 'WEB_KEEPALIVE', 5),
+        # recycle workers so slow leaks can't grow forever, jittered so
+        # they don't all restart at once
+        'max_requests': max_requests,
+        'max_requests_jitter': _env_int(
+            environ, 'WEB_MAX_REQUESTS_JITTER', max_requests // 10,
+        ),
+        'timeout': _env_int(environ, 'WEB_TIMEOUT', 30),
+        'graceful_timeout': _env_int(environ, 'WEB_GRACEFUL_TIMEOUT', 30),
+        # import django once in the master, workers share the pages
+        'preload_app': environ.get('WEB_PRELOAD', '1') == '1',
+        # heartbeat files on tmpfs, the container overlay fs can stall them
+        'worker_tmp_dir': environ.get('WEB_WORKER_TMP_DIR', '/dev/shm'),
+        'accesslog': '-',
+        'errorlog': '-',
+    }
+
+
+def db_connections_needed(profile):
+    """connections the workers can hold open at once"""
+    # one per request thread, plus the image worker pool in every process
+    from django.conf import settings
+    per_worker = profile['threads'] + settings.RECIPE_IMAGE_WORKERS
+    return profile['workers'] * per_worker
+
+
+def self_check(profile):
+    """(errors, warnings) found before serving with profile"""
+    from django.conf import settings
+    from django.core import checks
+    from django.db import connection
+    from django.db.utils import OperationalError
+
+    errors, warnings = [], []
+    for message in checks.run_checks(include_deployment_checks=True):
+        if message.level >= checks.ERROR:
+            errors.append(str(message))
+        elif message.level >= checks.WARNING:
+            warnings.append(str(message))
+
+    if profile['workers'] < 1 or profile['threads'] < 1:
+        errors.append('workers and threads must be at least 1')
+
+    backend = settings.CACHES['default']['BACKEND']
+    locmem = profile['workers'] > 1 and backend.endswith('LocMemCache')
+    if locmem:
+        # the other workers would keep serving stale lists (and 304s)
+        errors.append(
+            f'{profile["workers"]} workers with a per process locmem cache - '
+            'a write only invalidates cached lists in the worker that served '
+            'it, set CACHE_BACKEND to a shared cache'
+        )
+    # drf throttles count in the default cache too, see user/throttles.py
+    if locmem and (settings.LOGIN_THROTTLE_RATE_IP
+                   or settings.LOGIN_THROTTLE_RATE_EMAIL):
+        errors.append(
+            f'login throttling on a per process locmem cache lets through '
+            f'{profile["workers"]} times the configured rate, set '
+            'CACHE_BACKEND to a shared cache'
+        )
+
+    if profile['workers'] > 1 and not settings.METRICS_MULTIPROCESS_DIR:
+        warnings.append(
+            f'{profile["workers"]} workers without METRICS_MULTIPROCESS_DIR - '
+            'each /metrics scrape only reports the worker that answered it'
+        )
+
+    try:
+        connection.ensure_connection()
+        # behind pgbouncer the server connections are pgbouncer's to budget
+        if (connection.vendor == 'postgresql'
+                and settings.DB_POOL_MODE != 'pgbouncer'):
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW max_connections')
+                max_connections = int(cursor.fetchone()[0])
+            needed = db_connections_needed(profile)
+            if needed > max_connections:
+                errors.append(
+                    f'workers can open {needed} db connections but postgres '
+                    f'allows {max_connections}'
+                )
+    except OperationalError as exc:
+        errors.append(f'database unavailable: {exc}')
+
+    return errors, warnings
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 
+import importlib.util
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -22,12 +23,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-=#j^mtvde!o)yjp8ykz28lb(x=xio4xn6w_srj-a%%xeh72u#+'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-=#j^mtvde!o)yjp8ykz28lb(x=xio4xn6w_srj-a%%xeh72u#+',
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# the production serving profile runs with DJANGO_DEBUG=0
+DEBUG = bool(int(os.environ.get('DJANGO_DEBUG', 1)))
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host
+]
 
 
 # Application definition
@@ -48,6 +55,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # answers /health/live/ and /health/ready/ before the rest run
+    'core.middleware.HealthCheckMiddleware',
+    # sql/serialize/total timings per view, Server-Timing and /metrics
+    'core.middleware.RequestMetricsMiddleware',
+    # opt-in N+1 / slow query logging
+    'core.middleware.QueryDetectorMiddleware',
+    # brotli/gzip for json, msgpack and text bodies over COMPRESSION_MIN_SIZE
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,16 +96,135 @@ WSGI_APPLICATION = 'ton_restaurant.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DB_POOL_MODE
+#   session   - django holds one persistent connection per thread (default)
+#   pgbouncer - DB_HOST is pgbouncer in transaction pooling mode, so no
+#               server side cursors, they don't survive between transactions
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'session')
+if DB_POOL_MODE not in ('session', 'pgbouncer'):
+    raise ValueError(f'DB_POOL_MODE must be session or pgbouncer, got {DB_POOL_MODE!r}')
+
+# seconds a connection is reused across requests, 0 closes it after every
+# request, empty keeps it forever
+DB_CONN_MAX_AGE = os.environ.get('DB_CONN_MAX_AGE', '60')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django's backend plus per request health checks and connection
+        # metrics, see core/db/backends/postgresql/base.py
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(DB_CONN_MAX_AGE) if DB_CONN_MAX_AGE else None,
+        # ping a reused connection once per request before trusting it
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOL_MODE == 'pgbouncer',
+    }
+}
+
+
+# liveness (process up) and readiness (database answers) probe paths,
+# see core/middleware.py
+HEALTH_LIVE_PATH = os.environ.get('HEALTH_LIVE_PATH', '/health/live/')
+HEALTH_READY_PATH = os.environ.get('HEALTH_READY_PATH', '/health/ready/')
+
+# prometheus scrape path and the bearer token it requires - without a
+# token it answers 404 unless METRICS_PUBLIC=1 opens it to anyone
+METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', '0') == '1'
+# directory the worker processes share their metrics through, so a scrape
+# of any worker covers all of them - set by ton_restaurant.gunicorn_conf,
+# empty for one process (runserver, tests)
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR', '')
+# per request db/serialize/app/total timings sent to the client
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '1') == '1'
+
+# log requests running one sql shape more than the threshold (N+1) or a
+# query slower than QUERY_DETECTOR_SLOW_MS (0 = off), raise instead in tests
+QUERY_DETECTOR_ENABLED = os.environ.get('QUERY_DETECTOR_ENABLED', '0') == '1'
+QUERY_DETECTOR_REPEAT_THRESHOLD = int(os.environ.get('QUERY_DETECTOR_REPEAT_THRESHOLD', 5))
+QUERY_DETECTOR_SLOW_MS = int(os.environ.get('QUERY_DETECTOR_SLOW_MS', 200))
+QUERY_DETECTOR_RAISE = False
+
+# compress responses in the app (brotli when installed, else gzip) - turn
+# off when a proxy in front already does it
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+# bodies smaller than this fit in a packet or two, compressing them is waste
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# locmem is per process - point at a shared backend when running several
+# workers, the serving self-check refuses to start them on locmem
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'ton-restaurant'),
     }
 }
 
+# seconds a cached recipe/tag/ingredient list page is kept
+RECIPE_LIST_CACHE_TIMEOUT = int(os.environ.get('RECIPE_LIST_CACHE_TIMEOUT', 300))
+
+
+# token -> user lookups cached per process, see user/authentication.py
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.2/topics/auth/passwords/
+# new passwords use the first hasher, older hashes are upgraded on login.
+# argon2 needs argon2-cffi, scrypt only the standard library
+
+PASSWORD_HASHER = os.environ.get(
+    'PASSWORD_HASHER',
+    'argon2' if importlib.util.find_spec('argon2') else 'scrypt',
+)
+_PASSWORD_HASHERS = {
+    'argon2': 'user.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'user.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise ValueError(
+        f'PASSWORD_HASHER must be one of {", ".join(_PASSWORD_HASHERS)}, '
+        f'got {PASSWORD_HASHER!r}'
+    )
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# argon2id costs, memory in KiB - around OWASP's 19 MiB / 2 passes / 1 lane
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19456))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1))
+# scrypt costs, 128 * n * r bytes of memory - 16 MiB
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1))
+
+# hashes running at once per process, a login waiting longer than the
+# timeout for a slot gets a 429 - see user/throttles.py
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 1))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+
+# token logins allowed per client ip and per email, empty turns one off.
+# the ip rate is loose since a restaurant's staff share one address
+LOGIN_THROTTLE_RATE_IP = os.environ.get('LOGIN_THROTTLE_RATE_IP', '60/min')
+LOGIN_THROTTLE_RATE_EMAIL = os.environ.get('LOGIN_THROTTLE_RATE_EMAIL', '10/min')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -134,6 +268,32 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# how recipe images are sent once the owner is checked, see core/media.py:
+# django - FileResponse with Range/ETag, sendfile() under gunicorn
+# accel - X-Accel-Redirect to MEDIA_ACCEL_REDIRECT_PREFIX, an nginx
+#   internal location aliased to MEDIA_ROOT
+# sendfile - X-Sendfile with the file path (apache mod_xsendfile, lighttpd)
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+if MEDIA_SERVE_MODE not in ('django', 'accel', 'sendfile'):
+    raise ValueError(f'MEDIA_SERVE_MODE must be django, accel or sendfile, got {MEDIA_SERVE_MODE!r}')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# upload names are never reused, so clients may keep them for a year
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 365 * 24 * 60 * 60))
+
+# resized copies made for each uploaded recipe image, see recipe/images.py
+RECIPE_IMAGE_WIDTHS = [320, 640, 1280]
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# recipe list/retrieve built from values() rows instead of model instances,
+# see recipe/fastpath.py
+RECIPE_FAST_READS = os.environ.get('RECIPE_FAST_READS', '1') == '1'
+
+# recipes loaded per query while streaming an export
+RECIPE_EXPORT_CHUNK_SIZE = 500
+
+# create + update + delete items accepted by one bulk request
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 5000))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -142,8 +302,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 
 # configure django rest framework to use drf in openapi to generate achema
+# json is rendered/parsed with orjson when installed, messagepack is offered
+# for Accept/Content-Type application/msgpack when msgpack is - see
+# core/renderers.py
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (
+        ['core.renderers.MessagePackRenderer']
+        if importlib.util.find_spec('msgpack') else []
+    ),
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (
+        ['core.parsers.MessagePackParser']
+        if importlib.util.find_spec('msgpack') else []
+    ),
 }
 
 # for images to upload through browserbale interfgace
@@ -22,12 +22,24 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import metrics_view
+from recipe.views import RecipeImageView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'), # an api generate schema file from code
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='api-schema'), name='api-docs'),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    # prometheus scrape, see core/metrics.py
+    path(settings.METRICS_PATH.lstrip('/'), metrics_view, name='metrics'),
+    # recipe images checked against the owner, in production too - the
+    # bytes go out through the proxy, see core/media.py
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}uploads/recipe/<path:name>',
+        RecipeImageView.as_view(),
+        name='recipe-image',
+    ),
 ]
 # make djngo development server to server media files
 if settings.DEBUG:
@@ -0,0 +1,77 @@
+"""
+authentication classes for the apis
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Bounded LRU of token key -> (user, token) with a ttl"""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        """drop every token belonging to a user"""
+        with self._lock:
+            stale = [
+                key for key, (_, (user, _)) in self._entries.items()
+                if user.pk == user_id
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# one cache per process - the ttl bounds how long another worker can keep
+# honouring a token that was deleted or a user that was deactivated there
+token_cache = TokenCache(
+    maxsize=settings.TOKEN_AUTH_CACHE_SIZE,
+    ttl=settings.TOKEN_AUTH_CACHE_TTL,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token auth that skips the token/user query for recently seen tokens"""
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            # runs the query and the is_active check, raises when invalid
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # copy so a view mutating request.user can't leak into other requests
+        return copy.copy(user), token
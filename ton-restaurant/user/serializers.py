@@ -10,6 +10,8 @@ from django.utils.translation import gettext_lazy as _
 # 1. take JSON input from API - VALDATES - convert to py object otr model
 from rest_framework import serializers
 
+from user.throttles import hashing_slot
+
 # modelserializer allow valiadtion and save to specific model definned
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for user object"""
@@ -28,7 +30,8 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Create and return a new user"""
         # override create - handle hashing
-        return get_user_model().objects.create_user(**validated_data)
+        with hashing_slot():
+            return get_user_model().objects.create_user(**validated_data)
 
     # instance - existing user obj to update
     # validated data - dict with data to update
@@ -42,7 +45,8 @@ class UserSerializer(serializers.ModelSerializer):
 
         # popped out pass will be hashed here
         if password:
-            user.set_password(password)
+            with hashing_slot():
+                user.set_password(password)
             user.save()
 
         return user
@@ -61,11 +65,13 @@ class AuthTokenSerializer(serializers.Serializer):
         """Validate and authenticate the user"""
         email = attrs.get('email') # get email passed at endpoint
         password = attrs.get('password')
-        user = authenticate(
-            request=self.context.get('request'),
-            username=email, # email is username
-            password=password,
-        )
+        # a hash made by an older hasher is upgraded in here on success
+        with hashing_slot():
+            user = authenticate(
+                request=self.context.get('request'),
+                username=email,  # email is username
+                password=password,
+            )
         # if user is not None - return user
         if not user:
             msg = _('Unable to authenticate with provided credentials')
@@ -0,0 +1,22 @@
+"""
+signals for user apis - drop cached token lookups when they go stale
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+# covers deactivation and password change through UserSerializer.update,
+# admin or shell - any save means the cached user copy is out of date
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(sender, instance, **kwargs):
+    token_cache.delete_user(instance.pk)
@@ -0,0 +1,98 @@
+"""
+Tests for the cached token authentication
+"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from user.authentication import TokenCache, token_cache
+
+ME_URL = reverse('user:me')
+
+
+def create_user(**params):
+    return get_user_model().objects.create_user(**params)
+
+
+class TokenCacheTests(TestCase):
+    """Test the bounded token cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache never grows past maxsize"""
+        cache = TokenCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        """Test entries older than the ttl are dropped"""
+        cache = TokenCache(maxsize=2, ttl=-1)
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with a cached token"""
+    def setUp(self):
+        token_cache.clear()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_request_skips_token_query(self):
+        """Test a second request does not look the token up again"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token_rejected(self):
+        """Test deleting the token invalidates the cached lookup"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test deactivating the user invalidates the cached lookup"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_refreshes_user(self):
+        """Test changing password through the api drops the cached user"""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(
+            ME_URL, {'name': 'New', 'password': 'newpass123'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # next request goes back to the database
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.data['name'], 'New')
@@ -0,0 +1,126 @@
+"""
+Tests for the password hashers and rehash on login
+"""
+import importlib.util
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import (
+    check_password,
+    identify_hasher,
+    make_password,
+)
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.hashers import ScryptPasswordHasher, TunedArgon2PasswordHasher
+
+TOKEN_URL = reverse('user:token')
+
+SCRYPT_FIRST = [
+    'user.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+]
+
+
+class ScryptPasswordHasherTests(SimpleTestCase):
+    """Test the scrypt hasher backported from django 4.0."""
+
+    @override_settings(PASSWORD_HASHERS=SCRYPT_FIRST)
+    def test_encode_and_verify(self):
+        """Test a hash verifies its password only."""
+        encoded = make_password('s3cret-pass', salt='seasalt')
+
+        self.assertTrue(encoded.startswith('scrypt$16384$seasalt$8$1$'))
+        self.assertTrue(check_password('s3cret-pass', encoded))
+        self.assertFalse(check_password('s3cret-pasS', encoded))
+
+    def test_django_40_format(self):
+        """Test hashes match django 4.0's ScryptPasswordHasher output."""
+        hasher = ScryptPasswordHasher()
+
+        encoded = hasher.encode('lètmein', 'seasalt', n=2 ** 14, r=8, p=1)
+
+        self.assertEqual(
+            encoded,
+            'scrypt$16384$seasalt$8$1$Qj3+9PPyRjSJIebHnG81TMjsqtaIGxNQG/aEB/NY'
+            'afTJ7tibgfYz71m0ldQESkXFRkdVCBhhY8mx7rQwite/Pw==',
+        )
+
+    @override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 12)
+    def test_must_update_when_costs_change(self):
+        """Test hashes made with other costs are flagged for rehashing."""
+        hasher = ScryptPasswordHasher()
+
+        self.assertTrue(hasher.must_update(
+            hasher.encode('pass', 'seasalt', n=2 ** 14, r=8, p=1)
+        ))
+        self.assertFalse(hasher.must_update(hasher.encode('pass', 'seasalt')))
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('argon2'), 'argon2-cffi not installed',
+)
+class TunedArgon2PasswordHasherTests(SimpleTestCase):
+    """Test argon2 runs with the costs from settings."""
+
+    @override_settings(
+        PASSWORD_ARGON2_TIME_COST=1,
+        PASSWORD_ARGON2_MEMORY_COST=1024,
+        PASSWORD_ARGON2_PARALLELISM=1,
+    )
+    def test_costs_from_settings(self):
+        """Test the encoded hash carries the configured costs."""
+        hasher = TunedArgon2PasswordHasher()
+
+        encoded = hasher.encode('s3cret-pass', hasher.salt())
+
+        self.assertIn('$argon2id$v=19$m=1024,t=1,p=1$', encoded)
+        self.assertTrue(hasher.verify('s3cret-pass', encoded))
+        self.assertFalse(hasher.must_update(encoded))
+        with self.settings(PASSWORD_ARGON2_MEMORY_COST=2048):
+            self.assertTrue(hasher.must_update(encoded))
+
+
+class RehashOnLoginTests(TestCase):
+    """Test older hashes are upgraded by a successful token login."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com', password='unused',
+        )
+        self.user.password = make_password(
+            'testpass123', hasher='pbkdf2_sha256',
+        )
+        self.user.save()
+
+    @override_settings(PASSWORD_HASHERS=SCRYPT_FIRST)
+    def test_login_rehashes_with_preferred_hasher(self):
+        """Test a pbkdf2 hash is replaced with the first hasher's."""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com', 'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            identify_hasher(self.user.password).algorithm, 'scrypt',
+        )
+        self.assertTrue(self.user.check_password('testpass123'))
+
+    @override_settings(PASSWORD_HASHERS=SCRYPT_FIRST)
+    def test_failed_login_keeps_hash(self):
+        """Test a wrong password leaves the stored hash alone."""
+        old = self.user.password
+
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com', 'password': 'wrongpass',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, old)
@@ -0,0 +1,133 @@
+"""
+Tests for login throttling and the password hash slots
+"""
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient
+
+from user.throttles import HashSlots
+
+TOKEN_URL = reverse('user:token')
+
+
+class LoginThrottleTests(TestCase):
+    """Test token logins are rate limited."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123',
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(
+        LOGIN_THROTTLE_RATE_EMAIL='2/min', LOGIN_THROTTLE_RATE_IP='',
+    )
+    def test_throttled_per_email(self):
+        """Test logins for one email are limited whatever the case."""
+        for email in ('test@example.com', 'TEST@example.com'):
+            res = self.client.post(
+                TOKEN_URL, {'email': email, 'password': 'bad'},
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com', 'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        # another account from the same address is still allowed in
+        res = self.client.post(TOKEN_URL, {
+            'email': 'other@example.com', 'password': 'bad',
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(
+        LOGIN_THROTTLE_RATE_EMAIL='', LOGIN_THROTTLE_RATE_IP='2/min',
+    )
+    def test_throttled_per_ip(self):
+        """Test logins from one address are limited across emails."""
+        for n in range(2):
+            self.client.post(TOKEN_URL, {
+                'email': f'u{n}@example.com', 'password': 'bad',
+            })
+
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@example.com', 'password': 'testpass123',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_non_object_body(self):
+        """Test a list or scalar body is a 400, not a throttle crash."""
+        for body in ([{'email': 'test@example.com'}], 5, 'test@example.com'):
+            res = self.client.post(TOKEN_URL, body, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PASSWORD_HASH_QUEUE_TIMEOUT=0.01)
+    def test_busy_hash_slots_answer_429(self):
+        """Test a login waiting too long for a hash slot is turned away."""
+        from user.throttles import hash_slots
+
+        held = [
+            hash_slots._semaphore.acquire() for _ in range(hash_slots.size)
+        ]
+        try:
+            res = self.client.post(TOKEN_URL, {
+                'email': 'test@example.com', 'password': 'testpass123',
+            })
+        finally:
+            for _ in held:
+                hash_slots._semaphore.release()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '1')
+
+
+class HashSlotsTests(SimpleTestCase):
+    """Test the hash slot semaphore."""
+
+    def test_slots_bound_concurrency(self):
+        """Test no more than size holders run at once."""
+        slots = HashSlots(2)
+        running, peak = [0], [0]
+        lock = threading.Lock()
+        barrier = threading.Barrier(4)
+
+        def work():
+            barrier.wait()
+            with slots.slot(timeout=5):
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                threading.Event().wait(0.02)
+                with lock:
+                    running[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(peak[0], 2)
+
+    def test_timeout_raises_throttled(self):
+        """Test waiting past the timeout raises Throttled."""
+        slots = HashSlots(1)
+
+        with slots.slot(timeout=1):
+            with self.assertRaises(Throttled):
+                with slots.slot(timeout=0.01):
+                    pass
@@ -0,0 +1,82 @@
+"""
+keeping a burst of logins from taking every worker - per ip and per email
+rate limits, and a per process cap on password hashes running at once
+"""
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """token logins per client ip"""
+    # counts live in the default cache, which has to be shared between
+    # workers - the serving self-check refuses locmem with several
+    scope = 'login_ip'
+    setting = 'LOGIN_THROTTLE_RATE_IP'
+
+    def get_rate(self):
+        # from django settings so the env (and override_settings) set it
+        return getattr(settings, self.setting) or None
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+
+class LoginEmailRateThrottle(LoginRateThrottle):
+    """token logins per email, whichever ip they come from"""
+    scope = 'login_email'
+    setting = 'LOGIN_THROTTLE_RATE_EMAIL'
+
+    def get_cache_key(self, request, view):
+        # runs before the serializer, the body may be a list or a scalar
+        data = request.data
+        email = data.get('email') if isinstance(data, Mapping) else None
+        if not isinstance(email, str) or not email:
+            # the serializer rejects it without hashing anything
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': email.strip().lower(),
+        }
+
+
+class HashSlots:
+    """
+    Bounded semaphore around password hashing
+
+    the hashers release the gil, so without a cap every request thread in a
+    burst hashes at once and the cpu is shared by all of them - slow logins
+    and slow everything else. a handoff to a thread pool would not help,
+    the request has to wait for the hash either way
+    """
+    def __init__(self, size):
+        self.size = size
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def slot(self, timeout):
+        """hold a slot, Throttled when none frees up within timeout"""
+        if not self._semaphore.acquire(timeout=timeout):
+            raise Throttled(
+                wait=1,
+                detail='Too many logins in progress, try again shortly.',
+            )
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+hash_slots = HashSlots(settings.PASSWORD_HASH_CONCURRENCY)
+
+
+def hashing_slot():
+    """a hash slot with the configured queue timeout"""
+    return hash_slots.slot(settings.PASSWORD_HASH_QUEUE_TIMEOUT)
@@ -2,10 +2,12 @@
 views for user api
 """
 # module - provide base class craeteapiview
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from user.authentication import CachedTokenAuthentication
+from user.throttles import LoginRateThrottle, LoginEmailRateThrottle
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -22,13 +24,17 @@ class CreateTokenView(ObtainAuthToken):
     """create auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken only takes form, multipart and stdlib json
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    # checked before the serializer, a throttled login never hashes
+    throttle_classes = [LoginRateThrottle, LoginEmailRateThrottle]
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """manage user account"""
     serializer_class = UserSerializer
     # how to know user is authenticated - token
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     # user known - but is allowed to do in the system
     permission_classes = [permissions.IsAuthenticated]
 